@@ -1,4 +1,2 @@
 # Copyright (C) 2003-2023 Namcap contributors, see AUTHORS for details.
 # SPDX-License-Identifier: GPL-2.0-or-later
-
-from . import util, rules  # noqa: F401
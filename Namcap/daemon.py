@@ -0,0 +1,233 @@
+# Copyright (C) 2003-2023 Namcap contributors, see AUTHORS for details.
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""
+Long-running namcap server on a Unix socket, and its client.
+
+Each namcap run pays for starting Python, importing the rules and their
+libraries, opening the pacman databases and indexing the installed files.
+namcap --serve does it once, then runs the command lines it receives on a
+Unix socket, keeping all of that in memory from one run to the next.
+
+The protocol is made of JSON objects, one per line. The client sends
+{"argv": [...], "cwd": ..., "tty": ...}, the server answers with any number
+of {"stdout": text} and {"stderr": text} as the output is printed, then
+{"exit": status}. Requests are handled one at a time.
+
+The socket is only accessible to the user running the server, and both ends
+check that the other one runs as that same user.
+
+The client only uses the standard library, so that it starts quickly.
+"""
+
+import contextlib
+import json
+import os
+import signal
+import socket
+import socketserver
+import stat
+import struct
+import sys
+import traceback
+
+
+def default_socket():
+    """
+    Returns the path of the socket, from $NAMCAP_SOCKET or in the runtime
+    directory, None if neither is set
+
+    There is no fallback to a directory shared with other users, where
+    anyone could take the path first.
+    """
+    if os.environ.get("NAMCAP_SOCKET"):
+        return os.environ["NAMCAP_SOCKET"]
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, "namcap.sock")
+    return None
+
+
+def peer_uid(sock):
+    "Returns the user id of the process at the other end of a Unix socket"
+    ucred = struct.Struct("3i")
+    pid, uid, gid = ucred.unpack(sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, ucred.size))
+    return uid
+
+
+def send_message(wfile, message):
+    wfile.write(json.dumps(message).encode() + b"\n")
+    wfile.flush()
+
+
+class ClientStream(object):
+    "Text stream sending what is written to it to the client, as messages of a kind"
+
+    def __init__(self, wfile, kind, tty=False):
+        self.wfile = wfile
+        self.kind = kind
+        self.tty = tty
+
+    def write(self, text):
+        if text:
+            send_message(self.wfile, {self.kind: text})
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        # colors are shown when the output of the client is a terminal
+        return self.tty
+
+
+def exit_status(code):
+    "Returns the exit status of a process ending with SystemExit(code)"
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    print(code, file=sys.stderr)
+    return 1
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            # only checking whether the server listens, see is_listening()
+            return
+        try:
+            request = json.loads(line)
+            argv = [str(arg) for arg in request["argv"]]
+            cwd = request["cwd"]
+        except (ValueError, KeyError, TypeError):
+            send_message(self.wfile, {"stderr": "Error: invalid request\n"})
+            send_message(self.wfile, {"exit": 2})
+            return
+        stdout = ClientStream(self.wfile, "stdout", bool(request.get("tty")))
+        stderr = ClientStream(self.wfile, "stderr")
+        olddir = os.getcwd()
+        try:
+            with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+                try:
+                    os.chdir(cwd)
+                    self.server.refresh()
+                    self.server.run(argv)
+                    status = 0
+                except SystemExit as e:
+                    status = exit_status(e.code)
+                except Exception:
+                    traceback.print_exc()
+                    status = 1
+            send_message(self.wfile, {"exit": status})
+        except OSError:
+            # the client went away
+            pass
+        finally:
+            os.chdir(olddir)
+
+
+class Server(socketserver.UnixStreamServer):
+    """
+    Runs the command lines sent on a Unix socket
+
+    run(argv) runs a command line, refresh() is called before each of them.
+    """
+
+    def __init__(self, path, run, refresh=None):
+        self.run = run
+        self.refresh = refresh if refresh is not None else lambda: None
+        try:
+            mode = os.lstat(path).st_mode
+        except FileNotFoundError:
+            pass
+        else:
+            if not stat.S_ISSOCK(mode):
+                raise OSError("%s exists and is not a socket" % path)
+            if is_listening(path):
+                raise OSError("%s is already used by another server" % path)
+            # left behind by a server which did not exit cleanly
+            os.unlink(path)
+        super().__init__(path, RequestHandler)
+
+    def server_bind(self):
+        super().server_bind()
+        # before listening, so that nobody else can connect in between
+        os.chmod(self.server_address, 0o600)
+
+    def verify_request(self, request, client_address):
+        # commands are run with the rights of the server
+        return peer_uid(request) == os.getuid()
+
+    def server_close(self):
+        super().server_close()
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.server_address)
+
+
+def is_listening(path):
+    "Whether a server accepts connections on a socket"
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except ConnectionRefusedError:
+            return False
+    return True
+
+
+def serve(server):
+    "Runs the command lines sent to a Server until interrupted or terminated"
+    # remove the socket on SIGTERM too
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    with server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def submit(path, argv, stdout=None, stderr=None):
+    """
+    Runs a command line on the server listening at path, printing its output
+    as it comes
+
+    Returns the exit status of the command.
+    """
+    stdout = stdout if stdout is not None else sys.stdout
+    stderr = stderr if stderr is not None else sys.stderr
+    request = {"argv": list(argv), "cwd": os.getcwd(), "tty": stdout.isatty()}
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        if peer_uid(sock) != os.getuid():
+            raise OSError("the server is run by another user")
+        with sock.makefile("rwb") as f:
+            send_message(f, request)
+            for line in f:
+                message = json.loads(line)
+                if "exit" in message:
+                    return message["exit"]
+                for kind, stream in (("stdout", stdout), ("stderr", stderr)):
+                    if kind in message:
+                        stream.write(message[kind])
+                        stream.flush()
+    print("Error: the namcap server closed the connection", file=stderr)
+    return 1
+
+
+def main():
+    "Client of namcap --serve, taking the same arguments as namcap"
+    path = default_socket()
+    if path is None:
+        print("Error: set $XDG_RUNTIME_DIR or $NAMCAP_SOCKET to reach the namcap server", file=sys.stderr)
+        sys.exit(2)
+    try:
+        status = submit(path, sys.argv[1:])
+    except OSError as e:
+        print("Error: cannot reach the namcap server at %s: %s" % (path, e.strerror or e), file=sys.stderr)
+        status = 2
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,21 +5,58 @@
 
 import Namcap.tags
 from Namcap import package
+from Namcap.util import system_cache
 
+# The local database does not change while namcap runs, so what was read from
+# it is kept for the whole process, i.e. for all the packages of a batch.
+# package name => (depends, provides), None if not installed
+_installed = system_cache()
+# package name => full coverage tree of the package, itself included
+_closures = system_cache()
+
+
+def installed_relations(pkgname):
+    "Returns the depends and provides of an installed package, None if not found"
+    if pkgname not in _installed:
+        pac = package.load_from_db(pkgname)
+        if pac is None:
+            _installed[pkgname] = None
+        else:
+            _installed[pkgname] = (pac["depends"], pac["provides"])
+    return _installed[pkgname]
+
+
+def closure(depend):
+    """
+    Returns full coverage tree of one package, itself included, with loops broken
+
+    Trees are computed once per package and reused for the ones depending on it.
+    """
+    if depend in _closures:
+        return _closures[depend]
 
-def single_covered(depend):
-    "Returns full coverage tree of one package, with loops broken"
     covered = set()
-    todo = set([depend])
+    todo = [depend]
     while todo:
         i = todo.pop()
+        if i in covered:
+            continue
+        if i in _closures:
+            covered |= _closures[i]
+            continue
         covered.add(i)
-        pac = package.load_from_db(i)
-        if pac is None:
+        relations = installed_relations(i)
+        if relations is None:
             continue
-        todo |= set(pac["depends"]) - covered
+        todo.extend(d for d in relations[0] if d not in covered)
 
-    return covered - set([depend])
+    _closures[depend] = frozenset(covered)
+    return _closures[depend]
+
+
+def single_covered(depend):
+    "Returns full coverage tree of one package, with loops broken"
+    return set(closure(depend)) - set([depend])
 
 
 def getcovered(dependlist):
@@ -38,12 +75,10 @@ def getprovides(depends):
     provides = {}
     for i in depends:
         provides[i] = set()
-        pac = package.load_from_db(i)
-        if pac is None:
-            continue
-        if not pac["provides"]:
+        relations = installed_relations(i)
+        if relations is None:
             continue
-        provides[i].update(pac["provides"])
+        provides[i].update(relations[1])
     return provides
 
 
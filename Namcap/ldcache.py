@@ -0,0 +1,175 @@
+# Copyright (C) 2003-2023 Namcap contributors, see AUTHORS for details.
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""
+Reader for the cache of the dynamic linker, as printed by ldconfig -p.
+
+Both the old libc5 format ("ld.so-1.7.0") and the glibc one
+("glibc-ld.so.cache1.1"), possibly appended to an old format header, are
+understood. Libraries are grouped by their cache flags, which tell the ABI
+they were built for (see FLAG_* below and elf_cache_flags()).
+"""
+
+import struct
+import threading
+
+from Namcap.util import system_cache
+
+LDCACHE = "/etc/ld.so.cache"
+
+OLD_MAGIC = b"ld.so-1.7.0"
+NEW_MAGIC = b"glibc-ld.so.cache1.1"
+
+# Flags of cache entries, from glibc's sysdeps/generic/ldconfig.h
+FLAG_ELF_LIBC6 = 0x0003
+FLAG_SPARC_LIB64 = 0x0100
+FLAG_IA64_LIB64 = 0x0200
+FLAG_X8664_LIB64 = 0x0300
+FLAG_S390_LIB64 = 0x0400
+FLAG_POWERPC_LIB64 = 0x0500
+FLAG_X8664_LIBX32 = 0x0800
+FLAG_ARM_LIBHF = 0x0900
+FLAG_AARCH64_LIB64 = 0x0A00
+FLAG_ARM_LIBSF = 0x0B00
+FLAG_RISCV_FLOAT_ABI_SOFT = 0x0F00
+FLAG_RISCV_FLOAT_ABI_DOUBLE = 0x1000
+FLAG_LARCH_FLOAT_ABI_SOFT = 0x1100
+FLAG_LARCH_FLOAT_ABI_DOUBLE = 0x1200
+
+# ELF machines
+EM_SPARCV9 = 43
+EM_PPC64 = 21
+EM_S390 = 22
+EM_ARM = 40
+EM_IA_64 = 50
+EM_X86_64 = 62
+EM_AARCH64 = 183
+EM_RISCV = 243
+EM_LOONGARCH = 258
+
+# struct cache_file and struct file_entry
+OLD_HEADER = struct.Struct("=12sI")
+OLD_ENTRY = struct.Struct("=iII")
+# struct cache_file_new (without its magic and version) and struct file_entry_new
+NEW_HEADER = "IIB3xI12x"
+NEW_ENTRY = "iIIIQ"
+# alignment of struct cache_file_new in files also holding the old format
+NEW_ALIGN = 8
+
+# value of cache_file_new.flags for big-endian caches
+ENDIAN_BIG = 3
+
+# filename => parsed cache
+_caches = system_cache()
+_cache_lock = threading.Lock()
+
+
+def _string(data, offset):
+    "Reads the NUL-terminated string starting at offset"
+    end = data.index(b"\0", offset)
+    return data[offset:end].decode("utf-8", "surrogateescape")
+
+
+def _parse_new(data, start):
+    "Yields (flags, name, path, hwcap) from the glibc format cache starting at start"
+    endian = ">" if data[start + len(NEW_MAGIC) + 8] == ENDIAN_BIG else "<"
+    header = struct.Struct(endian + NEW_HEADER)
+    entry = struct.Struct(endian + NEW_ENTRY)
+    nlibs = header.unpack_from(data, start + len(NEW_MAGIC))[0]
+    offset = start + len(NEW_MAGIC) + header.size
+    for i in range(nlibs):
+        flags, key, value, osversion, hwcap = entry.unpack_from(data, offset + i * entry.size)
+        # string offsets are relative to the beginning of the new format header
+        yield flags, _string(data, start + key), _string(data, start + value), hwcap
+
+
+def _parse_old(data):
+    "Yields (flags, name, path, hwcap) from an old format cache"
+    nlibs = OLD_HEADER.unpack_from(data)[1]
+    strings = OLD_HEADER.size + nlibs * OLD_ENTRY.size
+    for i in range(nlibs):
+        flags, key, value = OLD_ENTRY.unpack_from(data, OLD_HEADER.size + i * OLD_ENTRY.size)
+        # string offsets are relative to the end of the entries
+        yield flags, _string(data, strings + key), _string(data, strings + value), 0
+
+
+def parse_ldcache(data):
+    """
+    Parses the contents of a dynamic linker cache
+
+    Returns a dictionary { flags => { library name => path } }, preferring the
+    baseline libraries over the ones optimised for some hardware capabilities.
+    """
+    if data.startswith(NEW_MAGIC):
+        entries = _parse_new(data, 0)
+    elif data.startswith(OLD_MAGIC):
+        nlibs = OLD_HEADER.unpack_from(data)[1]
+        start = OLD_HEADER.size + nlibs * OLD_ENTRY.size
+        start += -start % NEW_ALIGN
+        if data.startswith(NEW_MAGIC, start):
+            entries = _parse_new(data, start)
+        else:
+            entries = _parse_old(data)
+    else:
+        raise ValueError("not a dynamic linker cache")
+
+    libs = {}
+    hwcaps = {}
+    for flags, name, path, hwcap in entries:
+        bucket = libs.setdefault(flags, {})
+        # entries with a hwcap are only used on some CPUs
+        if name not in bucket or (hwcaps[flags, name] and not hwcap):
+            bucket[name] = path
+            hwcaps[flags, name] = hwcap
+    return libs
+
+
+def load_ldcache(filename=LDCACHE):
+    "Reads the dynamic linker cache, empty if missing or invalid"
+    try:
+        with open(filename, "rb") as f:
+            return parse_ldcache(f.read())
+    except (OSError, ValueError, struct.error):
+        return {}
+
+
+def get_ldcache():
+    "Returns the dynamic linker cache of the system, loaded on first use"
+    with _cache_lock:
+        if LDCACHE not in _caches:
+            _caches[LDCACHE] = load_ldcache()
+        return _caches[LDCACHE]
+
+
+def elf_cache_flags(elfclass, machine, flags):
+    """
+    Returns the cache flags ldconfig gives to a library
+
+    elfclass is 32 or 64, machine and flags are the e_machine and e_flags
+    fields of the ELF header.
+    """
+    abi = 0
+    if machine == EM_X86_64:
+        abi = FLAG_X8664_LIB64 if elfclass == 64 else FLAG_X8664_LIBX32
+    elif machine == EM_AARCH64:
+        abi = FLAG_AARCH64_LIB64
+    elif machine == EM_ARM:
+        # EF_ARM_ABI_FLOAT_HARD and EF_ARM_ABI_FLOAT_SOFT
+        if flags & 0x400:
+            abi = FLAG_ARM_LIBHF
+        elif flags & 0x200:
+            abi = FLAG_ARM_LIBSF
+    elif machine == EM_RISCV:
+        # EF_RISCV_FLOAT_ABI
+        abi = {0: FLAG_RISCV_FLOAT_ABI_SOFT, 4: FLAG_RISCV_FLOAT_ABI_DOUBLE}.get(flags & 0x6, 0)
+    elif machine == EM_LOONGARCH:
+        # EF_LARCH_ABI_MODIFIER_MASK
+        abi = {1: FLAG_LARCH_FLOAT_ABI_SOFT, 3: FLAG_LARCH_FLOAT_ABI_DOUBLE}.get(flags & 0x7, 0)
+    elif elfclass == 64:
+        abi = {
+            EM_SPARCV9: FLAG_SPARC_LIB64,
+            EM_IA_64: FLAG_IA64_LIB64,
+            EM_S390: FLAG_S390_LIB64,
+            EM_PPC64: FLAG_POWERPC_LIB64,
+        }.get(machine, 0)
+    return abi | FLAG_ELF_LIBC6
@@ -0,0 +1,167 @@
+# Copyright (C) 2003-2023 Namcap contributors, see AUTHORS for details.
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""
+Incremental cache of the analysis of package members.
+
+When a package is rebuilt, most of its files are byte-identical to the ones
+of the previous build. In incremental mode (see enable()), what the rules
+read from a member (its ELF summary, the modules a Python file imports, the
+interpreter of a script...) is stored under the SHA-256 of its contents, taken
+from the .MTREE of the package when it has one, and reused for identical
+members of later packages.
+
+The cache is dropped whenever the sources of namcap change. Values are only
+stored from the main process: worker processes forked for the rules (see
+Namcap.scheduler) compute them again.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+
+from Namcap.nameindex import name_index
+from Namcap.package import load_mtree
+from Namcap.resultcache import source_digest
+from Namcap.util import ELFSummary, cache_dir, script_type
+
+_cache = None
+
+
+class MemberCache(object):
+    "Values computed from member contents, stored by kind and digest in an SQLite database"
+
+    def __init__(self, filename):
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        # (kind, digest) => JSON value, waiting for flush()
+        self._pending = {}
+        self._conn = sqlite3.connect(filename, timeout=30, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS members (kind TEXT, digest TEXT, value TEXT, PRIMARY KEY (kind, digest))"
+            )
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'sources'").fetchone()
+            if row is None or row[0] != source_digest():
+                self._conn.execute("DELETE FROM members")
+                self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('sources', ?)", (source_digest(),))
+
+    def get(self, kind, digest, compute, encode=None, decode=None):
+        """
+        Returns the value of kind for the member with digest, calling compute()
+        if it is not cached yet
+
+        encode and decode convert the value to and from what json can store.
+        """
+        if os.getpid() != self._pid:
+            return compute()
+        with self._lock:
+            stored = self._pending.get((kind, digest))
+            if stored is None:
+                row = self._conn.execute(
+                    "SELECT value FROM members WHERE kind = ? AND digest = ?", (kind, digest)
+                ).fetchone()
+                stored = row[0] if row is not None else None
+        if stored is not None:
+            value = json.loads(stored)
+            return decode(value) if decode is not None else value
+        value = compute()
+        stored = json.dumps(encode(value) if encode is not None else value)
+        with self._lock:
+            self._pending[kind, digest] = stored
+        return value
+
+    def flush(self):
+        "Stores the values computed since the last flush"
+        if os.getpid() != self._pid:
+            return
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO members VALUES (?, ?, ?)",
+                    ((kind, digest, value) for (kind, digest), value in pending.items()),
+                )
+
+
+def enable(filename=None):
+    """
+    Turns the incremental mode on, storing the cache in filename
+
+    The mode stays off if the cache cannot be opened, it is only an
+    optimisation.
+    """
+    global _cache
+    if filename is None:
+        filename = os.path.join(cache_dir(), "members.sqlite")
+    try:
+        _cache = MemberCache(filename)
+    except (OSError, sqlite3.Error):
+        _cache = None
+
+
+def disable():
+    "Turns the incremental mode off"
+    global _cache
+    _cache = None
+
+
+def get_cache():
+    "Returns the MemberCache of the incremental mode, None if it is off"
+    return _cache
+
+
+def flush():
+    "Stores what was computed for the members of the last package, in incremental mode"
+    if _cache is not None:
+        try:
+            _cache.flush()
+        except sqlite3.Error:
+            # the cache is only an optimisation
+            pass
+
+
+def mtree_digests(tar):
+    "Returns { member name => SHA-256 } from the .MTREE of a package, empty if it has none"
+    if ".MTREE" not in name_index(tar):
+        return {}
+    digests = {}
+    try:
+        for head, attrs in load_mtree(tar):
+            if "sha256digest" in attrs and head.startswith("./"):
+                digests[head[2:]] = attrs["sha256digest"]
+    except (OSError, EOFError, UnicodeDecodeError, ValueError):
+        return {}
+    return digests
+
+
+def cached(kind, member, compute, encode=None, decode=None):
+    "Returns compute() for a Namcap.scan.Member, from the cache in incremental mode"
+    if _cache is None:
+        return compute()
+    try:
+        return _cache.get(kind, member.digest, compute, encode, decode)
+    except sqlite3.Error:
+        return compute()
+
+
+def member_script_type(member):
+    "Returns the interpreter of a script member (see Namcap.util.script_type), from the cache in incremental mode"
+    return cached("shebang", member, lambda: script_type(member.open()))
+
+
+def encode_elf(elf):
+    "Converts a Namcap.util.ELFSummary to a list, for the cache"
+    return [getattr(elf, field) for field in ELFSummary.__slots__]
+
+
+def decode_elf(values):
+    "Converts a list back to a Namcap.util.ELFSummary"
+    elf = ELFSummary.__new__(ELFSummary)
+    for field, value in zip(ELFSummary.__slots__, values):
+        setattr(elf, field, value)
+    elf.segments = [tuple(segment) for segment in elf.segments]
+    return elf
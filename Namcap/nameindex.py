@@ -0,0 +1,118 @@
+# Copyright (C) 2003-2023 Namcap contributors, see AUTHORS for details.
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""
+Index of the member names of a package.
+
+Many rules only look for paths in the package. Instead of each of them
+scanning tar.getnames(), the names are indexed once per tarball (see
+name_index()): as a set, a sorted list for prefix lookups, a directory tree
+and buckets by extension and by basename. Lookups give names in archive
+order, as a scan of tar.getnames() would.
+"""
+
+import bisect
+import re
+import threading
+import weakref
+
+# tarball => NameIndex
+_indexes = weakref.WeakKeyDictionary()
+_indexes_lock = threading.Lock()
+
+
+def _extension(basename):
+    "Returns what follows the last dot of a basename, None if it has none"
+    head, dot, extension = basename.rpartition(".")
+    return extension if dot else None
+
+
+class NameIndex(object):
+    "The member names of a package, indexed for path lookups"
+
+    def __init__(self, names):
+        self.names = list(names)
+        # name => position of its first occurrence
+        self._positions = {}
+        self._extensions = {}
+        self._basenames = {}
+        # directory => [names of its direct children]
+        self._children = {}
+        for i, name in enumerate(self.names):
+            self._positions.setdefault(name, i)
+            directory, slash, basename = name.rpartition("/")
+            self._basenames.setdefault(basename, []).append(name)
+            self._extensions.setdefault(_extension(basename), []).append(name)
+            self._children.setdefault(directory, []).append(name)
+        self.sorted = sorted(self._positions)
+
+    def __contains__(self, name):
+        return name in self._positions
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def ordered(self, names):
+        "Returns those of the given names found in the package, in archive order"
+        return sorted((n for n in set(names) if n in self._positions), key=self._positions.get)
+
+    def with_extension(self, extension):
+        "Returns the names ending with a dot and extension"
+        return list(self._extensions.get(extension, ()))
+
+    def with_basename(self, basename):
+        "Returns the names whose last component is basename"
+        return list(self._basenames.get(basename, ()))
+
+    def with_prefix(self, prefix):
+        "Returns the names starting with prefix"
+        start = bisect.bisect_left(self.sorted, prefix)
+        end = start
+        while end < len(self.sorted) and self.sorted[end].startswith(prefix):
+            end += 1
+        return sorted(self.sorted[start:end], key=self._positions.get)
+
+    def listdir(self, directory):
+        "Returns the names of the members directly in directory"
+        return list(self._children.get(directory.rstrip("/"), ()))
+
+    def search(self, patterns):
+        """
+        Returns the indices of the regular expressions found in at least one
+        name (as with re.search)
+
+        All the expressions are combined into a single one, so the names are
+        only scanned once.
+        """
+        found = set()
+        pending = list(enumerate(patterns))
+        combined = _combine(pending)
+        for name in self.names:
+            match = combined.search(name) if pending else None
+            # a name may match several expressions, look for the others
+            while match is not None:
+                index = int(match.lastgroup[1:])
+                found.add(index)
+                pending = [(i, p) for i, p in pending if i != index]
+                combined = _combine(pending)
+                match = combined.search(name) if pending else None
+            if not pending:
+                break
+        return found
+
+
+def _combine(patterns):
+    "Compiles [(index, pattern)] into a single alternation naming its groups after the indices"
+    return re.compile("|".join("(?P<p%d>%s)" % (i, p) for i, p in patterns))
+
+
+def name_index(tar):
+    "Returns the NameIndex of a tarball (or Namcap.scan.MemberList), built on first use"
+    with _indexes_lock:
+        index = _indexes.get(tar)
+        if index is None:
+            index = _indexes[tar] = NameIndex(tar.getnames())
+    return index
@@ -0,0 +1,190 @@
+# Copyright (C) 2003-2023 Namcap contributors, see AUTHORS for details.
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""
+Index of the files owned by installed packages.
+
+Building the index means reading the files list of every installed package,
+so it is kept in an SQLite database under the namcap cache directory, along
+with the state of the local database it was built from.
+"""
+
+import bisect
+import os
+import sqlite3
+import tempfile
+import threading
+import urllib.parse
+
+from Namcap import package
+from Namcap.util import cache_dir, system_cache
+
+CACHE_VERSION = "1"
+
+# local database path => ownership index
+_indexes = system_cache()
+_index_lock = threading.Lock()
+
+
+class OwnershipIndex(object):
+    """
+    Reverse index of the local database: path => names of the packages owning it
+
+    Paths are relative to the root, as in the files lists of pacman. Only files
+    are indexed, directories (which are shared by many packages) are left out.
+    """
+
+    def __init__(self, entries):
+        "Builds the index from an iterable of (path, package name)"
+        self._owners = {}
+        # paths owned by more than one package, which pacman only allows with --overwrite
+        self._shared = {}
+        for path, pkgname in entries:
+            if path.endswith("/"):
+                continue
+            owner = self._owners.setdefault(path, pkgname)
+            if owner != pkgname:
+                self._shared.setdefault(path, [owner]).append(pkgname)
+        # sorted paths, for prefix lookups
+        self._paths = sorted(self._owners)
+
+    @classmethod
+    def from_packages(cls, pkgs):
+        "Builds the index from pyalpm packages"
+        return cls((fname, pkg.name) for pkg in pkgs for fname, fsize, fmode in pkg.files)
+
+    def items(self):
+        "Yields all the (path, package name) pairs of the index"
+        for path, pkgname in self._owners.items():
+            if path in self._shared:
+                for owner in self._shared[path]:
+                    yield path, owner
+            else:
+                yield path, pkgname
+
+    def owners(self, path):
+        "Returns the names of the packages owning path"
+        if path in self._shared:
+            return list(self._shared[path])
+        if path in self._owners:
+            return [self._owners[path]]
+        return []
+
+    def with_prefix(self, prefix):
+        "Yields the indexed paths starting with prefix, in order"
+        i = bisect.bisect_left(self._paths, prefix)
+        while i < len(self._paths) and self._paths[i].startswith(prefix):
+            yield self._paths[i]
+            i += 1
+
+
+def _prefix_end(prefix):
+    "Returns the smallest string greater than all the strings starting with prefix"
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class CachedOwnershipIndex(object):
+    "Ownership index stored in an SQLite database"
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def owners(self, path):
+        "Returns the names of the packages owning path"
+        cursor = self._conn.execute(
+            "SELECT packages.name FROM files JOIN packages ON files.pkg = packages.id WHERE files.path = ?", (path,)
+        )
+        return [name for (name,) in cursor]
+
+    def with_prefix(self, prefix):
+        "Yields the indexed paths starting with prefix, in order"
+        if prefix:
+            cursor = self._conn.execute(
+                "SELECT DISTINCT path FROM files WHERE path >= ? AND path < ? ORDER BY path",
+                (prefix, _prefix_end(prefix)),
+            )
+        else:
+            cursor = self._conn.execute("SELECT DISTINCT path FROM files ORDER BY path")
+        for (path,) in cursor:
+            yield path
+
+
+def local_db_state():
+    """
+    Returns a string identifying the state of the local database
+
+    pacman adds and removes one directory per package in the local database
+    when installing, upgrading or removing packages, which changes its mtime.
+    """
+    path = os.path.realpath(package.get_localdb_path())
+    st = os.stat(path)
+    return "%s:%d:%d" % (path, st.st_ino, st.st_mtime_ns)
+
+
+def write_cache(filename, index, state):
+    "Stores an ownership index in a new SQLite database, replacing filename atomically"
+    dirname = os.path.dirname(filename)
+    os.makedirs(dirname, exist_ok=True)
+    fd, tmpname = tempfile.mkstemp(dir=dirname, prefix=".files.", suffix=".sqlite")
+    os.close(fd)
+    try:
+        conn = sqlite3.connect(tmpname)
+        with conn:
+            conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.execute("CREATE TABLE packages (id INTEGER PRIMARY KEY, name TEXT UNIQUE)")
+            conn.execute("CREATE TABLE files (path TEXT, pkg INTEGER, PRIMARY KEY (path, pkg)) WITHOUT ROWID")
+            pkgids = {}
+            for path, pkgname in index.items():
+                if pkgname not in pkgids:
+                    pkgids[pkgname] = len(pkgids) + 1
+            conn.executemany("INSERT INTO packages VALUES (?, ?)", ((i, name) for name, i in pkgids.items()))
+            conn.executemany("INSERT INTO files VALUES (?, ?)", ((path, pkgids[name]) for path, name in index.items()))
+            conn.executemany("INSERT INTO meta VALUES (?, ?)", [("version", CACHE_VERSION), ("state", state)])
+        conn.close()
+        os.replace(tmpname, filename)
+    except BaseException:
+        os.unlink(tmpname)
+        raise
+
+
+def read_cache(filename, state):
+    "Opens the ownership index stored in filename, None if missing or not matching state"
+    if not os.path.exists(filename):
+        return None
+    conn = sqlite3.connect("file:%s?mode=ro" % urllib.parse.quote(filename), uri=True, check_same_thread=False)
+    meta = dict(conn.execute("SELECT key, value FROM meta"))
+    if meta.get("version") != CACHE_VERSION or meta.get("state") != state:
+        conn.close()
+        return None
+    return CachedOwnershipIndex(conn)
+
+
+def load_index():
+    "Returns the ownership index from the cache, rebuilding it if the local database changed"
+    filename = os.path.join(cache_dir(), "files.sqlite")
+    try:
+        state = local_db_state()
+        index = read_cache(filename, state)
+    except (OSError, sqlite3.Error):
+        state = None
+        index = None
+    if index is not None:
+        return index
+
+    index = OwnershipIndex.from_packages(package.get_installed_packages())
+    if state is not None:
+        try:
+            write_cache(filename, index, state)
+        except (OSError, sqlite3.Error):
+            # the cache is only an optimisation
+            pass
+    return index
+
+
+def get_index():
+    "Returns the ownership index of the installed packages, loaded on first use"
+    path = package.get_localdb_path()
+    with _index_lock:
+        if path not in _indexes:
+            _indexes[path] = load_index()
+        return _indexes[path]
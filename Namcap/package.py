@@ -8,11 +8,17 @@ import re
 import collections
 import gzip
 import shutil
+import threading
 
 import pyalpm
 
 import pycman.config
 
+import Namcap.parsepool
+import Namcap.pkgbuildcache
+import Namcap.spool
+from Namcap.util import system_cache
+
 _pyalpm_version_tuple = tuple(int(n) for n in pyalpm.version().split("."))
 if _pyalpm_version_tuple < (0, 5):
     raise DeprecationWarning("pyalpm versions <0.5 are no longer supported")
@@ -25,13 +31,56 @@ def _get_root():
     return _root
 
 
-_pacman_conf = os.path.join(_get_root(),
-                            "etc/pacman.conf")
-pyalpm_handle = pycman.config.init_with_config(_pacman_conf)
+# opened on first use by get_handle(), as PKGBUILD checks do not need it
+pyalpm_handle = None
+_handle_lock = threading.Lock()
+
+# database name => {provided name => [packages providing it]}
+_provides_index = system_cache()
 
 DEPENDS_RE = re.compile(r"([^<>=:]+)([<>]?=.*)?(: .*)?")
 SODEPENDS_RE = re.compile(r"([^:]+)(: .*)?")
 
+# .PKGINFO keys of the variables load_from_alpm() reads from pyalpm
+_pkginfo_strings = {"pkgname": "name", "pkgver": "version", "url": "url", "pkgdesc": "desc", "packager": "packager"}
+_pkginfo_lists = {
+    "conflict": "conflicts",
+    "depend": "depends",
+    "group": "groups",
+    "license": "licenses",
+    "optdepend": "optdepends",
+    "provides": "provides",
+    "replaces": "replaces",
+    "backup": "backup",
+}
+
+
+# keys whose values are names shared by many packages, interned when parsed,
+# in their .PKGINFO, database and PKGBUILD spellings
+_interned_values = frozenset(
+    [
+        "arch",
+        "backup",
+        "checkdepend",
+        "checkdepends",
+        "conflict",
+        "conflicts",
+        "depend",
+        "depends",
+        "group",
+        "groups",
+        "license",
+        "licenses",
+        "makedepend",
+        "makedepends",
+        "optdepend",
+        "optdepends",
+        "provides",
+        "replaces",
+        "setvars",
+    ]
+)
+
 
 def strip_depend_info(value):
     """
@@ -44,10 +93,59 @@ def strip_depend_info(value):
         m = DEPENDS_RE.match(value)
     if m is None:
         raise ValueError("Invalid dependency specification")
-    return m.group(1)
+    return sys.intern(m.group(1))
+
+
+def parse_pkginfo(text):
+    "Returns { key => [values] } from the contents of a .PKGINFO file, skipping empty values"
+    values = {}
+    for line in text.splitlines():
+        key, _, value = line.partition(" = ")
+        if value:
+            key = sys.intern(key)
+            values.setdefault(key, []).append(sys.intern(value) if key in _interned_values else value)
+    return values
+
+
+def parse_db(text):
+    """
+    Returns { key => [values] } from a database entry or the output of
+    parsepkgbuild, skipping empty lines
+
+    The keys are the lowercase %KEY% headers.
+    """
+    values = {}
+    key = None
+    # appends to the values of key, once it has one
+    append = None
+    for line in text.split("\n"):
+        if line[:1] == "%":
+            key = sys.intern(line.strip("%").lower())
+            interned = key in _interned_values
+            append = None
+        elif line and key and not line.isspace():
+            if append is None:
+                append = values.setdefault(key, []).append
+            append(sys.intern(line) if interned else line)
+    return values
+
+
+class _Stripped(object):
+    "Stands for the stripped names of a dependency list until they are read, see clean_depends()"
+
+    def __reduce__(self):
+        # the same object once unpickled
+        return "_STRIPPED"
+
+
+_STRIPPED = _Stripped()
 
 
 class PacmanPackage(collections.abc.MutableMapping):
+    __slots__ = ("_data", "is_split", "subpackages", "pkgbuild", "_detected_deps")
+
+    # the dependency lists stripped of their version info by clean_depends()
+    stripped = ("depends", "makedepends", "optdepends", "provides")
     strings = [
         "base",
         "name",
@@ -75,10 +173,7 @@ class PacmanPackage(collections.abc.MutableMapping):
 
     @classmethod
     def canonical_varname(cls, varname):
-        try:
-            return cls.equiv_vars[varname]
-        except KeyError:
-            return varname
+        return cls.equiv_vars.get(varname, varname)
 
     def __init__(self, data=None, pkginfo=None, db=None):
         """
@@ -90,8 +185,6 @@ class PacmanPackage(collections.abc.MutableMapping):
 
         # Usual attributes
         self.is_split = False
-        # a dictionary { package => [reasons why it is needed] }
-        self.detected_deps = collections.defaultdict(list)
         self._data = {}
 
         # Init from a dictionary
@@ -101,35 +194,33 @@ class PacmanPackage(collections.abc.MutableMapping):
 
         # Parsing of .PKGINFO files from tarballs
         if isinstance(pkginfo, str):
-            for i in pkginfo.splitlines():
-                m = re.match(r"(.*) = (.*)", i)
-                if m is not None:
-                    lhs = m.group(1)
-                    rhs = m.group(2)
-                    if rhs != "":
-                        self.setdefault(lhs, []).append(rhs)
+            self._update(parse_pkginfo(pkginfo))
         elif pkginfo is not None:
             raise TypeError("argument 'pkginfo' must be a string")
 
         # Parsing of database entries or parsepkgbuild output
         if isinstance(db, str):
-            attrname = None
             if "\0" in db:
                 self.is_split = True
                 parts = db.split("\0")
                 self.subpackages = [PacmanPackage(db=s) for s in parts[1:]]
                 db = parts[0]
-            for line in db.split("\n"):
-                if line.startswith("%"):
-                    attrname = line.strip("%").lower()
-                elif line.strip() != "" and attrname:
-                    self.setdefault(attrname, []).append(line)
+            self._update(parse_db(db))
         elif db is not None:
             raise TypeError("argument 'pkginfo' must be a string")
 
         # Cleanup
         self.process()
 
+    def _update(self, values):
+        "Adds the { key => [values] } read by a parser"
+        equiv_vars = self.equiv_vars
+        for key, lines in values.items():
+            key = equiv_vars.get(key, key)
+            current = self._data.setdefault(key, lines)
+            if current is not lines:
+                current.extend(lines)
+
     def __iter__(self):
         return iter(self._data)
 
@@ -137,11 +228,15 @@ class PacmanPackage(collections.abc.MutableMapping):
         return len(self._data)
 
     def __getitem__(self, key):
-        return self._data[self.canonical_varname(key)]
+        key = self.equiv_vars.get(key, key)
+        value = self._data[key]
+        if value is _STRIPPED:
+            value = self._data[key] = [strip_depend_info(d) for d in self._data["orig_" + key]]
+        return value
 
     def __setitem__(self, key, value):
         k = self.canonical_varname(key)
-        self._data[k] = value
+        self._data[sys.intern(k)] = value
 
     def __contains__(self, key):
         return self.canonical_varname(key) in self._data
@@ -154,29 +249,21 @@ class PacmanPackage(collections.abc.MutableMapping):
         Turn all the instance properties listed in self.strings into strings instead of lists
         """
         for i in self.strings:
-            if i in self:
-                if isinstance(self[i], list):
-                    self[i] = self[i][0]
+            value = self._data.get(i)
+            if isinstance(value, list):
+                self._data[i] = value[0]
 
     def clean_depends(self):
         """
         Strip all the depend version info off ('neon>=0.25.5-4' => 'neon').
         Also clean our optdepends and remove any trailing description.
-        The original arrays are copied to orig_depends and orig_optdepends respectively.
+        The original arrays are moved to orig_depends, orig_optdepends... and
+        the stripped ones are only computed when first read.
         """
-
-        if "depends" in self._data:
-            self["orig_depends"] = self["depends"]
-            self["depends"] = [strip_depend_info(d) for d in self["orig_depends"]]
-        if "makedepends" in self._data:
-            self["orig_makedepends"] = self["makedepends"]
-            self["makedepends"] = [strip_depend_info(d) for d in self["orig_makedepends"]]
-        if "optdepends" in self._data:
-            self["orig_optdepends"] = self["optdepends"]
-            self["optdepends"] = [strip_depend_info(d) for d in self["orig_optdepends"]]
-        if "provides" in self._data:
-            self["orig_provides"] = self["provides"]
-            self["provides"] = [strip_depend_info(d) for d in self["orig_provides"]]
+        for key in self.stripped:
+            if key in self._data:
+                self._data["orig_" + key] = self[key]
+                self._data[key] = _STRIPPED
 
     def process(self):
         """
@@ -185,16 +272,33 @@ class PacmanPackage(collections.abc.MutableMapping):
         self.process_strings()
         self.clean_depends()
 
+    @property
+    def detected_deps(self):
+        "A dictionary { package => [reasons why it is needed] }, created on first use"
+        try:
+            return self._detected_deps
+        except AttributeError:
+            self._detected_deps = collections.defaultdict(list)
+            return self._detected_deps
+
+    @detected_deps.setter
+    def detected_deps(self, value):
+        self._detected_deps = value
+
     def __repr__(self):
+        data = {key: self[key] for key in self._data}
         if not self.is_split:
-            return "PacmanPackage(%s)" % repr(self._data)
+            return "PacmanPackage(%s)" % repr(data)
         else:
             children = ",".join(repr(p) for p in self.subpackages)
-            return "PacmanPackage(%s,[%s])" % (repr(self._data), children)
+            return "PacmanPackage(%s,[%s])" % (repr(data), children)
 
 
-def load_from_pkgbuild(path):
-    # Load all the data like we normally would
+def run_parsepkgbuild(path):
+    """Sources a PKGBUILD with parsepkgbuild, returns (exit status, output, errors)"""
+    result = Namcap.parsepool.parse(path)
+    if result is not None:
+        return result
     workingdir = os.path.dirname(path)
     if workingdir == "":
         workingdir = None
@@ -203,15 +307,24 @@ def load_from_pkgbuild(path):
         ["parsepkgbuild", filename], stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=workingdir
     )
     out, err = process.communicate()
-    out = out.decode("utf-8", "ignore")
-    err = err.decode("utf-8", "ignore")
-    # this means parsepkgbuild returned an error, so we are not valid
-    if process.returncode > 0:
-        if out:
-            print("Error:", out)
-        if err:
-            print("Error:", err, file=sys.stdout)
-        return None
+    return process.returncode, out.decode("utf-8", "ignore"), err.decode("utf-8", "ignore")
+
+
+def load_from_pkgbuild(path):
+    # Load all the data like we normally would
+    key = Namcap.pkgbuildcache.pkgbuild_key(path)
+    out = Namcap.pkgbuildcache.load_output(key) if key is not None else None
+    if out is None:
+        returncode, out, err = run_parsepkgbuild(path)
+        # this means parsepkgbuild returned an error, so we are not valid
+        if returncode > 0:
+            if out:
+                print("Error:", out)
+            if err:
+                print("Error:", err, file=sys.stdout)
+            return None
+        if returncode == 0 and key is not None:
+            Namcap.pkgbuildcache.store_output(key, out)
     ret = PacmanPackage(db=out)
 
     # Add a nice little .pkgbuild surprise
@@ -250,21 +363,72 @@ def load_from_alpm(pmpkg):
     return PacmanPackage(data=values)
 
 
+def get_handle():
+    "Returns the pyalpm handle, configured from pacman.conf on first use"
+    global pyalpm_handle
+    with _handle_lock:
+        if pyalpm_handle is None:
+            pyalpm_handle = pycman.config.init_with_config(os.path.join(_get_root(), "etc/pacman.conf"))
+        return pyalpm_handle
+
+
+def get_syncdb(dbname):
+    "Returns the sync database named dbname, registering it if pacman.conf does not"
+    handle = get_handle()
+    for db in handle.get_syncdbs():
+        if db.name == dbname:
+            return db
+    return handle.register_syncdb(dbname, 0)
+
+
 def load_from_tarball(path):
     try:
-        p = pyalpm_handle.load_pkg(path)
+        p = get_handle().load_pkg(path)
     except pyalpm.error:
         return None
 
     return load_from_alpm(p)
 
 
+def load_from_tarfile(tar, path):
+    """
+    Loads a package from the .PKGINFO of an open tarball, None if it has none
+
+    This gives the same variables as load_from_tarball(), without pyalpm
+    reading and decompressing the whole package again. As with pyalpm, size
+    is the size of the package file at path, not the installed size.
+    """
+    for member in tar:
+        if member.name == ".PKGINFO":
+            break
+    else:
+        return None
+    pkginfo = parse_pkginfo(tar.extractfile(member).read().decode("utf-8", "replace"))
+
+    values = {}
+    for key, variable in _pkginfo_strings.items():
+        values[variable] = pkginfo.get(key, [None])[0]
+    for key, variable in _pkginfo_lists.items():
+        values[variable] = pkginfo.get(key, [])
+    values["size"] = os.stat(path).st_size
+    values["arch"] = pkginfo.get("arch", [None])[:1]
+    # the file list of libalpm: sorted, directories ending with a slash,
+    # without the metadata files
+    files = []
+    for m in tar.getmembers():
+        if not m.name.startswith("."):
+            files.append((m.name + "/" if m.isdir() else m.name, m.size, m.mode))
+    values["files"] = sorted(files)
+    values["has_scriptlet"] = ".INSTALL" in tar.getnames()
+    return PacmanPackage(data=values)
+
+
 def load_from_db(pkgname, dbname=None):
     if dbname is None:
         # default is loading local database
-        db = pyalpm_handle.get_localdb()
+        db = get_handle().get_localdb()
     else:
-        db = pyalpm_handle.register_syncdb(dbname, 0)
+        db = get_syncdb(dbname)
     p = db.get_pkg(pkgname)
 
     if p is None:
@@ -274,10 +438,29 @@ def load_from_db(pkgname, dbname=None):
     return p
 
 
+def load_from_repo_db(filename):
+    """
+    Loads all the packages of a repository database file (such as core.db),
+    without pyalpm
+
+    Returns a list of PacmanPackage, in the order of the database.
+    """
+    entries = {}
+    with Namcap.spool.open_spooled(filename) as tar:
+        for member in tar:
+            directory, _, name = member.name.rpartition("/")
+            if member.isfile() and name in ("desc", "depends"):
+                data = Namcap.spool.member_view(tar, member)
+                if data is None:
+                    data = tar.extractfile(member).read()
+                entries.setdefault(directory, []).append(str(data, "utf-8", "replace"))
+    return [PacmanPackage(db="\n".join(texts)) for texts in entries.values()]
+
+
 def load_testing_package(pkgname):
     "Loads the testing version of a package, None if not found."
     testing_dbs = [
-        db for db in pyalpm_handle.get_syncdbs() if db.name in ("testing", "multilib-testing", "community-testing")
+        db for db in get_handle().get_syncdbs() if db.name in ("testing", "multilib-testing", "community-testing")
     ]
     for db in testing_dbs:
         p = db.get_pkg(pkgname)
@@ -285,15 +468,61 @@ def load_testing_package(pkgname):
             return load_from_alpm(p)
 
 
+def reload_databases():
+    "Makes get_handle() open the pacman databases again, after they changed on disk"
+    global pyalpm_handle
+    with _handle_lock:
+        pyalpm_handle = None
+
+
 def get_installed_packages():
-    return pyalpm_handle.get_localdb().pkgcache
+    return get_handle().get_localdb().pkgcache
+
+
+def get_localdb_path():
+    "Returns the directory of the local database, holding one entry per installed package."
+    return os.path.join(get_handle().dbpath, "local")
+
+
+def sync_db_state():
+    "Returns [(path, mtime)] of the sync databases, which pacman replaces when refreshing them"
+    syncdir = os.path.join(get_handle().dbpath, "sync")
+    try:
+        names = sorted(os.listdir(syncdir))
+    except FileNotFoundError:
+        # never refreshed
+        return []
+    state = []
+    for name in names:
+        path = os.path.join(syncdir, name)
+        try:
+            state.append((path, os.stat(path).st_mtime_ns))
+        except OSError:
+            pass
+    return state
+
+
+def get_installed_package(pkgname):
+    "Returns the pyalpm package named pkgname from the local database, None if not installed."
+    return get_handle().get_localdb().get_pkg(pkgname)
+
+
+def get_provides_index(db):
+    "Returns the providers of each name provided in a pyalpm database, indexed on first use"
+    index = _provides_index.get(db.name)
+    if index is None:
+        index = {}
+        for pkg in db.pkgcache:
+            for d in pkg.provides:
+                index.setdefault(strip_depend_info(d), []).append(pkg)
+        _provides_index[db.name] = index
+    return index
 
 
 def lookup_provider(pkgname, db):
-    for pkg in db.pkgcache:
-        stripped_provides = [strip_depend_info(d) for d in pkg.provides]
-        if pkgname in stripped_provides:
-            return pkg
+    providers = get_provides_index(db).get(pkgname)
+    if providers:
+        return providers[0]
 
 
 def mtree_line(line):
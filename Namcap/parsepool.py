@@ -0,0 +1,157 @@
+# Copyright (C) 2003-2023 Namcap contributors, see AUTHORS for details.
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""
+Long-lived workers sourcing PKGBUILDs.
+
+Running parsepkgbuild starts two shells per PKGBUILD, one of them reading
+/etc/makepkg.conf, which dominates the time taken to check large numbers of
+PKGBUILDs. Once enabled (see enable()), each namcap process keeps a single
+bash worker instead: it reads requests on a pipe and runs parsepkgbuild.sh
+for each of them in a fresh restricted subshell, with the same environment
+as parsepkgbuild, then sends back the %KEY% stream. namcap --jobs N checks
+PKGBUILDs in N processes, so N workers.
+"""
+
+import os
+import subprocess
+import tempfile
+import threading
+
+# Reads NUL-terminated (directory, file name) pairs, and prints the output of
+# parsepkgbuild.sh for each of them, followed by a line with a marker and its
+# exit status. The variables of the loop are unset before the PKGBUILD is
+# sourced, so that it only sees what it would see under parsepkgbuild.
+WORKER_LOOP = """
+while IFS= read -r -d '' _namcap_dir && IFS= read -r -d '' _namcap_file; do
+	(
+		cd -- "$_namcap_dir" || exit 1
+		set -- "$_namcap_file"
+		unset _namcap_dir _namcap_file _namcap_marker BASH_EXECUTION_STRING OLDPWD
+		set -r
+		eval "unset _namcap_script; $_namcap_script"
+	) </dev/null
+	printf '\\n%s %d\\n' "$_namcap_marker" "$?"
+done
+"""
+
+_worker = None
+_enabled = False
+_lock = threading.Lock()
+
+
+def parser_script():
+    "Returns the path of parsepkgbuild.sh"
+    return os.path.join(os.environ.get("PARSE_PKGBUILD_PATH", "/usr/share/namcap"), "parsepkgbuild.sh")
+
+
+def makepkg_carch():
+    "Returns $CARCH from /etc/makepkg.conf, as parsepkgbuild sets it"
+    process = subprocess.run(
+        ["/bin/bash", "-c", 'source /etc/makepkg.conf; printf %s "$CARCH"'],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    return process.stdout.decode("utf-8", "ignore")
+
+
+class ParseWorker(object):
+    "A bash process running parsepkgbuild.sh over the PKGBUILDs it is given, one at a time"
+
+    def __init__(self, script=None, carch=None):
+        script = script if script is not None else parser_script()
+        carch = carch if carch is not None else makepkg_carch()
+        with open(script, errors="ignore") as f:
+            source = f.read()
+        marker = os.urandom(16).hex()
+        self.marker = marker.encode() + b" "
+        # stderr goes to a file, so that a PKGBUILD printing many errors cannot
+        # block the worker while its output is read
+        self.errors = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(
+            ["/bin/bash", "--norc", "--noprofile", "-c", WORKER_LOOP, script],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=self.errors,
+            cwd="/",
+            env={"PATH": "/dummy", "CARCH": carch, "_namcap_marker": marker, "_namcap_script": source},
+        )
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def parse(self, path):
+        """
+        Runs parsepkgbuild.sh over a PKGBUILD
+
+        Returns (exit status, output, errors) like running parsepkgbuild.
+        """
+        directory = os.path.abspath(os.path.dirname(path) or ".")
+        filename = os.path.basename(path)
+        self.errors.seek(0)
+        self.errors.truncate()
+        try:
+            self.process.stdin.write(os.fsencode(directory) + b"\0" + os.fsencode(filename) + b"\0")
+            self.process.stdin.flush()
+        except BrokenPipeError:
+            return 1, "", "Error: the PKGBUILD worker exited\n"
+        lines = []
+        status = None
+        for line in iter(self.process.stdout.readline, b""):
+            if line.startswith(self.marker):
+                status = int(line[len(self.marker) :])
+                break
+            lines.append(line)
+        self.errors.seek(0)
+        err = self.errors.read().decode("utf-8", "ignore")
+        if status is None:
+            # the PKGBUILD killed the worker
+            self.close()
+            return 1, b"".join(lines).decode("utf-8", "ignore"), err
+        # drop the newline printed before the marker
+        out = b"".join(lines)[:-1]
+        return status, out.decode("utf-8", "ignore"), err
+
+    def close(self):
+        if self.process.stdin is not None and not self.process.stdin.closed:
+            try:
+                self.process.stdin.close()
+            except BrokenPipeError:
+                pass
+        self.process.wait()
+        self.process.stdout.close()
+        self.errors.close()
+
+
+def enable():
+    "Parses the PKGBUILDs with a long-lived worker from now on"
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    "Goes back to running parsepkgbuild for each PKGBUILD, stopping the worker"
+    global _enabled, _worker
+    with _lock:
+        _enabled = False
+        if _worker is not None and _worker[0] == os.getpid():
+            _worker[1].close()
+        _worker = None
+
+
+def parse(path):
+    """
+    Runs parsepkgbuild.sh over a PKGBUILD with the worker of this process,
+    starting it if needed
+
+    Returns (exit status, output, errors), or None if the workers are disabled.
+    """
+    global _worker
+    if not _enabled:
+        return None
+    with _lock:
+        # a worker inherited from the parent process belongs to the parent
+        if _worker is None or _worker[0] != os.getpid() or not _worker[1].alive():
+            _worker = (os.getpid(), ParseWorker())
+        return _worker[1].parse(path)
@@ -0,0 +1,101 @@
+# Copyright (C) 2003-2023 Namcap contributors, see AUTHORS for details.
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""
+On-disk cache of parsed PKGBUILDs.
+
+Editors and pre-commit hooks check the same PKGBUILD over and over, sourcing
+it each time. Once enabled (see enable()), the output of parsepkgbuild for a
+valid PKGBUILD is stored in an SQLite database under the namcap cache
+directory, keyed on a hash of the PKGBUILD, of parsepkgbuild.sh and of
+/etc/makepkg.conf, which sets $CARCH. The PacmanPackage and its split
+subpackages are built again from it, which is much faster than sourcing.
+
+PKGBUILDs which read other files are seen as unchanged when only these files
+change, so the cache is only used with namcap --cache.
+"""
+
+import hashlib
+import os
+import sqlite3
+
+from Namcap.parsepool import parser_script
+from Namcap.util import cache_dir
+
+CACHE_VERSION = "1"
+MAKEPKG_CONF = "/etc/makepkg.conf"
+
+_enabled = False
+
+
+def enable():
+    "Reuses the parsed PKGBUILDs from now on"
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    "Sources every PKGBUILD again"
+    global _enabled
+    _enabled = False
+
+
+def _digest(filename, missing_ok=False):
+    try:
+        with open(filename, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except FileNotFoundError:
+        if missing_ok:
+            return ""
+        raise
+
+
+def makepkg_conf_digest():
+    "Returns the digest of /etc/makepkg.conf, which sets $CARCH for the PKGBUILDs"
+    return _digest(MAKEPKG_CONF, missing_ok=True)
+
+
+def pkgbuild_key(path):
+    "Returns the key of the parsed PKGBUILD at path, None if it cannot be cached"
+    if not _enabled:
+        return None
+    try:
+        parts = [CACHE_VERSION, _digest(path), _digest(parser_script()), makepkg_conf_digest()]
+    except OSError:
+        return None
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+
+def _connect():
+    dirname = cache_dir()
+    os.makedirs(dirname, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(dirname, "pkgbuilds.sqlite"), timeout=30)
+    conn.execute("CREATE TABLE IF NOT EXISTS pkgbuilds (key TEXT PRIMARY KEY, output TEXT)")
+    return conn
+
+
+def load_output(key):
+    "Returns the output of parsepkgbuild stored under key, None if not cached"
+    try:
+        conn = _connect()
+        try:
+            row = conn.execute("SELECT output FROM pkgbuilds WHERE key = ?", (key,)).fetchone()
+        finally:
+            conn.close()
+    except (OSError, sqlite3.Error):
+        return None
+    return row[0] if row is not None else None
+
+
+def store_output(key, output):
+    "Stores the output of parsepkgbuild for a valid PKGBUILD under key"
+    try:
+        conn = _connect()
+        try:
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO pkgbuilds VALUES (?, ?)", (key, output))
+        finally:
+            conn.close()
+    except (OSError, sqlite3.Error):
+        # the cache is only an optimisation
+        pass
@@ -0,0 +1,121 @@
+# Copyright (C) 2003-2023 Namcap contributors, see AUTHORS for details.
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""
+On-disk cache of the results of namcap on package files.
+
+CI pipelines lint the same artifacts over and over. The messages printed for
+a package are stored in an SQLite database under the namcap cache directory,
+keyed on a hash of the package file, of namcap itself and the rules run, of
+the tags the messages are printed with, of the state of the local and sync
+databases and of $PATH, which the rules look interpreters up in: changing
+any of them runs the rules again.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+import Namcap
+import Namcap.ownership
+import Namcap.package
+import Namcap.tags
+import Namcap.version
+from Namcap.util import cache_dir
+
+CACHE_VERSION = "1"
+
+_source_digest = None
+_source_lock = threading.Lock()
+
+
+def file_digest(filename):
+    "Returns the SHA-256 of the contents of a file, in hexadecimal"
+    h = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def source_digest():
+    "Returns a digest of the sources of the Namcap package, computed once"
+    global _source_digest
+    with _source_lock:
+        if _source_digest is None:
+            h = hashlib.sha256()
+            top = os.path.dirname(os.path.abspath(Namcap.__file__))
+            for dirpath, dirnames, filenames in os.walk(top):
+                dirnames[:] = sorted(d for d in dirnames if d != "tests")
+                for filename in sorted(filenames):
+                    if filename.endswith(".py"):
+                        path = os.path.join(dirpath, filename)
+                        h.update(os.path.relpath(path, top).encode() + b"\0")
+                        with open(path, "rb") as f:
+                            h.update(f.read())
+            _source_digest = h.hexdigest()
+    return _source_digest
+
+
+def result_key(filename, rules, options):
+    """
+    Returns the key of the results of rules on a package file, None if
+    they cannot be cached
+
+    options are the command line options changing what is printed.
+    """
+    try:
+        state = [Namcap.ownership.local_db_state(), Namcap.package.sync_db_state(), os.environ.get("PATH", os.defpath)]
+        digest = file_digest(filename)
+    except OSError:
+        return None
+    key = [
+        CACHE_VERSION,
+        Namcap.version.get_version(),
+        source_digest(),
+        digest,
+        sorted(rules),
+        sorted(Namcap.tags.tags.items()),
+        state,
+        options,
+    ]
+    return hashlib.sha256(json.dumps(key).encode()).hexdigest()
+
+
+def _connect():
+    dirname = cache_dir()
+    os.makedirs(dirname, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(dirname, "results.sqlite"), timeout=30)
+    conn.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, messages TEXT)")
+    return conn
+
+
+def load_results(key):
+    "Returns the [(name, kind, text)] messages stored under key, None if not cached"
+    try:
+        conn = _connect()
+        try:
+            row = conn.execute("SELECT messages FROM results WHERE key = ?", (key,)).fetchone()
+        finally:
+            conn.close()
+    except (OSError, sqlite3.Error):
+        return None
+    if row is None:
+        return None
+    return [tuple(message) for message in json.loads(row[0])]
+
+
+def store_results(key, messages):
+    "Stores the [(name, kind, text)] messages printed for a package under key"
+    try:
+        conn = _connect()
+        try:
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?)", (key, json.dumps(messages)))
+        finally:
+            conn.close()
+    except (OSError, sqlite3.Error):
+        # the cache is only an optimisation
+        pass
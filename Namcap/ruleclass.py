@@ -3,6 +3,11 @@
 
 from typing import Any
 
+import Namcap.scan
+
+THREAD = "thread"
+PROCESS = "process"
+
 """
 This module defines the base classes from which Namcap rules are derived
 and how they are meant to be used.
@@ -31,3 +36,24 @@ class PkgbuildRule(AbstractRule):
 
 class TarballRule(AbstractRule):
     "The parent class of rules that process tarballs"
+
+    # Kinds of members (see Namcap.scan) the rule wants to read. Such rules
+    # get their files from the single pass over the tarball through
+    # analyze_member(), instead of walking the tarball on their own.
+    member_kinds: frozenset[str] = frozenset()
+
+    # How the rule may run alongside the others when several jobs are
+    # allowed (see Namcap.scheduler): None to run in the main thread, THREAD
+    # for rules waiting on subprocesses or I/O, PROCESS for CPU-bound rules.
+    # Rules running concurrently only get their own view of the package and
+    # a Namcap.scan.MemberList instead of the tarball.
+    concurrency: str | None = None
+
+    def analyze(self, pkginfo, tar):
+        Namcap.scan.scan_tarball(pkginfo, tar, [self])
+
+    def analyze_member(self, pkginfo, member):
+        "Called for each regular file matching one of member_kinds"
+
+    def finish(self, pkginfo, tar):
+        "Called once all the members of the tarball have been seen"
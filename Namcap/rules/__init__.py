@@ -1,68 +1,189 @@
 # Copyright (C) 2003-2023 Namcap contributors, see AUTHORS for details.
 # SPDX-License-Identifier: GPL-2.0-or-later
 
-from types import ModuleType
-import Namcap.ruleclass
-
-# Tarball rules
-from . import (  # noqa: F401
-    anyelf,
-    dbus1location,
-    elffiles,
-    emptydir,
-    externalhooks,
-    fhs,
-    filenames,
-    fileownership,
-    gnomemime,
-    hardlinks,
-    hookdepends,
-    infodirectory,
-    javafiles,
-    libtool,
-    licensepkg,
-    lotsofdocs,
-    missingbackups,
-    pathdepends,
-    perllocal,
-    pcdepends,
-    permissions,
-    py_mtime,
-    pydepends,
-    qmldepends,
-    rpath,
-    runpath,
-    scrollkeeper,
-    shebangdepends,
-    sphinxbuildcachefiles,
-    sodepends,
-    symlink,
-    systemdlocation,
-    unusedsodepends,
-)
-
-# PKGBUILD and metadata rules
-from . import (  # noqa: F401
-    arrays,
-    badbackups,
-    carch,
-    extravars,
-    invalidstartdir,
-    makedepends,
-    makepkgfunctions,
-    missingvars,
-    pkginfo,
-    pkgnameindesc,
-    sfurl,
-    splitpkgbuild,
-)
-
-all_rules = {}
-for name, value in dict(locals()).items():
-    if not isinstance(value, ModuleType):
-        continue
-    if name == "Namcap.ruleclass":
-        continue
-    for n, v in value.__dict__.items():
-        if type(v) == type and issubclass(v, Namcap.ruleclass.AbstractRule) and hasattr(v, "name"):
-            all_rules[v.name] = v
+"""
+Registry of the namcap rules.
+
+The rules are listed here with what namcap needs to know about them before
+running them, so that only the modules of the rules actually run get
+imported: all_rules maps the rule names to their classes, importing the
+module of a rule on first access. Namcap/tests/test_rules.py checks the
+registry against the rule classes.
+"""
+
+import collections.abc
+import importlib
+
+# kinds of rules, named after their base class in Namcap.ruleclass
+TARBALL = "TarballRule"
+PKGBUILD = "PkgbuildRule"
+PKGINFO = "PkgInfoRule"
+
+
+class RuleInfo(object):
+    "A rule, as known before importing its module"
+
+    __slots__ = ("name", "module", "classname", "kind", "description", "enable")
+
+    def __init__(self, name, path, kind, description, enable=True):
+        self.name = name
+        # module of Namcap.rules and name of the rule class
+        self.module, self.classname = path.split(".")
+        self.kind = kind
+        self.description = description
+        self.enable = enable
+
+    @property
+    def path(self):
+        "The qualified name of the rule class"
+        return "Namcap.rules.%s.%s" % (self.module, self.classname)
+
+
+class RuleRegistry(collections.abc.Mapping):
+    "Rule name => rule class, importing the module of a rule on first access"
+
+    def __init__(self, infos):
+        self.infos = infos
+
+    def __getitem__(self, name):
+        info = self.infos[name]
+        return getattr(importlib.import_module("Namcap.rules." + info.module), info.classname)
+
+    def __iter__(self):
+        return iter(self.infos)
+
+    def __len__(self):
+        return len(self.infos)
+
+    def __repr__(self):
+        # as the dictionary of the classes would be shown, without importing them
+        return "{%s}" % ", ".join("%r: <class '%s'>" % (name, info.path) for name, info in self.infos.items())
+
+
+_rules = [
+    # Tarball rules
+    RuleInfo(
+        "anyelf", "anyelf.package", TARBALL, "Check for ELF files to see if a package should be 'any' architecture"
+    ),
+    RuleInfo(
+        "dbus1location", "dbus1location.dbus1locationRule", TARBALL, "Checks for dbus files in /etc/dbus1/system.d/"
+    ),
+    RuleInfo("elfpaths", "elffiles.ELFPaths", TARBALL, "Check about ELF files outside some standard paths."),
+    RuleInfo("elftextrel", "elffiles.ELFTextRelocationRule", TARBALL, "Check for text relocations in ELF files."),
+    RuleInfo("elfexecstack", "elffiles.ELFExecStackRule", TARBALL, "Check for executable stacks in ELF files."),
+    RuleInfo("elfgnurelro", "elffiles.ELFGnuRelroRule", TARBALL, "Check for FULL RELRO in ELF files."),
+    RuleInfo("elfunstripped", "elffiles.ELFUnstrippedRule", TARBALL, "Check for unstripped ELF files."),
+    RuleInfo("elfnopie", "elffiles.NoPIERule", TARBALL, "Check for no PIE ELF files."),
+    RuleInfo(
+        "elfnoshstk", "elffiles.ELFSHSTKRule", TARBALL, "Check for shadow stack support in ELF files.", enable=False
+    ),
+    RuleInfo("emptydir", "emptydir.package", TARBALL, "Warns about empty directories in a package"),
+    RuleInfo(
+        "externalhooks", "externalhooks.ExternalHooksRule", TARBALL, "Check the .INSTALL for commands covered by hooks"
+    ),
+    RuleInfo("directoryname", "fhs.FHSRule", TARBALL, "Checks for standard directories."),
+    RuleInfo("fhs-manpages", "fhs.FHSManpagesRule", TARBALL, "Verifies correct installation of man pages"),
+    RuleInfo("fhs-infopages", "fhs.FHSInfoPagesRule", TARBALL, "Verifies correct installation of info pages"),
+    RuleInfo("rubypaths", "fhs.RubyPathsRule", TARBALL, "Verifies correct usage of folders by ruby packages"),
+    RuleInfo("filenames", "filenames.package", TARBALL, "Checks for invalid filenames."),
+    RuleInfo("fileownership", "fileownership.package", TARBALL, "Checks file ownership."),
+    RuleInfo("gnomemime", "gnomemime.package", TARBALL, "Checks for generated GNOME mime files"),
+    RuleInfo("hardlinks", "hardlinks.package", TARBALL, "Look for cross-directory/partition hard links"),
+    RuleInfo("hookdepends", "hookdepends.HookDependsRule", TARBALL, "Check for redundant hook dependencies"),
+    RuleInfo("infodirectory", "infodirectory.InfodirRule", TARBALL, "Checks for info directory file."),
+    RuleInfo("javafiles", "javafiles.JavaFiles", TARBALL, "Check for existence of Java classes or JARs"),
+    RuleInfo("libtool", "libtool.package", TARBALL, "Checks for libtool (*.la) files."),
+    RuleInfo("licensepkg", "licensepkg.package", TARBALL, "Verifies license is included in a package file"),
+    RuleInfo(
+        "lots-of-docs", "lotsofdocs.package", TARBALL, "See if a package is carrying more documentation than it should"
+    ),
+    RuleInfo("missingbackups", "missingbackups.package", TARBALL, "Backup files listed in package should exist"),
+    RuleInfo("pathdepends", "pathdepends.PathDependsRule", TARBALL, "Check for simple implicit path dependencies"),
+    RuleInfo("perllocal", "perllocal.package", TARBALL, "Verifies the absence of perllocal.pod."),
+    RuleInfo(
+        "pcdepends", "pcdepends.PkgConfigDependenciesRule", TARBALL, "Checks dependencies caused by pkg-config files"
+    ),
+    RuleInfo("permissions", "permissions.package", TARBALL, "Checks file permissions."),
+    RuleInfo("py_mtime", "py_mtime.package", TARBALL, "Check for py timestamps that are ahead of pyc/pyo timestamps"),
+    RuleInfo("pydepends", "pydepends.PythonDependencyRule", TARBALL, "Checks python dependencies"),
+    RuleInfo("qmldepends", "qmldepends.QmlDependencyRule", TARBALL, "Checks QML dependencies"),
+    RuleInfo("rpath", "rpath.package", TARBALL, "Verifies correct and secure RPATH for files."),
+    RuleInfo("runpath", "runpath.package", TARBALL, "Verifies if RUNPATH is secure"),
+    RuleInfo(
+        "scrollkeeper", "scrollkeeper.package", TARBALL, "Verifies that there aren't any scrollkeeper directories."
+    ),
+    RuleInfo("shebangdepends", "shebangdepends.ShebangDependsRule", TARBALL, "Checks dependencies semi-smartly."),
+    RuleInfo(
+        "sphinxbuildcachefiles",
+        "sphinxbuildcachefiles.sphinxbuildcachefilesRule",
+        TARBALL,
+        "Checks for leftover sphinx-build cached environment files",
+    ),
+    RuleInfo("sodepends", "sodepends.SharedLibsRule", TARBALL, "Checks dependencies caused by linked shared libraries"),
+    RuleInfo("symlink", "symlink.package", TARBALL, "Checks that symlinks point to the right place"),
+    RuleInfo(
+        "systemdlocation",
+        "systemdlocation.systemdlocationRule",
+        TARBALL,
+        "Checks for systemd files in /etc/systemd/system/",
+    ),
+    RuleInfo(
+        "unusedsodepends",
+        "unusedsodepends.package",
+        TARBALL,
+        "Checks for unused dependencies caused by linked shared libraries",
+    ),
+    # PKGBUILD and metadata rules
+    RuleInfo("array", "arrays.package", PKGBUILD, "Verifies that array variables are actually arrays"),
+    RuleInfo("badbackups", "badbackups.package", PKGBUILD, "Checks for bad backup entries"),
+    RuleInfo("carch", "carch.package", PKGBUILD, "Verifies that no specific host type is used"),
+    RuleInfo("extravars", "extravars.package", PKGBUILD, "Verifies that extra variables start with an underscore"),
+    RuleInfo("invalidstartdir", "invalidstartdir.package", PKGBUILD, "Looks for references to $startdir"),
+    RuleInfo(
+        "redundant_makedepends", "makedepends.RedundantMakedepends", PKGBUILD, "Check for redundant make dependencies"
+    ),
+    RuleInfo("vcs_makedepends", "makedepends.VCSMakedepends", PKGBUILD, "Verify make dependencies for VCS sources"),
+    RuleInfo("makepkgfunctions", "makepkgfunctions.package", PKGBUILD, "Looks for calls to makepkg functionality"),
+    RuleInfo("checksums", "missingvars.ChecksumsRule", PKGBUILD, "Verifies checksums are included in a PKGBUILD"),
+    RuleInfo("tags", "missingvars.TagsRule", PKGBUILD, "Looks for Maintainer and Contributor comments"),
+    RuleInfo(
+        "description", "missingvars.DescriptionRule", PKGBUILD, "Verifies that the description is set in a PKGBUILD"
+    ),
+    RuleInfo(
+        "capsnamespkg",
+        "pkginfo.CapsPkgnameRule",
+        PKGINFO,
+        "Verifies package name in package does not include upper case letters",
+    ),
+    RuleInfo("urlpkg", "pkginfo.UrlRule", PKGINFO, "Verifies url is included in a package file"),
+    RuleInfo("license", "pkginfo.LicenseRule", PKGINFO, "Verifies license is included in a PKGBUILD"),
+    RuleInfo(
+        "non-unique-source",
+        "pkginfo.NonUniqueSourcesRule",
+        PKGBUILD,
+        "Verifies the downloaded sources have a unique filename",
+    ),
+    RuleInfo(
+        "pkgnameindesc",
+        "pkgnameindesc.package",
+        PKGINFO,
+        "Verifies if the package name is included on package description",
+    ),
+    RuleInfo("sfurl", "sfurl.package", PKGBUILD, "Checks for proper sourceforge URLs"),
+    RuleInfo(
+        "splitpkgfunctions",
+        "splitpkgbuild.PackageFunctionsRule",
+        PKGBUILD,
+        "Checks that all package_* functions exist.",
+    ),
+    RuleInfo(
+        "splitpkgmakedeps",
+        "splitpkgbuild.SplitPkgMakedepsRule",
+        PKGBUILD,
+        "Checks that a split PKGBUILD has enough makedeps.",
+    ),
+]
+
+# rule name => RuleInfo
+registry = {info.name: info for info in _rules}
+all_rules = RuleRegistry(registry)
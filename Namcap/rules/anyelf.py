@@ -6,31 +6,30 @@ Check for ELF files to see if a package should be 'any' architecture
 """
 
 import re
-from Namcap.util import is_elf, is_static
+from Namcap import scan
 from Namcap.ruleclass import TarballRule
 
 
 class package(TarballRule):
     name = "anyelf"
     description = "Check for ELF files to see if a package should be 'any' architecture"
+    # Ar files (static libs) are also architecture specific (FS#24854)
+    member_kinds = frozenset([scan.ELF, scan.AR])
 
-    def analyze(self, pkginfo, tar):
+    def __init__(self):
+        super().__init__()
+        self.found_elffiles = []
+
+    def analyze_member(self, pkginfo, member):
+        self.found_elffiles.append(member.name)
+
+    def finish(self, pkginfo, tar):
         supress_name = ["^mingw-"]
         if any(re.search(s, pkginfo["name"]) for s in supress_name):
             return
-        found_elffiles = []
-
-        for entry in tar.getmembers():
-            if not entry.isfile():
-                continue
-            f = tar.extractfile(entry)
-            # Ar files (static libs) are also architecture specific (FS#24854)
-            if is_elf(f) or is_static(f):
-                found_elffiles.append(entry.name)
-            f.close()
 
         if pkginfo["arch"] and pkginfo["arch"][0] == "any":
-            self.errors = [("elffile-in-any-package %s", i) for i in found_elffiles]
+            self.errors = [("elffile-in-any-package %s", i) for i in self.found_elffiles]
         else:
-            if len(found_elffiles) == 0:
+            if len(self.found_elffiles) == 0:
                 self.warnings.append(("no-elffiles-not-any-package", ()))
@@ -1,6 +1,7 @@
 # Copyright (C) 2003-2023 Namcap contributors, see AUTHORS for details.
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+from Namcap.nameindex import name_index
 from Namcap.ruleclass import TarballRule
 
 
@@ -25,7 +26,7 @@ class ExternalHooksRule(TarballRule):
     ]
 
     def analyze(self, pkginfo, tar):
-        if ".INSTALL" not in tar.getnames():
+        if ".INSTALL" not in name_index(tar):
             return
         f = tar.extractfile(".INSTALL")
         text = f.read().decode("utf-8", "ignore")
@@ -3,10 +3,13 @@
 
 """Checks for invalid filenames."""
 
+import re
 import string
+from Namcap.nameindex import name_index
 from Namcap.ruleclass import TarballRule
 
 VALID_CHARS = string.ascii_letters + string.digits + string.punctuation + " "
+INVALID_CHAR = re.compile("[^%s]" % re.escape(VALID_CHARS))
 
 
 class package(TarballRule):
@@ -14,6 +17,6 @@ class package(TarballRule):
     description = "Checks for invalid filenames."
 
     def analyze(self, pkginfo, tar):
-        for i in tar.getnames():
-            if not all(c in VALID_CHARS for c in i):
+        for i in name_index(tar):
+            if INVALID_CHAR.search(i):
                 self.warnings.append(("invalid-filename", i))
@@ -1,6 +1,7 @@
 # Copyright (C) 2003-2023 Namcap contributors, see AUTHORS for details.
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+from Namcap.nameindex import name_index
 from Namcap.ruleclass import TarballRule
 
 
@@ -18,6 +19,5 @@ class package(TarballRule):
             "usr/share/mime/subclasses",
         ]
 
-        for i in tar.getnames():
-            if i in mime_files:
-                self.errors.append(("gnome-mime-file %s", i))
+        for i in name_index(tar).ordered(mime_files):
+            self.errors.append(("gnome-mime-file %s", i))
@@ -1,7 +1,7 @@
 # Copyright (C) 2003-2023 Namcap contributors, see AUTHORS for details.
 # SPDX-License-Identifier: GPL-2.0-or-later
 
-import re
+from Namcap.nameindex import name_index
 from Namcap.ruleclass import TarballRule
 
 
@@ -20,11 +20,8 @@ class HookDependsRule(TarballRule):
     ]
 
     def analyze(self, pkginfo, tar):
-        names = [entry.name for entry in tar]
-        for subrule in self.subrules:
-            dep = subrule["dep"]
-            if dep not in pkginfo["depends"]:
-                continue
-            pattern = re.compile(subrule["path"])
-            if any(pattern.search(n) for n in names):
-                self.warnings.append(("external-hooks-unneeded %s", dep))
+        subrules = [subrule for subrule in self.subrules if subrule["dep"] in pkginfo["depends"]]
+        found = name_index(tar).search([subrule["path"] for subrule in subrules])
+        for i, subrule in enumerate(subrules):
+            if i in found:
+                self.warnings.append(("external-hooks-unneeded %s", subrule["dep"]))
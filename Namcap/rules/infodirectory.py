@@ -1,6 +1,7 @@
 # Copyright (C) 2003-2023 Namcap contributors, see AUTHORS for details.
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+from Namcap.nameindex import name_index
 from Namcap.ruleclass import TarballRule
 
 
@@ -9,6 +10,6 @@ class InfodirRule(TarballRule):
     description = "Checks for info directory file."
 
     def analyze(self, pkginfo, tar):
-        for i in tar.getnames():
+        for i in name_index(tar).listdir("usr/share/info"):
             if i == "usr/share/info/dir":
                 self.errors.append(("info-dir-file-present %s", i))
@@ -1,31 +1,24 @@
 # Copyright (C) 2003-2023 Namcap contributors, see AUTHORS for details.
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+from Namcap import scan
 from Namcap.ruleclass import TarballRule
-from Namcap.util import is_java
 
 
 class JavaFiles(TarballRule):
     name = "javafiles"
     description = "Check for existence of Java classes or JARs"
+    # JAR files and CLASS files
+    member_kinds = frozenset([scan.JAVA])
 
-    def analyze(self, pkginfo, tar):
-        javas = []
-        for entry in tar:
-            # is it a regular file ?
-            if not entry.isfile():
-                continue
-            # is it a JAR file ?
-            if entry.name.endswith(".jar"):
-                javas.append(entry.name)
-                # self.infos.append( ('jar-file-found %s', entry.name) )
-                continue
-            # is it a CLASS file ?
-            f = tar.extractfile(entry)
-            if is_java(f):
-                javas.append(entry.name)
-                # self.infos.append( ('java-class-file-found %s', entry.name) )
-            f.close()
-        if javas:
+    def __init__(self):
+        super().__init__()
+        self.javas = []
+
+    def analyze_member(self, pkginfo, member):
+        self.javas.append(member.name)
+
+    def finish(self, pkginfo, tar):
+        if self.javas:
             reasons = pkginfo.detected_deps.setdefault("java-runtime", [])
-            reasons.append(("java-runtime-needed %s", ", ".join(javas)))
+            reasons.append(("java-runtime-needed %s", ", ".join(self.javas)))
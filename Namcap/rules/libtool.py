@@ -1,7 +1,7 @@
 # Copyright (C) 2003-2023 Namcap contributors, see AUTHORS for details.
 # SPDX-License-Identifier: GPL-2.0-or-later
 
-import re
+from Namcap.nameindex import name_index
 from Namcap.ruleclass import TarballRule
 
 
@@ -10,6 +10,5 @@ class package(TarballRule):
     description = "Checks for libtool (*.la) files."
 
     def analyze(self, pkginfo, tar):
-        for i in tar.getnames():
-            if re.search(r"\.la$", i) is not None:
-                self.warnings.append(("libtool-file-present %s", i))
+        for i in name_index(tar).with_extension("la"):
+            self.warnings.append(("libtool-file-present %s", i))
@@ -2,7 +2,7 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
 
 from license_expression import BaseSymbol, LicenseSymbol, LicenseWithExceptionSymbol, get_spdx_licensing
-from Namcap.ruleclass import TarballRule
+from Namcap.ruleclass import PROCESS, TarballRule
 from Namcap.package import load_from_db
 from Namcap.util import is_debug
 from pathlib import Path
@@ -201,6 +201,7 @@ def package_license_files(tar: TarFile | None, pkgname: str) -> tuple[dict[str,
 class package(TarballRule):
     name = "licensepkg"
     description = "Verifies license is included in a package file"
+    concurrency = PROCESS
 
     def analyze(self, pkginfo, tar: TarFile | None):
         # return early, as we do not check debug packages
@@ -1,6 +1,7 @@
 # Copyright (C) 2003-2023 Namcap contributors, see AUTHORS for details.
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+from Namcap.nameindex import name_index
 from Namcap.ruleclass import TarballRule
 
 
@@ -12,7 +13,7 @@ class package(TarballRule):
         if "backup" not in pkginfo or len(pkginfo["backup"]) == 0:
             return
         known_backups = set(pkginfo["backup"])
-        found_files = set(tar.getnames())
-        missing_backups = known_backups - found_files
+        index = name_index(tar)
+        missing_backups = [backup for backup in known_backups if backup not in index]
         for backup in missing_backups:
             self.errors.append(("missing-backup-file %s", backup))
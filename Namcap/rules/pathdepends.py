@@ -8,7 +8,7 @@ If a certain path is detected then a certain dependency is expected.
 Anything fancier than this should get its own rule.
 """
 
-import re
+from Namcap.nameindex import name_index
 from Namcap.ruleclass import TarballRule
 
 
@@ -27,10 +27,9 @@ class PathDependsRule(TarballRule):
     ]
 
     def analyze(self, pkginfo, tar):
-        names = [entry.name for entry in tar]
-        for subrule in self.subrules:
-            pattern = re.compile(subrule["path"])
-            if any(pattern.search(n) for n in names):
+        found = name_index(tar).search([subrule["path"] for subrule in self.subrules])
+        for i, subrule in enumerate(self.subrules):
+            if i in found:
                 dep = subrule["dep"]
                 reason = subrule["reason"]
                 pkginfo.detected_deps[dep].append((reason, ()))
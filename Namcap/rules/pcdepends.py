@@ -4,61 +4,98 @@
 """Checks dependencies resulting from pkg-config files."""
 
 from collections import defaultdict
-import os
-import shutil
-import subprocess
-import tempfile
-import Namcap.package
+import re
+import Namcap.ownership
+from Namcap import scan
 from Namcap.ruleclass import TarballRule
+from Namcap.util import system_cache
 
+# directories of .pc files => search path of the matching pkg-config personality
+search_paths = {
+    "usr/lib/pkgconfig/": ["usr/lib/pkgconfig/", "usr/share/pkgconfig/"],
+    "usr/share/pkgconfig/": ["usr/lib/pkgconfig/", "usr/share/pkgconfig/"],
+    "usr/lib32/pkgconfig/": ["usr/lib32/pkgconfig/", "usr/share/pkgconfig/"],
+}
 
-def scanpcfiles(tar, pclist):
-    """
-    Find dependencies of pkg-config files
+# search path => { module name => path of the first .pc file providing it }
+_installed_modules = system_cache()
+
+pc_line = re.compile(r"\s*([A-Za-z0-9_.]+)\s*([:=])(.*)", re.DOTALL)
+pc_variable = re.compile(r"\$\$|\$\{([^}]*)\}")
+pc_token = re.compile(r"[<>!=]+|[^\s,<>!=]+")
+
+
+def parse_pcfile(data, pcfiledir=""):
     """
+    Parses the contents of a pkg-config file
 
-    pkg_pc_files = [f for f in tar.getnames() if ".pc" in f]
-    for f in pkg_pc_files:
-        if f.startswith(("usr/lib/pkgconfig", "usr/share/pkgconfig")):
-            pcname = f.replace("usr/lib/pkgconfig/", "").replace("usr/share/pkgconfig/", "").replace(".pc", "")
-            pkgconfig_command = "pkg-config"
-        elif f.startswith("usr/lib32/pkgconfig"):
-            pcname = f.replace("usr/lib32/pkgconfig/", "").replace(".pc", "")
-            pkgconfig_command = "i686-pc-linux-gnu-pkg-config"
-        else:
+    Returns the dictionary of its keywords (Name, Requires...), with the
+    variables they use expanded.
+    """
+    variables = {"pcfiledir": pcfiledir, "pc_sysrootdir": "/"}
+    keywords = {}
+
+    def expand(value):
+        return pc_variable.sub(lambda m: variables.get(m.group(1), "") if m.group(1) is not None else "$", value)
+
+    text = data.decode("utf-8", "replace").replace("\\\n", "")
+    for line in text.splitlines():
+        # unescaped '#' starts a comment
+        line = re.sub(r"(?<!\\)#.*", "", line).replace("\\#", "#")
+        m = pc_line.match(line)
+        if m is None:
             continue
+        name, op, value = m.group(1), m.group(2), expand(m.group(3).strip())
+        if op == "=":
+            variables[name] = value
+        else:
+            keywords.setdefault(name, value)
+    return keywords
+
+
+def parse_requires(value):
+    "Returns the names of the modules in a Requires field, without their version constraints"
+    modules = []
+    expect_version = False
+    for token in pc_token.findall(value):
+        if expect_version:
+            expect_version = False
+        elif token[0] in "<>!=":
+            expect_version = True
+        else:
+            modules.append(token)
+    return modules
+
+
+def installed_modules(search_path):
+    "Returns the .pc files of the installed packages found in a search path, by module name"
+    key = tuple(search_path)
+    if key not in _installed_modules:
+        index = Namcap.ownership.get_index()
+        modules = {}
+        for directory in search_path:
+            for path in index.with_prefix(directory):
+                name = path[len(directory) :]
+                if "/" not in name and name.endswith(".pc"):
+                    modules.setdefault(name[:-3], path)
+        _installed_modules[key] = modules
+    return _installed_modules[key]
+
+
+def scanpcfile(filename, data, pclist):
+    """
+    Find dependencies of a pkg-config file, given its path and contents
+    """
+
+    directory = filename[: filename.rfind("/") + 1]
+    if directory not in search_paths:
+        return
 
-        tmpdir = tempfile.mkdtemp()
-        tar.extract(f, tmpdir)
-        var = subprocess.Popen(
-            [
-                pkgconfig_command,
-                "--maximum-traverse-depth",
-                "1",
-                "--print-requires",
-                "--print-requires-private",
-                pcname,
-            ],
-            env={"LANG": "C", "PKG_CONFIG_LIBDIR": tmpdir + "/" + os.path.dirname(f)},
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        ).communicate()
-        shutil.rmtree(tmpdir)
-        for j in var[0].decode("ascii").splitlines():
-            # Remove version numbers
-            pc_pkg = j.split(" ", 1)[0]
-            if pc_pkg is not None:
-                var = subprocess.Popen(
-                    [pkgconfig_command, "--maximum-traverse-depth", "1", "--path", pc_pkg],
-                    env={"LANG": "C"},
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                ).communicate()
-                pc_path = var[0].decode("ascii").splitlines()
-                if pc_path:
-                    pclist[pc_path[0][1:]].add(f)
-                else:
-                    pclist[pc_pkg + ".pc"].add(f)
+    keywords = parse_pcfile(data, "/" + directory.rstrip("/"))
+    installed = installed_modules(search_paths[directory])
+    for field in ("Requires", "Requires.private"):
+        for pc_pkg in parse_requires(keywords.get(field, "")):
+            pclist[installed.get(pc_pkg, pc_pkg + ".pc")].add(filename)
 
 
 def finddepends(pclist):
@@ -73,13 +110,14 @@ def finddepends(pclist):
     knownpcs = set(pclist)
     foundpcs = set()
 
-    for pkg in Namcap.package.get_installed_packages():
-        for fname, fsize, fmode in pkg.files:
-            for k in knownpcs:
-                if fname == k:
-                    dependlist[pkg.name].add(k)
-                    foundpcs.add(k)
+    index = Namcap.ownership.get_index()
+    for k in knownpcs:
+        for pkgname in index.owners(k):
+            dependlist[pkgname].add(k)
+            foundpcs.add(k)
 
+    # installed packages are reported by name
+    dependlist = defaultdict(set, sorted(dependlist.items()))
     orphans = list(knownpcs - foundpcs)
     return dependlist, orphans
 
@@ -87,13 +125,19 @@ def finddepends(pclist):
 class PkgConfigDependenciesRule(TarballRule):
     name = "pcdepends"
     description = "Checks dependencies caused by pkg-config files"
+    member_kinds = frozenset([scan.PKGCONFIG])
 
-    def analyze(self, pkginfo, tar):
-        pclist = defaultdict(set)
-        dependlist = {}
+    def __init__(self):
+        super().__init__()
+        self.pclist = defaultdict(set)
 
+    def analyze_member(self, pkginfo, member):
         # Detect dependencies from pkg-config files
-        scanpcfiles(tar, pclist)
+        scanpcfile(member.name, member.data, self.pclist)
+
+    def finish(self, pkginfo, tar):
+        pclist = self.pclist
+        dependlist = {}
 
         # Find the packages wich contain the pkg-config files
         dependlist, orphans = finddepends(pclist)
@@ -1,6 +1,7 @@
 # Copyright (C) 2003-2023 Namcap contributors, see AUTHORS for details.
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+from Namcap.nameindex import name_index
 from Namcap.ruleclass import TarballRule
 
 
@@ -9,6 +10,6 @@ class package(TarballRule):
     description = "Verifies the absence of perllocal.pod."
 
     def analyze(self, pkginfo, tar):
-        for i in tar.getnames():
+        for i in name_index(tar).with_extension("pod"):
             if i.endswith("perllocal.pod"):
                 self.errors.append(("perllocal-pod-present %s", i))
@@ -6,8 +6,9 @@ import ast
 import importlib
 import sys
 import sysconfig
-import Namcap.package
-from Namcap.util import is_script, script_type
+import Namcap.membercache
+import Namcap.ownership
+from Namcap import scan
 from Namcap.ruleclass import TarballRule
 
 
@@ -59,45 +60,57 @@ def finddepends(pkgname, modules, gir_modules, gir_versions):
         else:
             missinglibs.add(module)
 
-    for pkg in Namcap.package.get_installed_packages():
-        for j, fsize, fmode in pkg.files:
-            if j.startswith(site_packages_path[1:]):
-                for k, path in knownlibs.items():
-                    if j == path[1:]:
-                        dependlist[pkg.name].add(k)
-                        foundlibs.add(k)
-
-            if j.startswith("usr/lib/girepository-1.0/"):
-                for module in gir_modules:
-                    gir_module = module.replace("gi.repository.", "")
-                    if j.startswith("usr/lib/girepository-1.0/" + gir_module + "-" + gir_versions[gir_module]):
-                        gir_dependlist[pkg.name].add(module)
-                        gir_foundlibs.add(module)
-
+    index = Namcap.ownership.get_index()
+    for k, path in knownlibs.items():
+        if not path.startswith(site_packages_path):
+            continue
+        for pkgname in index.owners(path[1:]):
+            dependlist[pkgname].add(k)
+            foundlibs.add(k)
+
+    for module in gir_modules:
+        gir_module = module.replace("gi.repository.", "")
+        for j in index.with_prefix("usr/lib/girepository-1.0/" + gir_module + "-" + gir_versions[gir_module]):
+            for pkgname in index.owners(j):
+                gir_dependlist[pkgname].add(module)
+                gir_foundlibs.add(module)
+
+    # installed packages are reported by name
+    dependlist = defaultdict(set, sorted(dependlist.items()))
+    gir_dependlist = defaultdict(set, sorted(gir_dependlist.items()))
     orphans = list(set(knownlibs.keys()).union(missinglibs) - foundlibs)
     gir_orphans = list(set(gir_modules.keys()) - gir_foundlibs)
     return dependlist, orphans, gir_dependlist, gir_orphans
 
 
-def get_imports(fileobj, filename, modules, gir_modules, gir_versions):
+def parse_imports(source):
+    """
+    Returns what a Python file imports, None if it cannot be parsed
+
+    These are lists of the imported modules, of the imported GIR modules and
+    of the (GIR module, version) pairs it requires.
+    """
     try:
-        root = ast.parse(fileobj.read())
+        root = ast.parse(source)
     except (SyntaxError, ValueError):
         # ast.parse() uses compile(), which may raise SyntaxError or ValueError
-        return
+        return None
 
+    modules = []
+    gir_modules = []
+    gir_versions = []
     for node in ast.walk(root):
         if isinstance(node, ast.Import):
             for module in node.names:
-                modules[module.name].add(filename)
+                modules.append(module.name)
                 if module.name.startswith("gi.repository."):
-                    gir_modules[module.name].add(filename)
+                    gir_modules.append(module.name)
         elif isinstance(node, ast.ImportFrom):
             if node.module and node.level == 0:
                 for submodule in node.names:
-                    modules[node.module + "." + submodule.name].add(filename)
+                    modules.append(node.module + "." + submodule.name)
                     if node.module == "gi.repository":
-                        gir_modules[node.module + "." + submodule.name].add(filename)
+                        gir_modules.append(node.module + "." + submodule.name)
         elif (
             isinstance(node, ast.Call)
             and isinstance(node.func, ast.Attribute)
@@ -106,7 +119,7 @@ def get_imports(fileobj, filename, modules, gir_modules, gir_versions):
             and node.func.attr == "require_version"
         ):
             if hasattr(node.args[0], "value") and hasattr(node.args[1], "value"):
-                gir_versions[node.args[0].value] = node.args[1].value
+                gir_versions.append((node.args[0].value, node.args[1].value))
         elif (
             isinstance(node, ast.Call)
             and isinstance(node.func, ast.Attribute)
@@ -116,28 +129,48 @@ def get_imports(fileobj, filename, modules, gir_modules, gir_versions):
         ):
             for module, version in zip(node.args[0].keys, node.args[0].values):
                 if hasattr(module, "value") and hasattr(version, "value"):
-                    gir_versions[module.value] = version.value
+                    gir_versions.append((module.value, version.value))
+    return modules, gir_modules, gir_versions
+
+
+def record_imports(imports, filename, modules, gir_modules, gir_versions):
+    "Records what parse_imports() found in a file"
+    if imports is None:
+        return
+    file_modules, file_gir_modules, file_gir_versions = imports
+    for module in file_modules:
+        modules[module].add(filename)
+    for module in file_gir_modules:
+        gir_modules[module].add(filename)
+    for module, version in file_gir_versions:
+        gir_versions[module] = version
+
+
+def get_imports(fileobj, filename, modules, gir_modules, gir_versions):
+    record_imports(parse_imports(fileobj.read()), filename, modules, gir_modules, gir_versions)
 
 
 class PythonDependencyRule(TarballRule):
     name = "pydepends"
     description = "Checks python dependencies"
-
-    def analyze(self, pkginfo, tar):
-        modules = defaultdict(set)
-        gir_modules = defaultdict(set)
-        gir_versions = defaultdict(str)
-
-        for entry in tar:
-            if not entry.isfile():
-                continue
-            f = tar.extractfile(entry)
-            if not entry.name.endswith(".py") and not is_script(f):
-                continue
-            if is_script(f) and script_type(f) not in ["python", "python3"]:
-                continue
-            get_imports(f, entry.name, modules, gir_modules, gir_versions)
-            f.close()
+    member_kinds = frozenset([scan.PYTHON, scan.SCRIPT])
+
+    def __init__(self):
+        super().__init__()
+        self.modules = defaultdict(set)
+        self.gir_modules = defaultdict(set)
+        self.gir_versions = defaultdict(str)
+
+    def analyze_member(self, pkginfo, member):
+        if scan.SCRIPT in member.kinds and Namcap.membercache.member_script_type(member) not in ["python", "python3"]:
+            return
+        imports = Namcap.membercache.cached("pyimports", member, lambda: parse_imports(member.data))
+        record_imports(imports, member.name, self.modules, self.gir_modules, self.gir_versions)
+
+    def finish(self, pkginfo, tar):
+        modules = self.modules
+        gir_modules = self.gir_modules
+        gir_versions = self.gir_versions
 
         # If Gdk version is not defined, it should be the same as Gtk version
         if not gir_versions["Gdk"]:
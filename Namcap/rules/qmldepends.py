@@ -3,9 +3,9 @@
 
 from collections import defaultdict
 import re
-import Namcap.package
+import Namcap.ownership
+from Namcap import scan
 from Namcap.ruleclass import TarballRule
-from Namcap.util import is_elf
 
 qml_path = "usr/lib/qt6/qml/"
 
@@ -21,14 +21,17 @@ def finddepends(modules):
     dependlist = defaultdict(set)
     foundlibs = set()
 
-    for pkg in Namcap.package.get_installed_packages():
-        for j, fsize, fmode in pkg.files:
-            if j.startswith(qml_path) and j.endswith("/qmldir"):
-                k = j.replace(qml_path, "").replace("/qmldir", "").replace("/", ".")
-                if k in modules:
-                    dependlist[pkg.name].add(k)
+    index = Namcap.ownership.get_index()
+    for j in index.with_prefix(qml_path):
+        if j.endswith("/qmldir"):
+            k = j.replace(qml_path, "").replace("/qmldir", "").replace("/", ".")
+            if k in modules:
+                for pkgname in index.owners(j):
+                    dependlist[pkgname].add(k)
                     foundlibs.add(k)
 
+    # installed packages are reported by name
+    dependlist = defaultdict(set, sorted(dependlist.items()))
     orphans = list(set(modules) - foundlibs)
     return dependlist, orphans
 
@@ -49,9 +52,23 @@ def get_imports(string, filename, modules):
 class QmlDependencyRule(TarballRule):
     name = "qmldepends"
     description = "Checks QML dependencies"
-
-    def analyze(self, pkginfo, tar):
-        modules = defaultdict(set)
+    member_kinds = frozenset([scan.QML, scan.ELF])
+
+    def __init__(self):
+        super().__init__()
+        self.modules = defaultdict(set)
+
+    def analyze_member(self, pkginfo, member):
+        elf = scan.ELF in member.kinds
+        if scan.QML not in member.kinds and not any(member.name.startswith(d) for d in ["usr/bin", "usr/lib"]):
+            return
+        if elf and b"libQt6Qml.so" not in member.data:
+            # Does not embed QML, prevent false positives
+            return
+        get_imports(member.data.decode(errors="ignore"), member.name, self.modules)
+
+    def finish(self, pkginfo, tar):
+        modules = self.modules
         included_modules = []
 
         for entry in tar:
@@ -59,19 +76,6 @@ class QmlDependencyRule(TarballRule):
                 continue
             if entry.name.startswith(qml_path) and entry.name.endswith("/qmldir"):
                 included_modules += [entry.name.replace(qml_path, "").replace("/qmldir", "").replace("/", ".")]
-                continue
-            if not entry.name.endswith(".qml") and not any(entry.name.startswith(d) for d in ["usr/bin", "usr/lib"]):
-                continue
-            f = tar.extractfile(entry)
-            elf = is_elf(f)
-            if not entry.name.endswith(".qml") and not elf:
-                continue
-            s = f.read().decode(errors="ignore")
-            if elf and "libQt6Qml.so" not in s:
-                # Does not embed QML, prevent false positives
-                continue
-            get_imports(s, entry.name, modules)
-            f.close()
 
         for m in included_modules:
             modules.pop(m, None)
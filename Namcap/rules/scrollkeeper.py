@@ -2,6 +2,7 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
 
 import re
+from Namcap.nameindex import name_index
 from Namcap.ruleclass import TarballRule
 
 
@@ -11,6 +12,6 @@ class package(TarballRule):
 
     def analyze(self, pkginfo, tar):
         scroll = re.compile(r"var.*/scrollkeeper/?$")
-        for i in tar.getnames():
+        for i in name_index(tar).with_basename("scrollkeeper"):
             if scroll.search(i):
                 self.errors.append(("scrollkeeper-dir-exists %s", i))
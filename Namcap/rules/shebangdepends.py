@@ -4,7 +4,10 @@
 """Checks dependencies on programs specified in shebangs."""
 
 import shutil
+import Namcap.membercache
+import Namcap.ownership
 import Namcap.package
+from Namcap import scan
 from Namcap.util import is_script, script_type
 from Namcap.ruleclass import TarballRule
 
@@ -21,10 +24,21 @@ def scanshebangs(fileobj, filename, scripts):
     if not is_script(fileobj):
         return
     # process shebang line
-    cmd = script_type(fileobj)
-    if cmd is not None:
-        assert isinstance(cmd, str)
-        scripts.setdefault(cmd, set()).add(filename)
+    addinterpreter(script_type(fileobj), filename, scripts)
+
+
+def addinterpreter(cmd, filename, scripts):
+    """
+    Stores the interpreter of a script, if script_type() found one.
+
+    Stores
+      scripts -- a dictionary { program => set(scripts) }
+    """
+
+    if cmd is None:
+        return
+    assert isinstance(cmd, str)
+    scripts.setdefault(cmd, set()).add(filename)
 
 
 def findowners(scriptlist):
@@ -39,6 +53,7 @@ def findowners(scriptlist):
     pkglist = {}
     scriptfound = set()
 
+    index = Namcap.ownership.get_index()
     for s in scriptlist:
         out = shutil.which(s)
         if not out:
@@ -46,12 +61,12 @@ def findowners(scriptlist):
 
         # strip leading slash
         scriptpath = out.lstrip("/")
-        for pkg in Namcap.package.get_installed_packages():
-            pkg_files = [fname for fname, fsize, fmode in pkg.files]
-            if scriptpath in pkg_files:
-                pkglist.setdefault(pkg.name, set()).add(s)
-                scriptfound.add(s)
+        for pkgname in index.owners(scriptpath):
+            pkglist.setdefault(pkgname, set()).add(s)
+            scriptfound.add(s)
 
+    # installed packages are reported by name
+    pkglist = dict(sorted(pkglist.items()))
     orphans = list(set(scriptlist) - scriptfound)
     return pkglist, orphans
 
@@ -59,16 +74,17 @@ def findowners(scriptlist):
 class ShebangDependsRule(TarballRule):
     name = "shebangdepends"
     description = "Checks dependencies semi-smartly."
+    member_kinds = frozenset([scan.SCRIPT])
 
-    def analyze(self, pkginfo, tar):
-        scriptlist = {}
+    def __init__(self):
+        super().__init__()
+        self.scriptlist = {}
 
-        for entry in tar:
-            if not entry.isfile():
-                continue
-            f = tar.extractfile(entry)
-            scanshebangs(f, entry.name, scriptlist)
-            f.close()
+    def analyze_member(self, pkginfo, member):
+        addinterpreter(Namcap.membercache.member_script_type(member), member.name, self.scriptlist)
+
+    def finish(self, pkginfo, tar):
+        scriptlist = self.scriptlist
 
         # find packages owning interpreters
         pkglist, orphans = findowners(scriptlist)
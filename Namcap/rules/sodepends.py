@@ -6,57 +6,49 @@
 from collections import defaultdict
 import re
 import os
-import subprocess
+import Namcap.ldcache
+import Namcap.ownership
 import Namcap.package
+from Namcap import scan
 from Namcap.ruleclass import TarballRule
-from Namcap.util import is_elf
-from Namcap.rules.rpath import get_rpaths
-from Namcap.rules.runpath import get_runpaths
 
-from elftools.elf.elffile import ELFFile
-from elftools.elf.dynamic import DynamicSection
 
-libcache = {"i686": {}, "x86-64": {}}
-
-
-def scanlibs(fileobj, filename, custom_libs, liblist, libdepends, libprovides):
+def read_dynamic(elf):
     """
-    Find shared libraries in a file-like binary object
+    Read the dynamic linking information of an ELF file, given its ELFSummary
 
-    If it depends on a library or provides one, store that library's path.
+    Returns the ELF class (32 or 64), the flags of its ABI in the dynamic
+    linker cache, the list of DT_SONAME and the list of DT_NEEDED entries.
     """
+    flags = Namcap.ldcache.elf_cache_flags(elf.elfclass, elf.machine, elf.flags)
+    return elf.elfclass, flags, elf.sonames, elf.needed
 
-    if not is_elf(fileobj):
-        return {}
 
-    elffile = ELFFile(fileobj)
-    for section in elffile.iter_sections():
-        if not isinstance(section, DynamicSection):
-            continue
-        for tag in section.iter_tags():
-            bitsize = elffile.elfclass
-            architecture = {32: "i686", 64: "x86-64"}[bitsize]
-            # DT_SONAME means it provides a library
-            if tag.entry.d_tag == "DT_SONAME" and os.path.dirname(filename) in ["usr/lib", "usr/lib32"]:
-                soname = re.sub(r"\.so.*", ".so", tag.soname)
-                soversion = re.sub(r"^.*\.so\.", "", tag.soname)
-                libprovides[soname + "=" + soversion + "-" + str(bitsize)].add(filename)
-            # DT_NEEDED means shared library
-            if tag.entry.d_tag != "DT_NEEDED":
-                continue
-            libname = tag.needed
+def recordlibs(filename, bitsize, cacheflags, sonames, needed, custom_libs, liblist, libdepends, libprovides):
+    """
+    Store the libraries a file depends on or provides, given its dynamic linking information
+    """
+
+    libcache = Namcap.ldcache.get_ldcache().get(cacheflags, {})
+    # DT_SONAME means it provides a library
+    if os.path.dirname(filename) in ["usr/lib", "usr/lib32"]:
+        for libname in sonames:
             soname = re.sub(r"\.so.*", ".so", libname)
             soversion = re.sub(r"^.*\.so\.", "", libname)
-            if libname in custom_libs:
-                libpath = custom_libs[libname][1:]
-                continue
-            try:
-                libpath = os.path.abspath(libcache[architecture][libname])[1:]
-            except KeyError:
-                # We didn't know about the library, so add it for fail later
-                libpath = libname
-            libdepends[soname + "=" + soversion + "-" + str(bitsize)] = libpath
-            liblist[libpath].add(filename)
+            libprovides[soname + "=" + soversion + "-" + str(bitsize)].add(filename)
+    # DT_NEEDED means shared library
+    for libname in needed:
+        soname = re.sub(r"\.so.*", ".so", libname)
+        soversion = re.sub(r"^.*\.so\.", "", libname)
+        if libname in custom_libs:
+            continue
+        try:
+            libpath = os.path.abspath(libcache[libname])[1:]
+        except KeyError:
+            # We didn't know about the library, so add it for fail later
+            libpath = libname
+        libdepends[soname + "=" + soversion + "-" + str(bitsize)] = libpath
+        liblist[libpath].add(filename)
 
 
 def finddepends(libdepends):
@@ -87,74 +79,61 @@ def finddepends(libdepends):
     # Whether we should even look at a particular file
     is_so = re.compile(r"\.so")
 
-    for pkg in Namcap.package.get_installed_packages():
-        for j, fsize, fmode in pkg.files:
-            if not is_so.search(j):
+    index = Namcap.ownership.get_index()
+    for k in knownlibs:
+        # File must be an exact match or have the right .so ending numbers
+        # i.e. gpm includes libgpm.so and libgpm.so.1.19.0, but everything links to libgpm.so.1
+        # We compare find libgpm.so.1.19.0 startswith libgpm.so.1 and .19.0 matches the regexp
+        for j in index.with_prefix(actualpath[k]):
+            if not is_so.search(j) or not so_end.match(j[len(actualpath[k]) :]):
                 continue
-
-            for k in knownlibs:
-                # File must be an exact match or have the right .so ending numbers
-                # i.e. gpm includes libgpm.so and libgpm.so.1.19.0, but everything links to libgpm.so.1
-                # We compare find libgpm.so.1.19.0 startswith libgpm.so.1 and .19.0 matches the regexp
-                if j == actualpath[k] or (j.startswith(actualpath[k]) and so_end.match(j[len(actualpath[k]) :])):
-                    dependlist[pkg.name].add(libdepends[k])
-                    foundlibs.add(k)
-                    # Check if the dependency can be satisfied by soname
-                    if k in pkg.provides:
-                        libdependlist[k] = pkg.name
-                    else:
-                        missing_provides[k] = pkg.name
-
+            for pkgname in index.owners(j):
+                dependlist[pkgname].add(libdepends[k])
+                foundlibs.add(k)
+                # Check if the dependency can be satisfied by soname
+                if k in Namcap.package.get_installed_package(pkgname).provides:
+                    libdependlist[k] = pkgname
+                else:
+                    missing_provides[k] = pkgname
+
+    # installed packages are reported by name
+    dependlist = defaultdict(set, sorted(dependlist.items()))
     orphans = list(knownlibs - foundlibs)
     return dependlist, libdependlist, orphans, missing_provides
 
 
-def filllibcache():
-    var = subprocess.Popen(
-        "ldconfig -p", env={"LANG": "C"}, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-    ).communicate()
-    libline = re.compile(r"\s*(.*) \((.*)\) => (.*)")
-    for j in var[0].decode("ascii").splitlines():
-        g = libline.match(j)
-        if g is not None:
-            if g.group(2).startswith("libc6,x86-64"):
-                libcache["x86-64"][g.group(1)] = g.group(3)
-            else:
-                # TODO: This is bogus; what do non x86-architectures print?
-                libcache["i686"][g.group(1)] = g.group(3)
-
-
 class SharedLibsRule(TarballRule):
     name = "sodepends"
     description = "Checks dependencies caused by linked shared libraries"
+    member_kinds = frozenset([scan.ELF])
+
+    def __init__(self):
+        super().__init__()
+        # [(filename, rpaths, dynamic linking information)]
+        self.elffiles = []
 
-    def analyze(self, pkginfo, tar):
+    def analyze_member(self, pkginfo, member):
+        # find anything that could be rpath related
+        rpaths = member.elf.rpaths + member.elf.runpaths
+        self.elffiles.append((member.name, rpaths, read_dynamic(member.elf)))
+
+    def finish(self, pkginfo, tar):
         liblist = defaultdict(set)
         libdepends = defaultdict(str)
         libprovides = defaultdict(set)
         dependlist = {}
         libdependlist = {}
         missing_provides = {}
-        filllibcache()
-        os.environ["LC_ALL"] = "C"
         pkg_so_files = ["/" + n for n in tar.getnames() if ".so" in n]
 
-        for entry in tar:
-            if not entry.isfile():
-                continue
-            f = tar.extractfile(entry)
-            # find anything that could be rpath related
+        for filename, rpaths, (bitsize, cacheflags, sonames, needed) in self.elffiles:
             rpath_files = {}
-            if is_elf(f):
-                rpaths = list(get_rpaths(f)) + list(get_runpaths(f))
-                f.seek(0)
-                for n in pkg_so_files:
-                    for rp in rpaths:
-                        rp = os.path.normpath(rp.replace("$ORIGIN", "/" + os.path.dirname(entry.path)))
-                        if os.path.dirname(n) == rp:
-                            rpath_files[os.path.basename(n)] = n
-            scanlibs(f, entry.name, rpath_files, liblist, libdepends, libprovides)
-            f.close()
+            for n in pkg_so_files:
+                for rp in rpaths:
+                    rp = os.path.normpath(rp.replace("$ORIGIN", "/" + os.path.dirname(filename)))
+                    if os.path.dirname(n) == rp:
+                        rpath_files[os.path.basename(n)] = n
+            recordlibs(filename, bitsize, cacheflags, sonames, needed, rpath_files, liblist, libdepends, libprovides)
 
         # Ldd all the files and find all the link and script dependencies
         dependlist, libdependlist, orphans, missing_provides = finddepends(libdepends)
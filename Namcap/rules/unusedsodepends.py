@@ -1,61 +1,268 @@
 # Copyright (C) 2003-2023 Namcap contributors, see AUTHORS for details.
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+"""
+Checks for DT_NEEDED entries no symbol is bound to.
+
+This reproduces what `ldd -r -u` reports, without running the dynamic linker
+on each file: the undefined symbols of a file are looked up in its
+dependencies, in the order the dynamic linker would search them, and the
+direct dependencies providing none of them are unused.
+"""
+
+import mmap
 import os
 import re
-import subprocess
-import tempfile
-from Namcap.util import is_elf
-from Namcap.ruleclass import TarballRule
-
-libre = re.compile(r"^\t(/.*)")
-lddfail = re.compile(r"^\tnot a dynamic executable")
-
-
-def get_unused_sodepends(filename):
-    p = subprocess.Popen(
-        ["ldd", "-r", "-u", filename], env={"LANG": "C"}, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-    )
-    var = p.communicate()
-    if p.returncode == 0:
-        return
-    for j in var[0].decode("ascii").splitlines():
-        # Don't raise an error, as the executable might be a valid ELF file,
-        # just not a dynamically linked one
-        n = lddfail.search(j)
-        if n is not None:
-            return
-
-        n = libre.search(j)
-        if n is not None:
-            yield n.group(1)
+import struct
 
+import Namcap.ldcache
+from Namcap import scan
+from Namcap.ruleclass import PROCESS, TarballRule
+from Namcap.util import PT_INTERP, elf_summary, system_cache
 
-class package(TarballRule):
-    name = "unusedsodepends"
-    description = "Checks for unused dependencies caused by linked shared libraries"
+from elftools.common.exceptions import ELFError
+from elftools.elf.elffile import ELFFile
+from elftools.elf.gnuversions import GNUVerDefSection, GNUVerNeedSection, GNUVerSymSection
+from elftools.elf.sections import SymbolTableSection
 
-    def analyze(self, pkginfo, tar):
-        for entry in tar:
-            if not entry.isfile():
-                continue
+# searched after the cache by the dynamic linker
+default_dirs = ["/lib", "/usr/lib", "/lib64", "/usr/lib64"]
+# sonames of the dynamic linker, which is loaded anyway
+ldso = re.compile(r"^ld(64)?(-linux[^/]*)?\.so\.\d+$")
+
+# Elf32_Sym and Elf64_Sym, without the byte order
+sym_formats = {32: "IIIBBH", 64: "IBBHQQ"}
+SHN_UNDEF = 0
+STB_LOCAL = 0
+STT_OBJECT = 1
+STV_HIDDEN = 2
+STV_INTERNAL = 1
+
+# errors of pyelftools and of the bulk reader of symbol tables on corrupted files
+READ_ERRORS = (ValueError, OverflowError, struct.error, ELFError)
+
+# path => DynamicObject (or None if not a dynamic object) of installed files
+_system_objects = system_cache()
+
+
+class DynamicObject(object):
+    "The symbols and dependencies of an ELF file, as seen by the dynamic linker"
+
+    __slots__ = ("cacheflags", "needed", "rpaths", "runpaths", "defined", "undefined")
+
+    def __init__(self, cacheflags):
+        self.cacheflags = cacheflags
+        self.needed = []
+        self.rpaths = []
+        self.runpaths = []
+        # name => set of versions, None for unversioned definitions
+        self.defined = {}
+        # [(name, version)] of the symbols looked up in the dependencies
+        self.undefined = []
+
+    def defines(self, name, version):
+        "Whether a reference to name with version would be bound to this object"
+        versions = self.defined.get(name)
+        if versions is None:
+            return False
+        return version is None or version in versions or None in versions
+
+
+def symbol_versions(sections):
+    "Returns the names of the versions defined or needed by version sections, by index"
+    versions = {}
+    for section in sections:
+        # pyelftools trusts the counts of entries, corrupted ones would have it
+        # read the same few entries over and over: no entry is under 8 bytes
+        limit = section["sh_size"] // 8
+        if section.num_versions() > limit:
+            raise ELFError("too many entries in %s" % section.name)
+        if isinstance(section, GNUVerNeedSection):
+            for verneed, vernaux_iter in section.iter_versions():
+                if verneed["vn_cnt"] > limit:
+                    raise ELFError("too many entries in %s" % section.name)
+                for vernaux in vernaux_iter:
+                    versions[vernaux["vna_other"]] = vernaux.name
+        elif isinstance(section, GNUVerDefSection):
+            for verdef, verdaux_iter in section.iter_versions():
+                if verdef["vd_cnt"] > limit:
+                    raise ELFError("too many entries in %s" % section.name)
+                # the base version, for unversioned symbols, is named after the file
+                if verdef["vd_ndx"] > 1:
+                    versions[verdef["vd_ndx"]] = next(verdaux_iter).name
+    return versions
+
+
+def read_object(fileobj, elf):
+    """
+    Reads the dynamic symbols and dependencies of an ELF file, given its
+    Namcap.util.ELFSummary
 
-            # is it an ELF file ?
-            f = tar.extractfile(entry)
-            if not is_elf(f):
-                f.close()
+    The dependencies come from the summary, pyelftools only reads the
+    symbol tables.
+    """
+    obj = DynamicObject(Namcap.ldcache.elf_cache_flags(elf.elfclass, elf.machine, elf.flags))
+    obj.needed = elf.needed
+    obj.rpaths = elf.rpaths
+    obj.runpaths = elf.runpaths
+    elffile = ELFFile(fileobj)
+    dynsym = None
+    versym = None
+    versions_sections = []
+    nobits = set()
+    for i, section in enumerate(elffile.iter_sections()):
+        if isinstance(section, SymbolTableSection) and section["sh_type"] == "SHT_DYNSYM":
+            dynsym = section
+        elif isinstance(section, GNUVerSymSection):
+            versym = section
+        elif isinstance(section, (GNUVerDefSection, GNUVerNeedSection)):
+            versions_sections.append(section)
+        elif section["sh_type"] == "SHT_NOBITS":
+            nobits.add(i)
+    if dynsym is None:
+        return obj
+
+    # variables of executables are copied from the libraries defining them
+    executable = elf.has_segment(PT_INTERP)
+    # the symbol tables of large libraries are read in bulk, pyelftools
+    # parsing every symbol into a Container is much slower
+    byteorder = "<" if elffile.little_endian else ">"
+    entry = struct.Struct(byteorder + sym_formats[elffile.elfclass])
+    strtab = elffile.get_section(dynsym["sh_link"]).data()
+    symbols = entry.iter_unpack(dynsym.data()[: dynsym.num_symbols() * entry.size])
+    if versym is not None:
+        versions = symbol_versions(versions_sections)
+        ndxs = struct.unpack("%s%dH" % (byteorder, dynsym.num_symbols()), versym.data()[: 2 * dynsym.num_symbols()])
+    for i, fields in enumerate(symbols):
+        if elffile.elfclass == 32:
+            st_name, st_value, st_size, st_info, st_other, st_shndx = fields
+        else:
+            st_name, st_info, st_other, st_shndx, st_value, st_size = fields
+        if not st_name or st_info >> 4 == STB_LOCAL:
+            continue
+        name = strtab[st_name : strtab.index(b"\0", st_name)].decode("utf-8", "surrogateescape")
+        # VER_NDX_LOCAL and VER_NDX_GLOBAL have no name
+        version = versions.get(ndxs[i] & 0x7FFF) if versym is not None else None
+        if st_shndx == SHN_UNDEF:
+            obj.undefined.append((name, version))
+            continue
+        if st_other & 0x3 in (STV_HIDDEN, STV_INTERNAL):
+            continue
+        obj.defined.setdefault(name, set()).add(version)
+        if executable and st_info & 0xF == STT_OBJECT and st_shndx in nobits:
+            obj.undefined.append((name, version))
+    return obj
+
+
+def system_object(path):
+    "Returns the DynamicObject of an installed file, None if it is not one"
+    path = os.path.realpath(path)
+    if path not in _system_objects:
+        try:
+            with open(path, "rb") as f:
+                elf = elf_summary(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+                _system_objects[path] = read_object(f, elf)
+        except (OSError,) + READ_ERRORS:
+            _system_objects[path] = None
+    return _system_objects[path]
+
+
+def resolve_links(path, links):
+    "Follows the symlinks of the package in an absolute path"
+    for i in range(40):
+        if path not in links:
+            break
+        path = os.path.normpath(os.path.join(os.path.dirname(path), links[path]))
+    return path
+
+
+def find_library(libname, path, obj, packaged, links):
+    """
+    Finds the library the dynamic linker would load for a DT_NEEDED entry of
+    obj, installed at path
+
+    Files of the package are preferred to the installed ones. Returns the path
+    and the DynamicObject of the library, or (None, None) if not found.
+    """
+    if "/" in libname:
+        candidates = [libname]
+    else:
+        origin = os.path.dirname(path)
+        dirs = obj.runpaths if obj.runpaths else obj.rpaths
+        candidates = [os.path.join(d.replace("${ORIGIN}", origin).replace("$ORIGIN", origin), libname) for d in dirs]
+        cached = Namcap.ldcache.get_ldcache().get(obj.cacheflags, {}).get(libname)
+        if cached is not None:
+            candidates.append(cached)
+        candidates.extend(os.path.join(d, libname) for d in default_dirs)
+
+    for candidate in candidates:
+        candidate = os.path.normpath(candidate)
+        target = packaged.get(resolve_links(candidate, links))
+        if target is None:
+            target = system_object(candidate)
+        if target is not None and target.cacheflags == obj.cacheflags:
+            return candidate, target
+    return None, None
+
+
+def get_unused_sodepends(filename, obj, packaged, links):
+    """
+    Yields the paths of the direct dependencies of a file of the package
+    providing none of its undefined symbols
+
+    packaged maps the absolute paths of the ELF files of the package to their
+    DynamicObject, links the absolute paths of its symlinks to their target.
+    """
+    path = "/" + filename
+    direct = []
+    # dependencies in breadth-first order, as searched by the dynamic linker
+    scope = []
+    seen = set()
+    queue = [(path, obj)]
+    for current, current_obj in queue:
+        for libname in current_obj.needed:
+            libpath, target = find_library(libname, current, current_obj, packaged, links)
+            if libpath is None:
                 continue
-            elf = f.read()
-            f.close()
+            if current_obj is obj and not ldso.match(os.path.basename(libpath)):
+                direct.append((libpath, target))
+            if target not in seen:
+                seen.add(target)
+                scope.append((libpath, target))
+                queue.append((libpath, target))
+
+    used = set()
+    for name, version in obj.undefined:
+        for libpath, target in scope:
+            if target.defines(name, version):
+                used.add(target)
+                break
+    for libpath, target in direct:
+        if target not in used:
+            yield libpath
 
-            # write it to a temporary file
-            f = tempfile.NamedTemporaryFile(delete=False)
-            f.write(elf)
-            f.close()
 
-            os.chmod(f.name, 0o755)
+class package(TarballRule):
+    name = "unusedsodepends"
+    description = "Checks for unused dependencies caused by linked shared libraries"
+    member_kinds = frozenset([scan.ELF])
+    concurrency = PROCESS
+
+    def __init__(self):
+        super().__init__()
+        # [(filename, DynamicObject)]
+        self.elffiles = []
 
-            for lib in get_unused_sodepends(f.name):
-                self.warnings.append(("unused-sodepend %s %s", (lib, entry.name)))
+    def analyze_member(self, pkginfo, member):
+        try:
+            self.elffiles.append((member.name, read_object(member.open(), member.elf)))
+        except READ_ERRORS:
+            # like ldd, which reports nothing for broken files
+            pass
 
-            os.unlink(f.name)
+    def finish(self, pkginfo, tar):
+        packaged = {"/" + filename: obj for filename, obj in self.elffiles}
+        links = {"/" + m.name: m.linkname for m in tar.getmembers() if m.issym()}
+        for filename, obj in self.elffiles:
+            for lib in get_unused_sodepends(filename, obj, packaged, links):
+                self.warnings.append(("unused-sodepend %s %s", (lib, filename)))
@@ -0,0 +1,184 @@
+# Copyright (C) 2003-2023 Namcap contributors, see AUTHORS for details.
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""
+Single-pass scan of package tarballs.
+
+Reading members of a compressed package is expensive, as every pass over the
+archive decompresses the whole stream again. The scan engine walks the tarball
+exactly once, classifies each regular file and hands its contents to the rules
+which subscribed to that kind of member (see TarballRule.member_kinds).
+"""
+
+import hashlib
+import io
+
+import Namcap.membercache
+import Namcap.spool
+import Namcap.util
+
+# Member kinds
+ELF = "elf"
+AR = "ar"
+SCRIPT = "script"
+JAVA = "java"
+PYTHON = "python"
+QML = "qml"
+PKGCONFIG = "pkgconfig"
+
+# Longest magic we look for
+HEAD_SIZE = 8
+
+
+def classify(name, head):
+    "Returns the set of kinds of a regular file, from its name and first bytes"
+    kinds = set()
+    if head.startswith(b"\x7fELF"):
+        kinds.add(ELF)
+    elif head.startswith(b"!<arch>\n"):
+        kinds.add(AR)
+    elif head.startswith(b"#!"):
+        kinds.add(SCRIPT)
+    elif head.startswith(b"\xca\xfe\xba\xbe"):
+        kinds.add(JAVA)
+    if name.endswith(".jar"):
+        kinds.add(JAVA)
+    elif name.endswith(".py"):
+        kinds.add(PYTHON)
+    elif name.endswith(".qml"):
+        kinds.add(QML)
+    elif name.endswith(".pc"):
+        kinds.add(PKGCONFIG)
+    return kinds
+
+
+class Member(object):
+    """
+    A regular file of a package along with its kinds and contents
+
+    The contents may be a memoryview of a spooled tarball (see Namcap.spool),
+    they are only copied into bytes for the rules asking for data.
+    """
+
+    __slots__ = ("info", "kinds", "_contents", "_digest", "_elf")
+
+    def __init__(self, info, kinds, data, digest=None):
+        self.info = info
+        self.kinds = kinds
+        self._contents = data
+        self._digest = digest
+        self._elf = None
+
+    def __getstate__(self):
+        # memoryviews cannot be sent to worker processes
+        return self.info, self.kinds, self.data, self._digest, self._elf
+
+    def __setstate__(self, state):
+        self.info, self.kinds, self._contents, self._digest, self._elf = state
+
+    @property
+    def name(self):
+        return self.info.name
+
+    @property
+    def data(self):
+        "The contents of the member, as bytes"
+        if not isinstance(self._contents, bytes):
+            self._contents = bytes(self._contents)
+        return self._contents
+
+    @property
+    def view(self):
+        "A memoryview of the contents of the member, without copying them"
+        return memoryview(self._contents)
+
+    @property
+    def digest(self):
+        "The SHA-256 of the contents, in hexadecimal, from the .MTREE when known"
+        if self._digest is None:
+            self._digest = hashlib.sha256(self.view).hexdigest()
+        return self._digest
+
+    def open(self):
+        "Returns a new file object over the member contents"
+        return io.BytesIO(self.data)
+
+    @property
+    def elf(self):
+        "The Namcap.util.ELFSummary of an ELF member, read once for all the rules"
+        if self._elf is None:
+            self._elf = Namcap.membercache.cached(
+                "elf",
+                self,
+                lambda: Namcap.util.elf_summary(self.view),
+                Namcap.membercache.encode_elf,
+                Namcap.membercache.decode_elf,
+            )
+        return self._elf
+
+
+class MemberList(object):
+    """
+    Stands in for a tarball whose members have all been read already
+
+    Rules running away from the main thread get one of these instead of the
+    TarFile, which can only be read from one place at a time.
+    """
+
+    def __init__(self, members):
+        self._members = list(members)
+
+    def __iter__(self):
+        return iter(self._members)
+
+    def getmembers(self):
+        return list(self._members)
+
+    def getnames(self):
+        return [m.name for m in self._members]
+
+
+def dispatch(pkginfo, rules, member):
+    "Hands a member to the rules subscribed to one of its kinds"
+    for rule in rules:
+        if rule.member_kinds & member.kinds:
+            rule.analyze_member(pkginfo, member)
+
+
+def scan_tarball(pkginfo, tar, rules):
+    """
+    Walks the tarball once and dispatches members to the given rules
+
+    Each rule gets analyze_member() called for every regular file matching
+    one of its member kinds, in archive order, then finish() once the whole
+    archive has been read.
+    """
+    subscribed = [rule for rule in rules if rule.member_kinds]
+    wanted = set().union(*(rule.member_kinds for rule in subscribed))
+
+    digests = {}
+    if wanted and Namcap.membercache.get_cache() is not None:
+        digests = Namcap.membercache.mtree_digests(tar)
+
+    if wanted:
+        for entry in tar:
+            if not entry.isfile():
+                continue
+            view = Namcap.spool.member_view(tar, entry)
+            if view is not None:
+                kinds = classify(entry.name, bytes(view[:HEAD_SIZE]))
+                if kinds & wanted:
+                    dispatch(pkginfo, subscribed, Member(entry, kinds, view, digests.get(entry.name)))
+                continue
+            f = tar.extractfile(entry)
+            head = f.read(HEAD_SIZE)
+            kinds = classify(entry.name, head)
+            if not kinds & wanted:
+                f.close()
+                continue
+            member = Member(entry, kinds, head + f.read(), digests.get(entry.name))
+            f.close()
+            dispatch(pkginfo, subscribed, member)
+
+    for rule in subscribed:
+        rule.finish(pkginfo, tar)
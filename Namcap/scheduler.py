@@ -0,0 +1,253 @@
+# Copyright (C) 2003-2023 Namcap contributors, see AUTHORS for details.
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""
+Concurrent execution of the tarball rules of one package.
+
+Rules declaring a concurrency (see TarballRule.concurrency) run alongside the
+single pass over the tarball: in threads for the ones waiting on subprocesses,
+in forked worker processes for the CPU-bound ones. The tarball itself is only
+read from the main thread, the other rules get the members they subscribed to
+as they are read, then a Namcap.scan.MemberList of the whole archive.
+
+Every rule works on its own view of the package, so that the dependencies it
+detects can be merged back in the order a sequential run would have produced.
+"""
+
+import collections
+import copy
+import multiprocessing
+import queue
+import threading
+import traceback
+
+import Namcap.scan
+from Namcap.ruleclass import PROCESS, THREAD
+
+
+def package_view(pkginfo):
+    "Returns a copy of pkginfo sharing its data, with its own detected_deps"
+    view = copy.copy(pkginfo)
+    view.detected_deps = collections.defaultdict(list)
+    return view
+
+
+class InlineRunner(object):
+    "Runs a rule in the main thread, against the tarball itself"
+
+    def __init__(self, rule, view):
+        self.rule = rule
+        self.view = view
+        self.member_kinds = rule.member_kinds
+
+    def start(self):
+        pass
+
+    def analyze_member(self, pkginfo, member):
+        self.rule.analyze_member(self.view, member)
+
+    def finish(self, pkginfo, tar):
+        self.rule.finish(self.view, tar)
+
+    def end(self, tar, members):
+        if not self.rule.member_kinds:
+            self.rule.analyze(self.view, tar)
+
+    def join(self):
+        pass
+
+    def abort(self):
+        pass
+
+
+class ThreadRunner(object):
+    "Runs a rule in a thread, fed with the members read by the main thread"
+
+    def __init__(self, rule, view):
+        self.rule = rule
+        self.view = view
+        self.member_kinds = rule.member_kinds
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.error = None
+
+    def start(self):
+        self.thread.start()
+
+    def analyze_member(self, pkginfo, member):
+        self.queue.put(member)
+
+    def finish(self, pkginfo, tar):
+        pass
+
+    def end(self, tar, members):
+        self.queue.put(members)
+
+    def run(self):
+        try:
+            item = self.queue.get()
+            while not isinstance(item, Namcap.scan.MemberList):
+                if item is None:
+                    # aborted, see abort()
+                    return
+                self.rule.analyze_member(self.view, item)
+                item = self.queue.get()
+            if self.rule.member_kinds:
+                self.rule.finish(self.view, item)
+            else:
+                self.rule.analyze(self.view, item)
+        except BaseException as e:
+            self.error = e
+
+    def join(self):
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def abort(self):
+        "Stops the thread without running the rule any further"
+        self.queue.put(None)
+        self.thread.join()
+
+
+def run_in_process(conn, rules, views):
+    "Entry point of the worker processes, sends back the results of the rules"
+    try:
+        item = conn.recv()
+        while not isinstance(item, Namcap.scan.MemberList):
+            if item is None:
+                # aborted, see ProcessRunner.abort()
+                conn.close()
+                return
+            for rule, view in zip(rules, views):
+                if rule.member_kinds & item.kinds:
+                    rule.analyze_member(view, item)
+            item = conn.recv()
+        for rule, view in zip(rules, views):
+            if rule.member_kinds:
+                rule.finish(view, item)
+            else:
+                rule.analyze(view, item)
+        results = [
+            (rule.errors, rule.warnings, rule.infos, dict(view.detected_deps)) for rule, view in zip(rules, views)
+        ]
+    except BaseException:
+        conn.send(traceback.format_exc())
+    else:
+        conn.send(results)
+    conn.close()
+
+
+class ProcessRunner(object):
+    "Runs rules in a forked process, sending it the members they subscribed to"
+
+    def __init__(self, context, rules, views):
+        self.rules = rules
+        self.views = views
+        self.member_kinds = frozenset().union(*(rule.member_kinds for rule in rules))
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=run_in_process, args=(child_conn, rules, views), daemon=True)
+
+    def start(self):
+        self.process.start()
+
+    def send(self, item):
+        try:
+            self.conn.send(item)
+        except BrokenPipeError:
+            # the worker failed, its error is reported by join()
+            pass
+
+    def analyze_member(self, pkginfo, member):
+        if Namcap.scan.ELF in member.kinds & self.member_kinds:
+            # read once here, and sent along with the member, rather than
+            # again in each worker process
+            try:
+                member.elf
+            except Exception:
+                # the rules get the error when they read it themselves
+                pass
+        self.send(member)
+
+    def finish(self, pkginfo, tar):
+        pass
+
+    def end(self, tar, members):
+        self.send(members)
+
+    def join(self):
+        try:
+            results = self.conn.recv()
+        except EOFError:
+            results = "worker process exited with code %s\n" % self.process.exitcode
+        self.process.join()
+        if isinstance(results, str):
+            raise RuntimeError("Error running rules %s:\n%s" % (", ".join(r.name for r in self.rules), results))
+        for rule, view, (errors, warnings, infos, detected_deps) in zip(self.rules, self.views, results):
+            rule.errors, rule.warnings, rule.infos = errors, warnings, infos
+            view.detected_deps.update(detected_deps)
+
+    def abort(self):
+        "Stops the worker process without running the rules any further"
+        self.send(None)
+        self.process.join()
+        self.conn.close()
+
+
+def fork_context():
+    "Returns the multiprocessing context used for worker processes, None if fork is not available"
+    if "fork" not in multiprocessing.get_all_start_methods():
+        return None
+    return multiprocessing.get_context("fork")
+
+
+def run_rules(pkginfo, tar, rules, jobs=1):
+    """
+    Runs tarball rules over a package, using up to jobs worker processes
+
+    The messages are left in the rules, and the dependencies they detected are
+    added to pkginfo.detected_deps, as if the rules had been run one by one.
+    """
+    views = [package_view(pkginfo) for rule in rules]
+    context = fork_context() if jobs > 1 else None
+
+    runners = []
+    forked = []
+    for rule, view in zip(rules, views):
+        if jobs > 1 and rule.concurrency == PROCESS and context is not None:
+            forked.append((rule, view))
+        elif jobs > 1 and rule.concurrency in (THREAD, PROCESS):
+            runners.append(ThreadRunner(rule, view))
+        else:
+            runners.append(InlineRunner(rule, view))
+    # share the forked rules between the processes, round-robin
+    nprocs = min(jobs, len(forked))
+    for i in range(nprocs):
+        group = forked[i::nprocs]
+        runners.append(ProcessRunner(context, [r for r, v in group], [v for r, v in group]))
+
+    started = []
+    try:
+        # fork before starting any thread
+        for runner in sorted(runners, key=lambda r: not isinstance(r, ProcessRunner)):
+            runner.start()
+            started.append(runner)
+
+        Namcap.scan.scan_tarball(pkginfo, tar, [r for r in runners if r.member_kinds])
+        members = None
+        if any(not isinstance(r, InlineRunner) for r in runners):
+            members = Namcap.scan.MemberList(tar.getmembers())
+    except BaseException:
+        # a broken tarball: do not leave threads and processes waiting for members
+        for runner in started:
+            runner.abort()
+        raise
+    for runner in runners:
+        runner.end(tar, members)
+    for runner in runners:
+        runner.join()
+
+    # the scan finishes the rules reading members before the others get to run
+    for rule, view in sorted(zip(rules, views), key=lambda rv: not rv[0].member_kinds):
+        for dep, reasons in view.detected_deps.items():
+            pkginfo.detected_deps.setdefault(dep, []).extend(reasons)
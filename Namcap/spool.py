@@ -0,0 +1,198 @@
+# Copyright (C) 2003-2023 Namcap contributors, see AUTHORS for details.
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+"""
+Memory-mapped, uncompressed copies of package tarballs.
+
+A TarFile over a compressed stream has to decompress it again from the start
+whenever a member before the current position is read. Packages are instead
+decompressed once into an anonymous temporary file under $TMPDIR, which is
+mapped: seeking to any member is free, and the contents of regular members
+can be handed out as memoryviews of the mapping without copying them. The
+file lives on disk rather than in memory, so that checking large packages
+in parallel does not need their whole uncompressed size in RAM.
+
+The compression is recognized from the magic bytes of the file, whatever
+its name. Each format has a list of decoders, tried in order: Python
+modules, streamed in-process, and the command line tools makepkg compresses
+packages with, streamed through a pipe. xz decodes with several threads
+when the xz tool is recent enough.
+"""
+
+import bz2
+import gzip
+import lzma
+import mmap
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+# size of the copies from the decompressed stream to the spool
+CHUNK_SIZE = 1 << 20
+
+# where uncompressed tarballs have their magic bytes
+TAR_MAGIC_START = 257
+TAR_MAGIC_END = 262
+
+# magic bytes => compression
+MAGICS = [
+    (b"\x28\xb5\x2f\xfd", "zstd"),
+    (b"\xfd7zXZ\x00", "xz"),
+    (b"\x1f\x8b", "gzip"),
+    (b"BZh", "bzip2"),
+    (b"\x04\x22\x4d\x18", "lz4"),
+    (b"LZIP", "lzip"),
+    (b"\x89LZO\x00\r\n\x1a\n", "lzop"),
+    (b"LRZI", "lrzip"),
+    (b"\x1f\x9d", "compress"),
+]
+
+
+def _open_zstd(fileobj):
+    if zstandard is None:
+        return None
+    return zstandard.ZstdDecompressor().stream_reader(fileobj, read_size=CHUNK_SIZE)
+
+
+def _open_lz4(fileobj):
+    if lz4 is None:
+        return None
+    return lz4.frame.LZ4FrameFile(fileobj)
+
+
+# compression => decoders, tried in order: functions returning a file object
+# over the decompressed stream (None if unavailable), or commands writing it
+# to their standard output when given the file name
+DECODERS = {
+    "zstd": [_open_zstd, ["zstd", "-dcfq"]],
+    "xz": [["xz", "-dcfq", "-T0"], lambda f: lzma.LZMAFile(f)],
+    "gzip": [lambda f: gzip.GzipFile(fileobj=f)],
+    "bzip2": [lambda f: bz2.BZ2File(f)],
+    "lz4": [_open_lz4, ["lz4", "-dcfq"]],
+    "lzip": [["lzip", "-dcfq"]],
+    "lzop": [["lzop", "-dcf"]],
+    "lrzip": [["lrzip", "-dcfq", "-o", "-"]],
+    "compress": [["gzip", "-dcf"]],
+}
+
+# errors of the Python decoders on corrupted data
+DECODER_ERRORS = (OSError, EOFError, lzma.LZMAError, zlib.error)
+if zstandard is not None:
+    DECODER_ERRORS += (zstandard.ZstdError,)
+if lz4 is not None:
+    DECODER_ERRORS += (RuntimeError,)
+
+
+def compression(fileobj):
+    "Returns the compression of a file from its magic bytes, None if it is not compressed"
+    head = fileobj.read(16)
+    fileobj.seek(0)
+    for magic, name in MAGICS:
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def is_tarball(filename):
+    "Whether a file starts like a tarball, compressed or not, from its magic bytes"
+    try:
+        with open(filename, "rb") as f:
+            if compression(f) is not None:
+                return True
+            return f.read(TAR_MAGIC_END)[TAR_MAGIC_START:] == b"ustar"
+    except OSError:
+        return False
+
+
+def _map(fileobj):
+    "Maps a whole file in memory, read-only"
+    try:
+        return mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+        # mmap refuses empty files
+        raise tarfile.ReadError("empty file")
+
+
+def _spool_file():
+    "Returns an anonymous file to decompress a package into"
+    return tempfile.TemporaryFile(prefix="namcap.")
+
+
+def _run_decoder(command, filename, spool):
+    "Decompresses a file into spool with a command, False if the command is missing"
+    if shutil.which(command[0]) is None:
+        return False
+    # stderr goes to a file, so that a decoder printing many warnings cannot
+    # block while its output is read
+    with tempfile.TemporaryFile() as errors:
+        with subprocess.Popen(
+            command + ["--", filename], stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=errors
+        ) as process:
+            shutil.copyfileobj(process.stdout, spool, CHUNK_SIZE)
+        if process.returncode != 0:
+            errors.seek(0)
+            error = errors.read().decode("utf-8", "replace").strip()
+            raise tarfile.ReadError("%s failed: %s" % (command[0], error))
+    return True
+
+
+def decompress(filename, fileobj, name, spool):
+    "Decompresses an open file compressed with name into spool"
+    for decoder in DECODERS[name]:
+        if isinstance(decoder, list):
+            if _run_decoder(decoder, filename, spool):
+                return
+            continue
+        stream = decoder(fileobj)
+        if stream is None:
+            continue
+        try:
+            with stream:
+                shutil.copyfileobj(stream, spool, CHUNK_SIZE)
+        except DECODER_ERRORS as e:
+            raise tarfile.ReadError("invalid %s data: %s" % (name, e))
+        return
+    raise tarfile.CompressionError("no %s decoder available" % name)
+
+
+def open_spooled(filename):
+    """
+    Opens a package tarball through a memory-mapped, uncompressed spool
+
+    Uncompressed tarballs are mapped directly. Raises tarfile.TarError if
+    the file is not a valid tarball, OSError if it cannot be read.
+    """
+    with open(filename, "rb") as f:
+        name = compression(f)
+        if name is None:
+            mapping = _map(f)
+        else:
+            with _spool_file() as spool:
+                decompress(filename, f, name, spool)
+                spool.flush()
+                mapping = _map(spool)
+    # the mapping stays valid once the files are closed, and is released
+    # along with the last memoryview of it
+    return tarfile.open(fileobj=mapping, mode="r:")
+
+
+def member_view(tar, info):
+    """
+    Returns a memoryview of the contents of a regular member of a spooled
+    tarball, None if the tarball is not memory-mapped
+    """
+    if not isinstance(getattr(tar, "fileobj", None), mmap.mmap) or info.issparse():
+        return None
+    return memoryview(tar.fileobj)[info.offset_data : info.offset_data + info.size]
@@ -4,7 +4,7 @@
 import os
 from unittest.mock import patch
 
-from Namcap.package import pyalpm_handle
+from Namcap.package import get_handle
 from Namcap.tests.makepkg import MakepkgTest
 import Namcap.rules.qmldepends
 
@@ -15,7 +15,7 @@ class _DbWithout:
 
     def __init__(self, pkgname):
         self.pkgcache = [
-            alpmPackage for alpmPackage in pyalpm_handle.get_localdb().pkgcache if alpmPackage.name != pkgname
+            alpmPackage for alpmPackage in get_handle().get_localdb().pkgcache if alpmPackage.name != pkgname
         ]
 
 
@@ -24,7 +24,7 @@ class _AlpmWithout:
     package is not installed locally, even if it really is."""
 
     def __init__(self, pkgname):
-        self.load_pkg = pyalpm_handle.load_pkg
+        self.load_pkg = get_handle().load_pkg
         self.localdb = _DbWithout(pkgname)
 
     def get_localdb(self):
@@ -22,10 +22,12 @@ build() {
   cd "${srcdir}"
   echo -e "#! /usr/bin/env python\nprint('a script')" > python_sample
   echo -e "#!/bin\\xffary/da\\x00ta\ncrash?" > binary_sample
+  echo -e "#!bash\necho 'no path'" > pathless_sample
 }
 package() {
   install -Dm755 "$srcdir/python_sample" "$pkgdir/usr/bin/python_sample"
   install -Dm755 "$srcdir/binary_sample" "$pkgdir/usr/share/binary_sample"
+  install -Dm755 "$srcdir/pathless_sample" "$pkgdir/usr/bin/pathless_sample"
 }
 """
 
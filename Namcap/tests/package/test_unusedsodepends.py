@@ -2,8 +2,15 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
 
 import os
+import struct
+import sys
+import tarfile
+import unittest
 from Namcap.tests.makepkg import MakepkgTest
 import Namcap.rules.unusedsodepends
+import Namcap.scan
+
+from elftools.elf.elffile import ELFFile
 
 
 class UnusedSodependsTest(MakepkgTest):
@@ -38,3 +45,76 @@ package() {
         self.assertEqual(r.errors, [])
         self.assertEqual(r.warnings, [("unused-sodepend %s %s", ("/usr/lib/libm.so.6", "usr/bin/evilprogram"))])
         self.assertEqual(r.infos, [])
+
+
+class SymbolBindingTest(unittest.TestCase):
+    def make_object(self, needed=(), defined=(), undefined=()):
+        obj = Namcap.rules.unusedsodepends.DynamicObject(0x303)
+        obj.needed = list(needed)
+        for name, version in defined:
+            obj.defined.setdefault(name, set()).add(version)
+        obj.undefined = list(undefined)
+        return obj
+
+    def test_unused(self):
+        packaged = {
+            "/usr/lib/libfoo.so.1": self.make_object(needed=["libbar.so.1"], defined=[("foo", "FOO_1")]),
+            "/usr/lib/libbar.so.1": self.make_object(defined=[("bar", None)]),
+            "/usr/lib/libbaz.so.1": self.make_object(defined=[("foo", None)]),
+        }
+        links = {"/usr/lib/libfoo.so": "libfoo.so.1"}
+        binary = self.make_object(needed=["libfoo.so.1", "libbaz.so.1", "libbar.so.1"], undefined=[("foo", None)])
+        unused = Namcap.rules.unusedsodepends.get_unused_sodepends("usr/bin/foo", binary, packaged, links)
+        # foo is bound to the first library defining it
+        self.assertEqual(list(unused), ["/usr/lib/libbaz.so.1", "/usr/lib/libbar.so.1"])
+
+    def test_versions(self):
+        packaged = {
+            "/usr/lib/libfoo.so.1": self.make_object(defined=[("foo", "FOO_2")]),
+            "/usr/lib/libbaz.so.1": self.make_object(defined=[("foo", "FOO_1")]),
+        }
+        binary = self.make_object(needed=["libfoo.so.1", "libbaz.so.1"], undefined=[("foo", "FOO_1")])
+        unused = Namcap.rules.unusedsodepends.get_unused_sodepends("usr/bin/foo", binary, packaged, {})
+        self.assertEqual(list(unused), ["/usr/lib/libfoo.so.1"])
+
+
+class CorruptedObjectTest(unittest.TestCase):
+    def corrupted_member(self):
+        "Returns a member holding a copy of the Python interpreter whose last dynamic symbol has no name"
+        with open(os.path.realpath(sys.executable), "rb") as f:
+            data = bytearray(f.read())
+            dynsym = ELFFile(f).get_section_by_name(".dynsym")
+        order = "<" if data[5] == 1 else ">"
+        # st_name comes first in Elf32_Sym and Elf64_Sym
+        offset = dynsym["sh_offset"] + dynsym["sh_size"] - dynsym["sh_entsize"]
+        struct.pack_into(order + "I", data, offset, 0xFFFFFF00)
+        return Namcap.scan.Member(tarfile.TarInfo("usr/bin/python"), {Namcap.scan.ELF}, bytes(data))
+
+    def test_corrupted(self):
+        member = self.corrupted_member()
+        with self.assertRaises(ValueError):
+            Namcap.rules.unusedsodepends.read_object(member.open(), member.elf)
+        rule = Namcap.rules.unusedsodepends.package()
+        rule.analyze_member(None, member)
+        self.assertEqual(rule.elffiles, [])
+
+    def test_version_count(self):
+        with open(os.path.realpath(sys.executable), "rb") as f:
+            data = bytearray(f.read())
+            elffile = ELFFile(f)
+            index = next(i for i, section in enumerate(elffile.iter_sections()) if section.name == ".gnu.version_r")
+            header = elffile["e_shoff"] + index * elffile["e_shentsize"]
+        # sh_info, the number of entries, much larger than the section
+        order = "<" if data[5] == 1 else ">"
+        struct.pack_into(order + "I", data, header + (44 if data[4] == 2 else 28), 0x340001)
+        member = Namcap.scan.Member(tarfile.TarInfo("usr/bin/python"), {Namcap.scan.ELF}, bytes(data))
+        rule = Namcap.rules.unusedsodepends.package()
+        rule.analyze_member(None, member)
+        self.assertEqual(rule.elffiles, [])
+
+    def test_truncated(self):
+        member = self.corrupted_member()
+        truncated = Namcap.scan.Member(member.info, member.kinds, member.data[: len(member.data) // 2])
+        rule = Namcap.rules.unusedsodepends.package()
+        rule.analyze_member(None, truncated)
+        self.assertEqual(rule.elffiles, [])
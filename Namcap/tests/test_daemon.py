@@ -0,0 +1,115 @@
+# Copyright (C) 2003-2023 Namcap contributors, see AUTHORS for details.
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import io
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import unittest
+import unittest.mock
+
+import Namcap.daemon
+
+
+def run(argv):
+    "Stands for namcap.main()"
+    if argv[0] == "fail":
+        raise ValueError("broken rule")
+    if argv[0] == "exit":
+        sys.exit(int(argv[1]))
+    print("cwd %s tty %s" % (os.getcwd(), sys.stdout.isatty()))
+    print("warning", file=sys.stderr)
+    print(" ".join(argv))
+
+
+class DaemonTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "namcap.sock")
+        self.refreshed = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def refresh(self):
+        self.refreshed += 1
+
+    def start(self):
+        server = Namcap.daemon.Server(self.path, run, self.refresh)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+
+        def stop():
+            server.shutdown()
+            thread.join()
+            server.server_close()
+
+        self.addCleanup(stop)
+        return server
+
+    def submit(self, argv):
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        status = Namcap.daemon.submit(self.path, argv, stdout, stderr)
+        return status, stdout.getvalue(), stderr.getvalue()
+
+    def test_submit(self):
+        self.start()
+        status, stdout, stderr = self.submit(["-i", "foo.pkg.tar.zst"])
+        self.assertEqual(status, 0)
+        self.assertEqual(stdout, "cwd %s tty False\n-i foo.pkg.tar.zst\n" % os.getcwd())
+        self.assertEqual(stderr, "warning\n")
+        self.submit(["bar.pkg.tar.zst"])
+        self.assertEqual(self.refreshed, 2)
+
+    def test_exit_status(self):
+        self.start()
+        self.assertEqual(self.submit(["exit", "2"]), (2, "", ""))
+        status, stdout, stderr = self.submit(["fail"])
+        self.assertEqual(status, 1)
+        self.assertIn("ValueError: broken rule", stderr)
+        # the server keeps going
+        self.assertEqual(self.submit(["exit", "0"]), (0, "", ""))
+
+    def test_socket(self):
+        # left behind by a server which was killed
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.bind(self.path)
+        self.start()
+        with self.assertRaises(OSError):
+            Namcap.daemon.Server(self.path, run)
+        self.assertEqual(self.submit(["exit", "0"])[0], 0)
+
+    def test_not_socket(self):
+        with open(self.path, "w") as f:
+            f.write("data\n")
+        with self.assertRaisesRegex(OSError, "not a socket"):
+            Namcap.daemon.Server(self.path, run)
+        with open(self.path) as f:
+            self.assertEqual(f.read(), "data\n")
+
+    def test_permissions(self):
+        server = self.start()
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o600)
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(self.path)
+            self.assertTrue(server.verify_request(sock, None))
+            # requests of other users are dropped
+            with unittest.mock.patch("Namcap.daemon.peer_uid", return_value=os.getuid() + 1):
+                self.assertFalse(server.verify_request(sock, None))
+        with unittest.mock.patch("os.getuid", return_value=os.getuid() + 1):
+            with self.assertRaisesRegex(OSError, "another user"):
+                self.submit(["exit", "0"])
+
+    def test_default_socket(self):
+        with unittest.mock.patch.dict(os.environ, {"XDG_RUNTIME_DIR": "/run/user/1000"}):
+            os.environ.pop("NAMCAP_SOCKET", None)
+            self.assertEqual(Namcap.daemon.default_socket(), "/run/user/1000/namcap.sock")
+            os.environ["NAMCAP_SOCKET"] = self.path
+            self.assertEqual(Namcap.daemon.default_socket(), self.path)
+            del os.environ["NAMCAP_SOCKET"]
+            del os.environ["XDG_RUNTIME_DIR"]
+            self.assertIsNone(Namcap.daemon.default_socket())
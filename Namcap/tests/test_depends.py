@@ -2,6 +2,7 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
 
 import unittest
+import unittest.mock
 import Namcap.depends
 import Namcap.package
 
@@ -44,3 +45,37 @@ class DependsTests(unittest.TestCase):
         self.assertEqual(e, [])
         self.assertEqual(w, [])
         # info is verbose and beyond scope, skip it
+
+
+class ClosureTests(unittest.TestCase):
+    def setUp(self):
+        self.graph = {
+            "a": ["b", "c"],
+            "b": ["c"],
+            "c": ["a", "d"],
+            "d": [],
+        }
+        self.loaded = []
+        Namcap.depends._installed.clear()
+        Namcap.depends._closures.clear()
+        patcher = unittest.mock.patch("Namcap.package.load_from_db", side_effect=self.load_from_db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(Namcap.depends._installed.clear)
+        self.addCleanup(Namcap.depends._closures.clear)
+
+    def load_from_db(self, pkgname):
+        self.loaded.append(pkgname)
+        if pkgname not in self.graph:
+            return None
+        return Namcap.package.PacmanPackage({"name": pkgname, "depends": self.graph[pkgname], "provides": []})
+
+    def test_cycle(self):
+        self.assertEqual(Namcap.depends.single_covered("a"), {"b", "c", "d"})
+        self.assertEqual(Namcap.depends.single_covered("d"), set())
+        self.assertEqual(Namcap.depends.getcovered(["c", "missing"]), {"a", "b", "d"})
+
+    def test_loaded_once(self):
+        Namcap.depends.getcovered(["a", "b", "c"])
+        Namcap.depends.getcovered(["b", "d"])
+        self.assertEqual(sorted(self.loaded), ["a", "b", "c", "d"])
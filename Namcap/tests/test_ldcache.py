@@ -0,0 +1,91 @@
+# Copyright (C) 2003-2023 Namcap contributors, see AUTHORS for details.
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import struct
+import unittest
+
+import Namcap.ldcache
+from Namcap.ldcache import FLAG_ELF_LIBC6, FLAG_X8664_LIB64
+
+X86_64 = FLAG_X8664_LIB64 | FLAG_ELF_LIBC6
+
+
+def strings_table(entries, base):
+    "Returns the string table for entries and the offsets of their strings, from base"
+    table = b""
+    offsets = []
+    for flags, name, path, hwcap in entries:
+        key = base + len(table)
+        table += name.encode() + b"\0"
+        value = base + len(table)
+        table += path.encode() + b"\0"
+        offsets.append((key, value))
+    return table, offsets
+
+
+def new_cache(entries, endian="<"):
+    "Builds a glibc format cache from (flags, name, path, hwcap)"
+    header_size = len(Namcap.ldcache.NEW_MAGIC) + struct.calcsize(endian + Namcap.ldcache.NEW_HEADER)
+    entry = struct.Struct(endian + Namcap.ldcache.NEW_ENTRY)
+    table, offsets = strings_table(entries, header_size + len(entries) * entry.size)
+    data = Namcap.ldcache.NEW_MAGIC
+    endianflag = Namcap.ldcache.ENDIAN_BIG if endian == ">" else 2
+    data += struct.pack(endian + Namcap.ldcache.NEW_HEADER, len(entries), len(table), endianflag, 0)
+    for (flags, name, path, hwcap), (key, value) in zip(entries, offsets):
+        data += entry.pack(flags, key, value, 0, hwcap)
+    return data + table
+
+
+def old_cache(entries):
+    "Builds an old format cache from (flags, name, path, hwcap)"
+    table, offsets = strings_table(entries, 0)
+    data = Namcap.ldcache.OLD_HEADER.pack(Namcap.ldcache.OLD_MAGIC, len(entries))
+    for (flags, name, path, hwcap), (key, value) in zip(entries, offsets):
+        data += Namcap.ldcache.OLD_ENTRY.pack(flags, key, value)
+    return data + table
+
+
+class LdCacheTests(unittest.TestCase):
+    entries = [
+        (X86_64, "libfoo.so.1", "/usr/lib/glibc-hwcaps/x86-64-v3/libfoo.so.1", 2),
+        (X86_64, "libfoo.so.1", "/usr/lib/libfoo.so.1", 0),
+        (FLAG_ELF_LIBC6, "libfoo.so.1", "/usr/lib32/libfoo.so.1", 0),
+        (X86_64, "libbar.so", "/usr/lib/libbar.so", 0),
+    ]
+    expected = {
+        X86_64: {"libfoo.so.1": "/usr/lib/libfoo.so.1", "libbar.so": "/usr/lib/libbar.so"},
+        FLAG_ELF_LIBC6: {"libfoo.so.1": "/usr/lib32/libfoo.so.1"},
+    }
+
+    def test_new_format(self):
+        self.assertEqual(Namcap.ldcache.parse_ldcache(new_cache(self.entries)), self.expected)
+
+    def test_big_endian(self):
+        self.assertEqual(Namcap.ldcache.parse_ldcache(new_cache(self.entries, ">")), self.expected)
+
+    def test_old_format(self):
+        entries = [e for e in self.entries if not e[3]]
+        self.assertEqual(Namcap.ldcache.parse_ldcache(old_cache(entries)), self.expected)
+
+    def test_compat_format(self):
+        # the old format entries share the string table of the new format
+        data = Namcap.ldcache.OLD_HEADER.pack(Namcap.ldcache.OLD_MAGIC, 1)
+        data += Namcap.ldcache.OLD_ENTRY.pack(FLAG_ELF_LIBC6, 0, 0)
+        data += b"\0" * (-len(data) % Namcap.ldcache.NEW_ALIGN)
+        self.assertEqual(Namcap.ldcache.parse_ldcache(data + new_cache(self.entries)), self.expected)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            Namcap.ldcache.parse_ldcache(b"garbage")
+
+    def test_elf_cache_flags(self):
+        self.assertEqual(Namcap.ldcache.elf_cache_flags(64, Namcap.ldcache.EM_X86_64, 0), X86_64)
+        self.assertEqual(Namcap.ldcache.elf_cache_flags(32, 3, 0), FLAG_ELF_LIBC6)
+        self.assertEqual(
+            Namcap.ldcache.elf_cache_flags(64, Namcap.ldcache.EM_AARCH64, 0),
+            Namcap.ldcache.FLAG_AARCH64_LIB64 | FLAG_ELF_LIBC6,
+        )
+        self.assertEqual(
+            Namcap.ldcache.elf_cache_flags(32, Namcap.ldcache.EM_ARM, 0x5000400),
+            Namcap.ldcache.FLAG_ARM_LIBHF | FLAG_ELF_LIBC6,
+        )
@@ -0,0 +1,90 @@
+# Copyright (C) 2003-2023 Namcap contributors, see AUTHORS for details.
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import gzip
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+
+import Namcap.membercache
+import Namcap.scan
+import Namcap.util
+from Namcap.tests.test_scan import make_tarball
+
+
+class MemberCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, "members.sqlite")
+
+    def tearDown(self):
+        Namcap.membercache._cache = None
+        shutil.rmtree(self.tmpdir)
+
+    def test_roundtrip(self):
+        compute = unittest.mock.Mock(return_value=["sys", "gi.repository.Gtk"])
+        cache = Namcap.membercache.MemberCache(self.filename)
+        self.assertEqual(cache.get("pyimports", "abc", compute), ["sys", "gi.repository.Gtk"])
+        self.assertEqual(cache.get("pyimports", "abc", compute), ["sys", "gi.repository.Gtk"])
+        self.assertEqual(compute.call_count, 1)
+        cache.flush()
+        cache = Namcap.membercache.MemberCache(self.filename)
+        self.assertEqual(cache.get("pyimports", "abc", compute), ["sys", "gi.repository.Gtk"])
+        self.assertEqual(compute.call_count, 1)
+        cache.get("shebang", "abc", compute)
+        self.assertEqual(compute.call_count, 2)
+
+    def test_unwritable(self):
+        filename = os.path.join(self.tmpdir, "file", "members.sqlite")
+        open(os.path.dirname(filename), "w").close()
+        Namcap.membercache.enable(filename)
+        self.assertIsNone(Namcap.membercache.get_cache())
+        with unittest.mock.patch.dict(os.environ, {"XDG_CACHE_HOME": os.path.join(self.tmpdir, "file")}):
+            Namcap.membercache.enable()
+        self.assertIsNone(Namcap.membercache.get_cache())
+
+    def test_sources_changed(self):
+        cache = Namcap.membercache.MemberCache(self.filename)
+        cache.get("shebang", "abc", lambda: "python")
+        cache.flush()
+        with unittest.mock.patch("Namcap.membercache.source_digest", return_value="other"):
+            cache = Namcap.membercache.MemberCache(self.filename)
+        compute = unittest.mock.Mock(return_value="perl")
+        self.assertEqual(cache.get("shebang", "abc", compute), "perl")
+        compute.assert_called_once_with()
+
+    def test_elf(self):
+        elf = Namcap.util.ELFSummary(64, True, 3, 62, 0)
+        elf.needed = ["libc.so.6"]
+        elf.segments = [(1, 5), (0x6474E551, 6)]
+        elf.x86_features = 3
+        Namcap.membercache.enable(self.filename)
+        member = Namcap.scan.Member(None, {Namcap.scan.ELF}, b"\x7fELF", "abc")
+        encode = Namcap.membercache.encode_elf
+        decode = Namcap.membercache.decode_elf
+        Namcap.membercache.cached("elf", member, lambda: elf, encode, decode)
+        Namcap.membercache.flush()
+        Namcap.membercache.enable(self.filename)
+        cached = Namcap.membercache.cached("elf", member, None, encode, decode)
+        for field in Namcap.util.ELFSummary.__slots__:
+            self.assertEqual(getattr(cached, field), getattr(elf, field))
+        self.assertTrue(cached.has_segment(0x6474E551))
+
+    def test_disabled(self):
+        member = Namcap.scan.Member(None, {Namcap.scan.PYTHON}, b"import sys\n")
+        compute = unittest.mock.Mock(return_value="value")
+        Namcap.membercache.cached("pyimports", member, compute)
+        Namcap.membercache.cached("pyimports", member, compute)
+        self.assertEqual(compute.call_count, 2)
+        self.assertEqual(member.digest, hashlib.sha256(b"import sys\n").hexdigest())
+
+    def test_mtree_digests(self):
+        mtree = b"#mtree\n/set type=file uid=0 gid=0 mode=644\n./.PKGINFO size=10\n./usr type=dir mode=755\n"
+        mtree += b"./usr/bin/foo mode=755 sha256digest=0123abcd\n"
+        tar = make_tarball({".MTREE": gzip.compress(mtree), "usr/bin/foo": b"#!/bin/sh\n"})
+        self.assertEqual(Namcap.membercache.mtree_digests(tar), {"usr/bin/foo": "0123abcd"})
+        self.assertEqual(Namcap.membercache.mtree_digests(make_tarball({"usr/bin/foo": b""})), {})
+        self.assertEqual(Namcap.membercache.mtree_digests(make_tarball({".MTREE": b"garbage"})), {})
@@ -0,0 +1,48 @@
+# Copyright (C) 2003-2023 Namcap contributors, see AUTHORS for details.
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import unittest
+
+from Namcap.nameindex import NameIndex, name_index
+from Namcap.tests.test_scan import make_tarball
+
+
+class NameIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.index = NameIndex(
+            [
+                "usr/lib/libfoo.la",
+                "usr/lib",
+                "usr/share/mime/globs",
+                "usr/lib/libbar.la",
+                "usr/share/applications/foo.desktop",
+                "usr/share/mime",
+            ]
+        )
+
+    def test_lookups(self):
+        self.assertIn("usr/share/mime", self.index)
+        self.assertNotIn("usr/share", self.index)
+        self.assertEqual(self.index.with_extension("la"), ["usr/lib/libfoo.la", "usr/lib/libbar.la"])
+        self.assertEqual(self.index.with_basename("globs"), ["usr/share/mime/globs"])
+        self.assertEqual(self.index.listdir("usr/lib/"), ["usr/lib/libfoo.la", "usr/lib/libbar.la"])
+        self.assertEqual(
+            self.index.ordered(["usr/share/mime", "usr/share/mime/aliases", "usr/lib"]), ["usr/lib", "usr/share/mime"]
+        )
+
+    def test_prefix(self):
+        self.assertEqual(
+            self.index.with_prefix("usr/share/"),
+            ["usr/share/mime/globs", "usr/share/applications/foo.desktop", "usr/share/mime"],
+        )
+        self.assertEqual(self.index.with_prefix("opt/"), [])
+
+    def test_search(self):
+        patterns = [r"^usr/share/mime$", r"^usr/share/applications/.*\.desktop$", r"^opt/", r"\.la$", r"^usr/lib/"]
+        self.assertEqual(self.index.search(patterns), {0, 1, 3, 4})
+        self.assertEqual(self.index.search([]), set())
+
+    def test_cached(self):
+        tar = make_tarball({"usr/bin/foo": b""})
+        self.assertIs(name_index(tar), name_index(tar))
+        self.assertEqual(list(name_index(tar)), ["usr/bin/foo"])
@@ -0,0 +1,58 @@
+# Copyright (C) 2003-2023 Namcap contributors, see AUTHORS for details.
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import os
+import shutil
+import tempfile
+import unittest
+from Namcap.ownership import OwnershipIndex, read_cache, write_cache
+
+
+class OwnershipIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.index = OwnershipIndex(
+            [
+                ("usr/", "glibc"),
+                ("usr/lib/", "glibc"),
+                ("usr/lib/libc.so.6", "glibc"),
+                ("usr/lib/libgpm.so", "gpm"),
+                ("usr/lib/libgpm.so.2", "gpm"),
+                ("usr/lib/libgpm.so.2.1.0", "gpm"),
+                ("usr/lib/", "gpm"),
+                ("usr/bin/foo", "foo"),
+                ("usr/bin/foo", "foo-git"),
+            ]
+        )
+
+    def test_owners(self):
+        self.assertEqual(self.index.owners("usr/lib/libc.so.6"), ["glibc"])
+        self.assertEqual(self.index.owners("usr/bin/foo"), ["foo", "foo-git"])
+        self.assertEqual(self.index.owners("usr/bin/bar"), [])
+
+    def test_directories(self):
+        self.assertEqual(self.index.owners("usr/lib/"), [])
+
+    def test_prefix(self):
+        self.assertEqual(
+            list(self.index.with_prefix("usr/lib/libgpm.so.2")), ["usr/lib/libgpm.so.2", "usr/lib/libgpm.so.2.1.0"]
+        )
+        self.assertEqual(list(self.index.with_prefix("usr/lib/libz")), [])
+
+
+class CachedOwnershipIndexTests(OwnershipIndexTests):
+    "Runs the same lookups against the on-disk index"
+
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, "namcap", "files.sqlite")
+        write_cache(self.filename, self.index, "state1")
+        self.index = read_cache(self.filename, "state1")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_state(self):
+        self.assertIsNotNone(self.index)
+        self.assertIsNone(read_cache(self.filename, "state2"))
+        self.assertIsNone(read_cache(os.path.join(self.tmpdir, "missing.sqlite"), "state1"))
@@ -1,12 +1,19 @@
 # Copyright (C) 2003-2023 Namcap contributors, see AUTHORS for details.
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+import copy
+import io
 import os
+import pickle
+import tarfile
 import unittest
 import tempfile
+import types
 import shutil
+import unittest.mock
 
 import Namcap.package
+from Namcap.tests.test_scan import make_tarball
 
 pkgbuild = """
 # Maintainer: Arch Linux <archlinux@example.com>
@@ -75,3 +82,184 @@ class PkgbuildLoaderTests(unittest.TestCase):
     def test_provides(self):
         self.assertEqual(self.pkginfo["provides"], ["yourpackage"])
         self.assertEqual(self.pkginfo["orig_provides"], ["yourpackage=0.9"])
+
+
+class ProvidesIndexTests(unittest.TestCase):
+    def setUp(self):
+        def pkg(name, provides):
+            return types.SimpleNamespace(name=name, provides=provides)
+
+        self.db = types.SimpleNamespace(
+            name="__namcap_test",
+            pkgcache=[
+                pkg("bash", ["sh"]),
+                pkg("dash", ["sh=0.5"]),
+                pkg("pacman", ["libalpm.so=15-64"]),
+            ],
+        )
+        self.addCleanup(Namcap.package._provides_index.pop, self.db.name, None)
+
+    def test_lookup_provider(self):
+        self.assertEqual(Namcap.package.lookup_provider("sh", self.db).name, "bash")
+        self.assertEqual(Namcap.package.lookup_provider("libalpm.so=15-64", self.db).name, "pacman")
+        self.assertIsNone(Namcap.package.lookup_provider("zsh", self.db))
+
+    def test_index(self):
+        index = Namcap.package.get_provides_index(self.db)
+        self.assertEqual([p.name for p in index["sh"]], ["bash", "dash"])
+        self.assertIs(Namcap.package.get_provides_index(self.db), index)
+
+
+class HandleTests(unittest.TestCase):
+    def setUp(self):
+        self.handle = unittest.mock.Mock()
+        self.handle.get_syncdbs.return_value = [types.SimpleNamespace(name="core"), types.SimpleNamespace(name="extra")]
+        patch = unittest.mock.patch("Namcap.package.pyalpm_handle", None)
+        patch.start()
+        self.addCleanup(patch.stop)
+        patch = unittest.mock.patch("pycman.config.init_with_config", return_value=self.handle)
+        self.init = patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_lazy(self):
+        self.init.assert_not_called()
+        self.assertIs(Namcap.package.get_handle(), self.handle)
+        self.assertIs(Namcap.package.get_handle(), self.handle)
+        self.init.assert_called_once()
+        Namcap.package.reload_databases()
+        Namcap.package.get_handle()
+        self.assertEqual(self.init.call_count, 2)
+
+    def test_syncdb(self):
+        self.assertEqual(Namcap.package.get_syncdb("extra").name, "extra")
+        self.handle.register_syncdb.assert_not_called()
+        Namcap.package.get_syncdb("testing")
+        self.handle.register_syncdb.assert_called_once_with("testing", 0)
+
+
+pkginfo = """# Generated by makepkg
+pkgname = mypackage
+pkgbase = mypackage
+pkgver = 1.0-1
+pkgdesc = A package
+url = http://www.example.com/
+packager = Arch Linux <archlinux@example.com>
+size = 1234
+arch = x86_64
+license = GPL-3.0-or-later
+backup = etc/mypackage.conf
+depend = glibc
+depend = foobar>=2
+optdepend = libabc: provides the abc feature
+makedepend = cmake
+"""
+
+
+class TarballLoaderTests(unittest.TestCase):
+    def setUp(self):
+        files = {
+            ".PKGINFO": pkginfo.encode(),
+            ".INSTALL": b"",
+            "etc/mypackage.conf": b"",
+            "usr/bin/mypackage": b"binary",
+        }
+        tar = make_tarball(files)
+        handle, self.path = tempfile.mkstemp(suffix=".pkg.tar")
+        self.addCleanup(os.remove, self.path)
+        with os.fdopen(handle, "wb") as f:
+            f.write(tar.fileobj.getvalue())
+        self.pkginfo = Namcap.package.load_from_tarfile(tar, self.path)
+
+    def test_variables(self):
+        self.assertEqual(self.pkginfo["name"], "mypackage")
+        self.assertEqual(self.pkginfo["version"], "1.0-1")
+        self.assertEqual(self.pkginfo["desc"], "A package")
+        self.assertEqual(self.pkginfo["arch"], ["x86_64"])
+        self.assertEqual(self.pkginfo["license"], ["GPL-3.0-or-later"])
+        # like pyalpm, the size of the package file, not the installed size
+        self.assertEqual(self.pkginfo["size"], os.path.getsize(self.path))
+        self.assertEqual(self.pkginfo["backup"], ["etc/mypackage.conf"])
+        self.assertTrue(self.pkginfo["has_scriptlet"])
+        self.assertEqual(self.pkginfo["groups"], [])
+        # like pyalpm, which does not give the build time dependencies
+        self.assertNotIn("makedepends", self.pkginfo)
+
+    def test_depends(self):
+        self.assertEqual(self.pkginfo["depends"], ["glibc", "foobar"])
+        self.assertEqual(self.pkginfo["orig_depends"], ["glibc", "foobar>=2"])
+        self.assertEqual(self.pkginfo["optdepends"], ["libabc"])
+
+    def test_files(self):
+        self.assertEqual([f for f, size, mode in self.pkginfo["files"]], ["etc/mypackage.conf", "usr/bin/mypackage"])
+
+    def test_missing_pkginfo(self):
+        self.assertIsNone(Namcap.package.load_from_tarfile(make_tarball({"usr/bin/mypackage": b"binary"}), self.path))
+
+
+class PacmanPackageTests(unittest.TestCase):
+    def setUp(self):
+        db = "%NAME%\nfoo\n%DEPENDS%\nglibc>=2.38\nzlib\n\n%OPTDEPENDS%\nbar: for bar\n\n%LICENSE%\nMIT\n"
+        self.pkginfo = Namcap.package.PacmanPackage(db=db)
+
+    def test_stripped(self):
+        self.assertIs(self.pkginfo._data["depends"], Namcap.package._STRIPPED)
+        self.assertEqual(self.pkginfo["orig_depends"], ["glibc>=2.38", "zlib"])
+        self.assertEqual(self.pkginfo["depends"], ["glibc", "zlib"])
+        self.assertIs(self.pkginfo["depends"], self.pkginfo["depends"])
+        self.assertEqual(dict(self.pkginfo)["optdepends"], ["bar"])
+        self.assertEqual(
+            repr(self.pkginfo),
+            "PacmanPackage({'name': 'foo', 'depends': ['glibc', 'zlib'], 'optdepends': ['bar'], "
+            "'licenses': ['MIT'], 'orig_depends': ['glibc>=2.38', 'zlib'], 'orig_optdepends': ['bar: for bar']})",
+        )
+        self.pkginfo["depends"] = ["cmake"]
+        self.assertEqual(self.pkginfo["depends"], ["cmake"])
+
+    def test_copies(self):
+        unpickled = pickle.loads(pickle.dumps(self.pkginfo))
+        self.assertEqual(unpickled, self.pkginfo)
+        self.assertEqual(unpickled["depends"], ["glibc", "zlib"])
+        view = copy.copy(self.pkginfo)
+        view.detected_deps["glibc"].append(("reason", ()))
+        self.assertEqual(self.pkginfo.detected_deps, {})
+
+    def test_compact(self):
+        other = Namcap.package.PacmanPackage(db="%NAME%\nbar\n%DEPENDS%\n" + "zlib>=1\n")
+        self.assertIs(other["depends"][0], self.pkginfo["depends"][1])
+        self.assertFalse(hasattr(self.pkginfo, "__dict__"))
+        with self.assertRaises(AttributeError):
+            self.pkginfo.subpackages
+
+
+class ParserTests(unittest.TestCase):
+    def test_parse_pkginfo(self):
+        text = "# Generated by makepkg\npkgname = foo\npkgdesc = a = b\nreplaces = \ndepend = glibc\ndepend = zlib\n"
+        values = Namcap.package.parse_pkginfo(text)
+        self.assertEqual(values, {"pkgname": ["foo"], "pkgdesc": ["a = b"], "depend": ["glibc", "zlib"]})
+
+    def test_parse_db(self):
+        text = "ignored\n%NAME%\nfoo\n%VERSION%\n1-1\n%DEPENDS%\nglibc\n  \n\n%EMPTY%\n\n%DEPENDS%\nzlib\n"
+        values = Namcap.package.parse_db(text)
+        self.assertEqual(values, {"name": ["foo"], "version": ["1-1"], "depends": ["glibc", "zlib"]})
+
+    def test_load_from_repo_db(self):
+        entries = {
+            "foo-1.0-1/desc": b"%NAME%\nfoo\n\n%VERSION%\n1.0-1\n\n%CSIZE%\n42\n\n%DEPENDS%\nglibc>=2\n\n",
+            "foo-1.0-1/depends": b"%PROVIDES%\nlibfoo.so=1-64\n\n",
+            "bar-2.0-1/desc": b"%NAME%\nbar\n\n%VERSION%\n2.0-1\n\n%LICENSE%\nMIT\n\n",
+            "bar-2.0-1/files": b"%FILES%\nusr/\nusr/bin/bar\n\n",
+        }
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "test.db")
+            with tarfile.open(filename, "w:gz") as tar:
+                for name, data in entries.items():
+                    info = tarfile.TarInfo(name)
+                    info.size = len(data)
+                    tar.addfile(info, io.BytesIO(data))
+            foo, bar = Namcap.package.load_from_repo_db(filename)
+        self.assertEqual(foo["name"], "foo")
+        self.assertEqual(foo["csize"], "42")
+        self.assertEqual(foo["depends"], ["glibc"])
+        self.assertEqual(foo["provides"], ["libfoo.so=1-64"])
+        self.assertEqual(bar["licenses"], ["MIT"])
+        self.assertNotIn("files", bar)
@@ -0,0 +1,99 @@
+# Copyright (C) 2003-2023 Namcap contributors, see AUTHORS for details.
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import os
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+
+import Namcap.package
+import Namcap.parsepool
+
+SCRIPT = os.path.join(os.path.dirname(__file__), "..", "..", "parsepkgbuild.sh")
+
+_split = """
+pkgbase=foo
+pkgname=(foo-a foo-b)
+pkgver=1
+pkgrel=1
+arch=(x86_64)
+myvar=1
+package_foo-a() { depends=(bar); }
+package_foo-b() { pkgdesc="B"; }
+"""
+
+
+class ParseWorkerTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.worker = Namcap.parsepool.ParseWorker(SCRIPT, "x86_64")
+
+    def tearDown(self):
+        self.worker.close()
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, text, directory="."):
+        path = os.path.join(self.tmpdir, directory, "PKGBUILD")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def test_parse(self):
+        status, out, err = self.worker.parse(self.write("pkgname=foo\npkgver=1\npkgrel=2\n_x=$CARCH\ncd /\n"))
+        self.assertEqual(status, 0)
+        pkginfo = Namcap.package.PacmanPackage(db=out)
+        self.assertEqual(pkginfo["name"], "foo")
+        self.assertEqual(pkginfo["version"], "1-2")
+        self.assertIn("_x", pkginfo["setvars"])
+        # none of the variables of the worker itself
+        self.assertEqual([v for v in pkginfo["setvars"] if "namcap" in v], [])
+        self.assertIn("cd: restricted", err)
+
+    def test_split(self):
+        status, out, err = self.worker.parse(self.write(_split, "split"))
+        pkginfo = Namcap.package.PacmanPackage(db=out)
+        self.assertEqual(pkginfo["names"], ["foo-a", "foo-b"])
+        self.assertEqual([p["name"] for p in pkginfo.subpackages], ["foo-a", "foo-b"])
+        self.assertEqual(pkginfo.subpackages[0]["depends"], ["bar"])
+        self.assertEqual(pkginfo.subpackages[1]["desc"], "B")
+
+    def test_subshells(self):
+        # each PKGBUILD is sourced in its own subshell, in its own directory
+        self.assertEqual(
+            self.worker.parse(self.write("pkgname=broken\necho oops >&2\n")),
+            (1, "error: invalid package file\n", "oops\n"),
+        )
+        status, out, err = self.worker.parse(self.write("pkgver=1\npkgrel=1\n", "other"))
+        self.assertEqual(status, 1)
+        self.assertEqual(err, "")
+        status, out, err = self.worker.parse(self.write("pkgname=a\npkgver=1\npkgrel=1\nread x\n"))
+        self.assertEqual(status, 0)
+        self.assertTrue(self.worker.alive())
+
+    def test_killed(self):
+        status, out, err = self.worker.parse(self.write("pkgname=a\npkgver=1\npkgrel=1\nkill -9 $$\n"))
+        self.assertEqual(status, 1)
+        self.assertFalse(self.worker.alive())
+
+
+class EnableTests(unittest.TestCase):
+    def tearDown(self):
+        Namcap.parsepool.disable()
+
+    def test_disabled(self):
+        self.assertIsNone(Namcap.parsepool.parse("PKGBUILD"))
+
+    def test_restart(self):
+        Namcap.parsepool.enable()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "PKGBUILD")
+            with open(path, "w") as f:
+                f.write("pkgname=a\npkgver=1\npkgrel=1\nkill -9 $$\n")
+            with unittest.mock.patch.dict(os.environ, {"PARSE_PKGBUILD_PATH": os.path.dirname(SCRIPT)}):
+                self.assertEqual(Namcap.parsepool.parse(path)[0], 1)
+                with open(path, "w") as f:
+                    f.write("pkgname=a\npkgver=1\npkgrel=1\n")
+                # a new worker takes over
+                self.assertEqual(Namcap.parsepool.parse(path)[0], 0)
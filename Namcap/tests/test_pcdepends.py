@@ -0,0 +1,38 @@
+# Copyright (C) 2003-2023 Namcap contributors, see AUTHORS for details.
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import unittest
+
+import Namcap.rules.pcdepends
+
+pcfile = b"""# comment
+prefix=/usr
+libdir=${prefix}/lib
+deps=glib-2.0 >= 2.50
+
+Name: foo # with a comment
+Description: a \\
+long description
+Version: 1.0
+Requires: ${deps}, gobject-2.0,zlib
+Requires.private: libbar>=1.0 libbaz != 2 libqux
+Libs: -L${libdir} -lfoo
+"""
+
+
+class PkgConfigParserTest(unittest.TestCase):
+    def test_parse_pcfile(self):
+        keywords = Namcap.rules.pcdepends.parse_pcfile(pcfile)
+        self.assertEqual(keywords["Name"], "foo")
+        self.assertEqual(keywords["Description"], "a long description")
+        self.assertEqual(keywords["Libs"], "-L/usr/lib -lfoo")
+        self.assertEqual(keywords["Requires"], "glib-2.0 >= 2.50, gobject-2.0,zlib")
+
+    def test_parse_requires(self):
+        keywords = Namcap.rules.pcdepends.parse_pcfile(pcfile)
+        self.assertEqual(
+            Namcap.rules.pcdepends.parse_requires(keywords["Requires"]), ["glib-2.0", "gobject-2.0", "zlib"]
+        )
+        self.assertEqual(
+            Namcap.rules.pcdepends.parse_requires(keywords["Requires.private"]), ["libbar", "libbaz", "libqux"]
+        )
@@ -0,0 +1,83 @@
+# Copyright (C) 2003-2023 Namcap contributors, see AUTHORS for details.
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+
+import Namcap.package
+import Namcap.pkgbuildcache
+
+_split = """pkgbase=foo
+pkgname=(foo-a foo-b)
+pkgver=1
+pkgrel=1
+arch=(x86_64)
+depends=('glibc>=2.38' \\
+  'zlib')
+package_foo-a() { depends=(bar); }
+package_foo-b() { pkgdesc="B"; }
+"""
+
+
+class PkgbuildCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.pkgbuild = os.path.join(self.tmpdir, "PKGBUILD")
+        with open(self.pkgbuild, "w") as f:
+            f.write(_split)
+        self.script = os.path.join(self.tmpdir, "parsepkgbuild.sh")
+        with open(self.script, "w") as f:
+            f.write("# parser\n")
+        patches = [
+            unittest.mock.patch.dict(os.environ, {"XDG_CACHE_HOME": self.tmpdir}),
+            unittest.mock.patch("Namcap.pkgbuildcache.parser_script", return_value=self.script),
+            unittest.mock.patch("Namcap.pkgbuildcache.MAKEPKG_CONF", os.path.join(self.tmpdir, "makepkg.conf")),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        Namcap.pkgbuildcache.enable()
+
+    def tearDown(self):
+        Namcap.pkgbuildcache.disable()
+        shutil.rmtree(self.tmpdir)
+
+    def test_key(self):
+        key = Namcap.pkgbuildcache.pkgbuild_key(self.pkgbuild)
+        self.assertEqual(key, Namcap.pkgbuildcache.pkgbuild_key(self.pkgbuild))
+        with open(os.path.join(self.tmpdir, "makepkg.conf"), "w") as f:
+            f.write("CARCH=aarch64\n")
+        makepkg_key = Namcap.pkgbuildcache.pkgbuild_key(self.pkgbuild)
+        self.assertNotEqual(key, makepkg_key)
+        with open(self.script, "a") as f:
+            f.write("# changed\n")
+        self.assertNotEqual(makepkg_key, Namcap.pkgbuildcache.pkgbuild_key(self.pkgbuild))
+        self.assertIsNone(Namcap.pkgbuildcache.pkgbuild_key(os.path.join(self.tmpdir, "missing")))
+        Namcap.pkgbuildcache.disable()
+        self.assertIsNone(Namcap.pkgbuildcache.pkgbuild_key(self.pkgbuild))
+
+    def test_load_from_pkgbuild(self):
+        output = "%SPLIT%\n1\n\n%BASE%\nfoo\n\n%NAMES%\nfoo-a\nfoo-b\n\n%DEPENDS%\nglibc>=2.38\nzlib\n\n"
+        output += "\0\n%NAME%\nfoo-a\n%DEPENDS%\nbar\n\n\0\n%NAME%\nfoo-b\n%DESC%\nB\n\n"
+        run = unittest.mock.Mock(return_value=(0, output, ""))
+        with unittest.mock.patch("Namcap.package.run_parsepkgbuild", run):
+            first = Namcap.package.load_from_pkgbuild(self.pkgbuild)
+            second = Namcap.package.load_from_pkgbuild(self.pkgbuild)
+        run.assert_called_once_with(self.pkgbuild)
+        self.assertEqual(repr(second), repr(first))
+        self.assertEqual([p["name"] for p in second.subpackages], ["foo-a", "foo-b"])
+        self.assertEqual(second["orig_depends"], ["glibc>=2.38", "zlib"])
+        self.assertEqual(second.pkgbuild, first.pkgbuild)
+        self.assertIn("depends=('glibc>=2.38'    'zlib')", second.pkgbuild)
+
+    def test_invalid(self):
+        run = unittest.mock.Mock(return_value=(1, "error: invalid package file\n", ""))
+        with unittest.mock.patch("Namcap.package.run_parsepkgbuild", run), contextlib.redirect_stdout(io.StringIO()):
+            self.assertIsNone(Namcap.package.load_from_pkgbuild(self.pkgbuild))
+            self.assertIsNone(Namcap.package.load_from_pkgbuild(self.pkgbuild))
+        self.assertEqual(run.call_count, 2)
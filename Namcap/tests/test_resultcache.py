@@ -0,0 +1,51 @@
+# Copyright (C) 2003-2023 Namcap contributors, see AUTHORS for details.
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import os
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+
+import Namcap.resultcache
+
+
+class ResultCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.package = os.path.join(self.tmpdir, "foo.pkg.tar")
+        with open(self.package, "wb") as f:
+            f.write(b"package")
+        patches = [
+            unittest.mock.patch.dict(os.environ, {"XDG_CACHE_HOME": self.tmpdir}),
+            unittest.mock.patch("Namcap.ownership.local_db_state", return_value="state1"),
+            unittest.mock.patch("Namcap.package.sync_db_state", return_value=[("core.db", 1)]),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_roundtrip(self):
+        key = Namcap.resultcache.result_key(self.package, ["elffiles"], [False])
+        self.assertIsNone(Namcap.resultcache.load_results(key))
+        messages = [("foo", "E", "ELF file ('usr/share/foo') outside of a valid path."), ("foo", "I", "info")]
+        Namcap.resultcache.store_results(key, messages)
+        self.assertEqual(Namcap.resultcache.load_results(key), messages)
+
+    def test_key(self):
+        key = Namcap.resultcache.result_key(self.package, ["elffiles", "rpath"], [False])
+        self.assertEqual(key, Namcap.resultcache.result_key(self.package, ["rpath", "elffiles"], [False]))
+        self.assertNotEqual(key, Namcap.resultcache.result_key(self.package, ["rpath"], [False]))
+        self.assertNotEqual(key, Namcap.resultcache.result_key(self.package, ["elffiles", "rpath"], [True]))
+        with unittest.mock.patch("Namcap.ownership.local_db_state", return_value="state2"):
+            self.assertNotEqual(key, Namcap.resultcache.result_key(self.package, ["elffiles", "rpath"], [False]))
+        with unittest.mock.patch("Namcap.package.sync_db_state", return_value=[("core.db", 2)]):
+            self.assertNotEqual(key, Namcap.resultcache.result_key(self.package, ["elffiles", "rpath"], [False]))
+        with unittest.mock.patch.dict(os.environ, {"PATH": "/opt/bin"}):
+            self.assertNotEqual(key, Namcap.resultcache.result_key(self.package, ["elffiles", "rpath"], [False]))
+        with open(self.package, "ab") as f:
+            f.write(b" rebuilt")
+        self.assertNotEqual(key, Namcap.resultcache.result_key(self.package, ["elffiles", "rpath"], [False]))
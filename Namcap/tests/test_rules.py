@@ -0,0 +1,41 @@
+# Copyright (C) 2003-2023 Namcap contributors, see AUTHORS for details.
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import importlib
+import pkgutil
+import unittest
+
+import Namcap.ruleclass
+import Namcap.rules
+
+
+def discover_rules():
+    "Returns { rule name => rule class } of all the modules of Namcap.rules"
+    rules = {}
+    for module_info in pkgutil.iter_modules(Namcap.rules.__path__):
+        module = importlib.import_module("Namcap.rules." + module_info.name)
+        for value in vars(module).values():
+            if (
+                isinstance(value, type)
+                and issubclass(value, Namcap.ruleclass.AbstractRule)
+                and value.__module__ == module.__name__
+                and hasattr(value, "name")
+            ):
+                rules[value.name] = value
+    return rules
+
+
+class RegistryTests(unittest.TestCase):
+    def test_registry(self):
+        rules = discover_rules()
+        self.assertEqual(sorted(Namcap.rules.registry), sorted(rules))
+        for name, rule in rules.items():
+            info = Namcap.rules.registry[name]
+            self.assertIs(Namcap.rules.all_rules[name], rule)
+            self.assertTrue(issubclass(rule, getattr(Namcap.ruleclass, info.kind)), name)
+            self.assertEqual(info.description, rule.description, name)
+            self.assertEqual(info.enable, rule.enable, name)
+
+    def test_repr(self):
+        rules = {name: Namcap.rules.all_rules[name] for name in Namcap.rules.all_rules}
+        self.assertEqual(repr(Namcap.rules.all_rules), repr(rules))
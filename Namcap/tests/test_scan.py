@@ -0,0 +1,89 @@
+# Copyright (C) 2003-2023 Namcap contributors, see AUTHORS for details.
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import io
+import os
+import sys
+import tarfile
+import unittest
+
+import Namcap.scan
+from Namcap.ruleclass import TarballRule
+
+
+def make_tarball(files):
+    "Returns an in-memory TarFile holding the given {name: contents}"
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w") as tar:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    buf.seek(0)
+    return tarfile.open(fileobj=buf, mode="r")
+
+
+class RecordingRule(TarballRule):
+    member_kinds = frozenset([Namcap.scan.ELF, Namcap.scan.PYTHON])
+
+    def __init__(self):
+        super().__init__()
+        self.seen = []
+        self.finished = False
+
+    def analyze_member(self, pkginfo, member):
+        self.seen.append((member.name, member.data))
+
+    def finish(self, pkginfo, tar):
+        self.finished = True
+
+
+class ScanTests(unittest.TestCase):
+    def test_classify(self):
+        self.assertEqual(Namcap.scan.classify("usr/bin/foo", b"\x7fELF\x02\x01"), {Namcap.scan.ELF})
+        self.assertEqual(Namcap.scan.classify("usr/lib/libfoo.a", b"!<arch>\n"), {Namcap.scan.AR})
+        self.assertEqual(
+            Namcap.scan.classify("usr/bin/foo.py", b"#!/usr/bin/python"), {Namcap.scan.SCRIPT, Namcap.scan.PYTHON}
+        )
+        self.assertEqual(Namcap.scan.classify("usr/share/java/foo.jar", b"PK\x03\x04"), {Namcap.scan.JAVA})
+        self.assertEqual(Namcap.scan.classify("usr/lib/pkgconfig/foo.pc", b"prefix="), {Namcap.scan.PKGCONFIG})
+        self.assertEqual(Namcap.scan.classify("usr/share/doc/README", b"Hello"), set())
+
+    def test_dispatch(self):
+        tar = make_tarball(
+            {
+                "usr/bin/foo": b"\x7fELF binary",
+                "usr/share/doc/README": b"text",
+                "usr/lib/python3/foo.py": b"import os\n",
+            }
+        )
+        rule1, rule2 = RecordingRule(), RecordingRule()
+        Namcap.scan.scan_tarball(None, tar, [rule1, rule2])
+        expected = [("usr/bin/foo", b"\x7fELF binary"), ("usr/lib/python3/foo.py", b"import os\n")]
+        self.assertEqual(rule1.seen, expected)
+        self.assertEqual(rule2.seen, expected)
+        self.assertTrue(rule1.finished)
+        self.assertTrue(rule2.finished)
+
+    def test_single_rule(self):
+        tar = make_tarball({"usr/bin/foo": b"\x7fELF binary"})
+        rule = RecordingRule()
+        rule.analyze(None, tar)
+        self.assertEqual(rule.seen, [("usr/bin/foo", b"\x7fELF binary")])
+        self.assertTrue(rule.finished)
+
+    def test_elf_summary(self):
+        with open(os.path.realpath(sys.executable), "rb") as f:
+            data = f.read()
+        tar = make_tarball({"usr/bin/python": data})
+        summaries = []
+
+        class SummaryRule(RecordingRule):
+            def analyze_member(self, pkginfo, member):
+                summaries.append(member.elf)
+
+        Namcap.scan.scan_tarball(None, tar, [SummaryRule(), SummaryRule()])
+        self.assertEqual(len(summaries), 2)
+        # read once, shared by the rules
+        self.assertIs(summaries[0], summaries[1])
+        self.assertIn(summaries[0].elfclass, (32, 64))
@@ -0,0 +1,121 @@
+# Copyright (C) 2003-2023 Namcap contributors, see AUTHORS for details.
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import multiprocessing
+import os
+import sys
+import tarfile
+import threading
+import unittest
+import unittest.mock
+
+import Namcap.scan
+import Namcap.scheduler
+from Namcap.package import PacmanPackage
+from Namcap.ruleclass import PROCESS, THREAD, TarballRule
+from Namcap.tests.test_scan import make_tarball
+
+
+class MemberRule(TarballRule):
+    name = "member"
+    member_kinds = frozenset([Namcap.scan.ELF])
+
+    def analyze_member(self, pkginfo, member):
+        pkginfo.detected_deps["elf"].append(("found %s", member.name))
+        self.infos.append(("pid %s", os.getpid()))
+
+    def finish(self, pkginfo, tar):
+        self.warnings.append(("members %s", tuple(tar.getnames())))
+
+
+class ThreadMemberRule(MemberRule):
+    concurrency = THREAD
+
+
+class ProcessMemberRule(MemberRule):
+    concurrency = PROCESS
+
+
+class WholeRule(TarballRule):
+    name = "whole"
+
+    def analyze(self, pkginfo, tar):
+        pkginfo.detected_deps["whole"].append(("%s members", len(tar.getmembers())))
+        pkginfo.detected_deps["elf"].append(("whole", ()))
+
+
+class ProcessWholeRule(WholeRule):
+    concurrency = PROCESS
+
+
+class FailingRule(TarballRule):
+    name = "failing"
+    concurrency = PROCESS
+
+    def analyze(self, pkginfo, tar):
+        raise ValueError("failed")
+
+
+class ELFSummaryRule(TarballRule):
+    name = "elfsummary"
+    member_kinds = frozenset([Namcap.scan.ELF])
+    concurrency = PROCESS
+
+    def analyze_member(self, pkginfo, member):
+        # whether the summary was read before the member was sent
+        self.infos.append(("summary %s %s", (member.name, member._elf is not None)))
+
+
+class SchedulerTests(unittest.TestCase):
+    def setUp(self):
+        self.files = {"usr/bin/foo": b"\x7fELF foo", "usr/share/doc/README": b"text", "usr/bin/bar": b"\x7fELF bar"}
+
+    def run_rules(self, rules, jobs):
+        pkginfo = PacmanPackage({"name": "foo"})
+        Namcap.scheduler.run_rules(pkginfo, make_tarball(self.files), rules, jobs)
+        return pkginfo
+
+    def test_sequential_order(self):
+        pkginfo = self.run_rules([WholeRule(), MemberRule()], 1)
+        # rules reading members are finished by the scan, before the others run
+        self.assertEqual(list(pkginfo.detected_deps), ["elf", "whole"])
+        self.assertEqual(
+            pkginfo.detected_deps["elf"], [("found %s", "usr/bin/foo"), ("found %s", "usr/bin/bar"), ("whole", ())]
+        )
+
+    def test_concurrent_results(self):
+        sequential = [WholeRule(), MemberRule(), MemberRule()]
+        concurrent = [ProcessWholeRule(), ThreadMemberRule(), ProcessMemberRule()]
+        expected = self.run_rules(sequential, 1)
+        pkginfo = self.run_rules(concurrent, 4)
+        self.assertEqual(list(pkginfo.detected_deps.items()), list(expected.detected_deps.items()))
+        for rule, ref in zip(concurrent, sequential):
+            self.assertEqual(rule.errors, ref.errors)
+            self.assertEqual(rule.warnings, ref.warnings)
+        self.assertEqual(concurrent[1].infos, [("pid %s", os.getpid())] * 2)
+        if Namcap.scheduler.fork_context() is not None:
+            self.assertNotIn(("pid %s", os.getpid()), concurrent[2].infos)
+
+    def test_failing_rule(self):
+        with self.assertRaises(RuntimeError):
+            self.run_rules([FailingRule(), ProcessMemberRule()], 2)
+
+    def test_broken_tarball(self):
+        threads = threading.active_count()
+        rules = [ThreadMemberRule(), ProcessMemberRule(), ProcessWholeRule()]
+        with unittest.mock.patch("Namcap.scan.scan_tarball", side_effect=tarfile.ReadError("truncated")):
+            with self.assertRaises(tarfile.ReadError):
+                self.run_rules(rules, 4)
+        # the runners were stopped
+        self.assertEqual(threading.active_count(), threads)
+        self.assertEqual(multiprocessing.active_children(), [])
+
+    def test_elf_summary_sent(self):
+        if Namcap.scheduler.fork_context() is None:
+            self.skipTest("no worker processes")
+        with open(os.path.realpath(sys.executable), "rb") as f:
+            self.files["usr/bin/python"] = f.read()
+        rules = [ELFSummaryRule(), ELFSummaryRule()]
+        self.run_rules(rules, 2)
+        for rule in rules:
+            self.assertIn(("summary %s %s", ("usr/bin/python", True)), rule.infos)
@@ -0,0 +1,115 @@
+# Copyright (C) 2003-2023 Namcap contributors, see AUTHORS for details.
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import io
+import os
+import pickle
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import unittest
+import unittest.mock
+
+import Namcap.scan
+import Namcap.spool
+from Namcap.tests.test_scan import RecordingRule
+
+
+class SpoolTests(unittest.TestCase):
+    files = {".PKGINFO": b"pkgname = foo\n", "usr/bin/foo": b"\x7fELF binary", "usr/lib/python3/foo.py": b"import os\n"}
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write_tarball(self, compression):
+        path = os.path.join(self.tmpdir.name, "foo.pkg.tar")
+        with tarfile.open(path, "w:" + compression) as tar:
+            for name, data in self.files.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+        return path
+
+    def test_compressions(self):
+        for compression in ("", "gz", "bz2", "xz"):
+            with self.subTest(compression=compression):
+                tar = Namcap.spool.open_spooled(self.write_tarball(compression))
+                self.assertEqual(tar.getnames(), list(self.files))
+                # members before the current position are read without decompressing again
+                self.assertEqual(tar.extractfile(".PKGINFO").read(), self.files[".PKGINFO"])
+                view = Namcap.spool.member_view(tar, tar.getmember("usr/bin/foo"))
+                self.assertEqual(view.tobytes(), self.files["usr/bin/foo"])
+
+    def test_magic(self):
+        self.assertEqual(Namcap.spool.compression(io.BytesIO(b"\x28\xb5\x2f\xfd\x04")), "zstd")
+        self.assertEqual(Namcap.spool.compression(io.BytesIO(b"\xfd7zXZ\x00\x00")), "xz")
+        self.assertEqual(Namcap.spool.compression(io.BytesIO(b"\x04\x22\x4d\x18")), "lz4")
+        self.assertIsNone(Namcap.spool.compression(io.BytesIO(b"usr/\x00\x00")))
+
+    def test_is_tarball(self):
+        for compression in ("", "gz", "xz"):
+            self.assertTrue(Namcap.spool.is_tarball(self.write_tarball(compression)))
+        path = os.path.join(self.tmpdir.name, "PKGBUILD")
+        with open(path, "w") as f:
+            f.write("pkgname=foo\n")
+        self.assertFalse(Namcap.spool.is_tarball(path))
+        self.assertFalse(Namcap.spool.is_tarball(os.path.join(self.tmpdir.name, "missing")))
+
+    def test_commands(self):
+        for tool, compression in (("zstd", "zstd"), ("lz4", "lz4"), ("xz", "xz")):
+            if shutil.which(tool) is None:
+                continue
+            with self.subTest(tool=tool):
+                path = self.write_tarball("")
+                compressed = os.path.join(self.tmpdir.name, "foo.pkg.tar.bin")
+                with open(path, "rb") as src, open(compressed, "wb") as dst:
+                    subprocess.run([tool, "-c"], stdin=src, stdout=dst, check=True)
+                tar = Namcap.spool.open_spooled(compressed)
+                self.assertEqual(tar.getnames(), list(self.files))
+                self.assertEqual(tar.extractfile("usr/bin/foo").read(), self.files["usr/bin/foo"])
+
+    def test_missing_command(self):
+        path = self.write_tarball("xz")
+        with unittest.mock.patch("shutil.which", return_value=None):
+            # decompressed by the lzma module instead
+            self.assertEqual(Namcap.spool.open_spooled(path).getnames(), list(self.files))
+            with open(path, "wb") as f:
+                f.write(b"LZIP\x01garbage")
+            with self.assertRaises(tarfile.CompressionError):
+                Namcap.spool.open_spooled(path)
+
+    def test_noisy_command(self):
+        # more warnings than a pipe holds, then a failure
+        decoder = os.path.join(self.tmpdir.name, "noisy")
+        with open(decoder, "w") as f:
+            f.write("#!/bin/sh\nhead -c 1000000 /dev/zero | tr '\\0' w >&2\necho broken >&2\nexit 1\n")
+        os.chmod(decoder, 0o755)
+        with self.assertRaisesRegex(tarfile.ReadError, "broken$"):
+            Namcap.spool._run_decoder([decoder], self.write_tarball(""), io.BytesIO())
+
+    def test_scan(self):
+        rule = RecordingRule()
+        tar = Namcap.spool.open_spooled(self.write_tarball("gz"))
+        members = []
+        rule.analyze_member = lambda pkginfo, member: members.append(member)
+        Namcap.scan.scan_tarball(None, tar, [rule])
+        self.assertEqual([m.name for m in members], ["usr/bin/foo", "usr/lib/python3/foo.py"])
+        self.assertIsInstance(members[0].view.obj, type(tar.fileobj))
+        self.assertEqual(members[0].data, self.files["usr/bin/foo"])
+        # members sent to worker processes carry a copy of their contents
+        copy = pickle.loads(pickle.dumps(members[1]))
+        self.assertEqual((copy.name, copy.data), ("usr/lib/python3/foo.py", b"import os\n"))
+
+    def test_invalid(self):
+        path = os.path.join(self.tmpdir.name, "empty.pkg.tar")
+        open(path, "wb").close()
+        with self.assertRaises(tarfile.ReadError):
+            Namcap.spool.open_spooled(path)
+        with open(path, "wb") as f:
+            f.write(b"\x1f\x8b\x08\x00garbage")
+        with self.assertRaises(tarfile.ReadError):
+            Namcap.spool.open_spooled(path)
@@ -0,0 +1,53 @@
+# Copyright (C) 2003-2023 Namcap contributors, see AUTHORS for details.
+# SPDX-License-Identifier: GPL-2.0-or-later
+
+import io
+import os
+import struct
+import sys
+import unittest
+
+import Namcap.util
+from elftools.common.exceptions import ELFError
+
+
+class ELFSummaryTests(unittest.TestCase):
+    def setUp(self):
+        with open(os.path.realpath(sys.executable), "rb") as f:
+            self.data = f.read()
+
+    def assertSameSummary(self, summary, expected):
+        for field in Namcap.util.ELFSummary.__slots__:
+            self.assertEqual(getattr(summary, field), getattr(expected, field), field)
+
+    def test_struct_reader(self):
+        expected = Namcap.util.read_elf_summary(io.BytesIO(self.data))
+        self.assertSameSummary(Namcap.util.parse_elf_summary(self.data), expected)
+        self.assertSameSummary(Namcap.util.parse_elf_summary(bytearray(self.data)), expected)
+
+    def test_fallback(self):
+        # e_shnum of 0 with section headers: the count is in the first section header
+        shnum = struct.calcsize("=HHIIIIIHHHH" if self.data[4] == 1 else "=HHIQQQIHHHH")
+        data = bytearray(self.data)
+        data[16 + shnum : 16 + shnum + 2] = b"\0\0"
+        with self.assertRaises(ValueError):
+            Namcap.util.parse_elf_summary(data)
+        self.assertIsInstance(Namcap.util.elf_summary(bytes(data)), Namcap.util.ELFSummary)
+
+    def test_invalid(self):
+        with self.assertRaises(ELFError):
+            Namcap.util.elf_summary(b"\x7fELF garbage")
+        # program headers out of the address space
+        data = bytearray(self.data)
+        if data[4] == 2:
+            struct.pack_into("<Q" if data[5] == 1 else ">Q", data, 32, 1 << 63)
+            with self.assertRaises(ELFError):
+                Namcap.util.elf_summary(bytes(data))
+
+
+class SystemCacheTests(unittest.TestCase):
+    def test_clear(self):
+        cache = Namcap.util.system_cache()
+        cache["glibc"] = ("depends", "provides")
+        Namcap.util.clear_system_caches()
+        self.assertEqual(cache, {})
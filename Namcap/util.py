@@ -1,7 +1,46 @@
 # Copyright (C) 2003-2023 Namcap contributors, see AUTHORS for details.
 # SPDX-License-Identifier: GPL-2.0-or-later
 
+import io
+import os
 import re
+import struct
+
+# ELF constants used by the summaries
+ET_DYN = 3
+PT_INTERP = 3
+PT_GNU_STACK = 0x6474E551
+PT_GNU_RELRO = 0x6474E552
+PF_X = 0x1
+DF_BIND_NOW = 0x8
+GNU_PROPERTY_X86_FEATURE_1_AND = 0xC0000002
+GNU_PROPERTY_X86_FEATURE_1_SHSTK = 0x2
+
+# used by the struct-based reader only
+SHT_SYMTAB = 2
+SHT_NOTE = 7
+SHT_DYNAMIC = 6
+SHT_DYNSYM = 11
+SHT_SUNW_LDYNSYM = 0x6FFFFFF3
+DT_NULL = 0
+DT_NEEDED = 1
+DT_SONAME = 14
+DT_RPATH = 15
+DT_DEBUG = 21
+DT_TEXTREL = 22
+DT_BIND_NOW = 24
+DT_RUNPATH = 29
+DT_FLAGS = 30
+NT_GNU_PROPERTY_TYPE_0 = 5
+SHN_LORESERVE = 0xFF00
+PN_XNUM = 0xFFFF
+
+# Elf_Ehdr (after e_ident), Elf_Phdr, Elf_Shdr and Elf_Dyn, without the byte
+# order, and the index of p_flags in Elf_Phdr, by ELF class
+_EHDR_FORMATS = {1: "HHIIIIIHHHHHH", 2: "HHIQQQIHHHHHH"}
+_PHDR_FORMATS = {1: ("IIIIIIII", 6), 2: ("IIQQQQQQ", 1)}
+_SHDR_FORMATS = {1: "IIIIIIIIII", 2: "IIQQQQIIQQ"}
+_DYN_FORMATS = {1: "iI", 2: "qQ"}
 
 
 def _file_has_magic(fileobj, magic_bytes):
@@ -51,6 +90,294 @@ def script_type(fileobj):
     return name
 
 
+class ELFSummary(object):
+    """
+    What the rules need to know about an ELF file
+
+    It is read in a single pass over the file, then shared by all the rules
+    looking at the file (see Namcap.scan.Member.elf).
+    """
+
+    __slots__ = (
+        "elfclass",
+        "little_endian",
+        "type",
+        "machine",
+        "flags",
+        "needed",
+        "sonames",
+        "rpaths",
+        "runpaths",
+        "dynamic_flags",
+        "textrel",
+        "bind_now",
+        "debug",
+        "segments",
+        "symtab",
+        "x86_features",
+    )
+
+    def __init__(self, elfclass, little_endian, type, machine, flags):
+        self.elfclass = elfclass
+        self.little_endian = little_endian
+        # e_type, e_machine and e_flags of the header
+        self.type = type
+        self.machine = machine
+        self.flags = flags
+        # dynamic section
+        self.needed = []
+        self.sonames = []
+        self.rpaths = []
+        self.runpaths = []
+        self.dynamic_flags = 0
+        self.textrel = False
+        self.bind_now = False
+        self.debug = False
+        # [(p_type, p_flags)] of the program headers
+        self.segments = []
+        # whether there is a .symtab, which strip removes
+        self.symtab = False
+        # GNU_PROPERTY_X86_FEATURE_1_AND of the GNU property notes
+        self.x86_features = 0
+
+    def has_segment(self, p_type):
+        return any(t == p_type for t, f in self.segments)
+
+
+def _enum_value(value, enum):
+    "Returns the number behind a value pyelftools may have given by name"
+    if isinstance(value, int):
+        return value
+    return enum[value]
+
+
+def read_elf_summary(fileobj):
+    """
+    Returns the ELFSummary of an ELF file object, read with pyelftools
+
+    pyelftools is only imported here, for the files the struct-based reader
+    does not handle (see elf_summary()).
+    """
+    from elftools.elf.dynamic import DynamicSection
+    from elftools.elf.elffile import ELFFile
+    from elftools.elf import enums
+    from elftools.elf.sections import NoteSection, SymbolTableSection
+
+    # names pyelftools gives to program header types
+    p_types = {
+        **enums.ENUM_P_TYPE_BASE,
+        **enums.ENUM_P_TYPE_ARM,
+        **enums.ENUM_P_TYPE_AARCH64,
+        **enums.ENUM_P_TYPE_MIPS,
+        **enums.ENUM_P_TYPE_RISCV,
+    }
+    elffile = ELFFile(fileobj)
+    header = elffile.header
+    elf = ELFSummary(
+        elffile.elfclass,
+        elffile.little_endian,
+        _enum_value(header.e_type, enums.ENUM_E_TYPE),
+        _enum_value(header.e_machine, enums.ENUM_E_MACHINE),
+        header.e_flags,
+    )
+    for section in elffile.iter_sections():
+        if isinstance(section, DynamicSection):
+            for tag in section.iter_tags():
+                d_tag = tag.entry.d_tag
+                if d_tag == "DT_NEEDED":
+                    elf.needed.append(tag.needed)
+                elif d_tag == "DT_SONAME":
+                    elf.sonames.append(tag.soname)
+                elif d_tag == "DT_RPATH":
+                    elf.rpaths.extend(tag.rpath.split(":"))
+                elif d_tag == "DT_RUNPATH":
+                    elf.runpaths.extend(tag.runpath.split(":"))
+                elif d_tag == "DT_FLAGS":
+                    elf.dynamic_flags |= tag.entry.d_val
+                elif d_tag == "DT_TEXTREL":
+                    elf.textrel = True
+                elif d_tag == "DT_BIND_NOW":
+                    elf.bind_now = True
+                elif d_tag == "DT_DEBUG":
+                    elf.debug = True
+        elif isinstance(section, SymbolTableSection):
+            if section.name == ".symtab" and section["sh_entsize"] != 0:
+                elf.symtab = True
+        elif isinstance(section, NoteSection):
+            for note in section.iter_notes():
+                if note["n_type"] != "NT_GNU_PROPERTY_TYPE_0":
+                    continue
+                for prop in note["n_desc"]:
+                    if prop["pr_type"] == "GNU_PROPERTY_X86_FEATURE_1_AND":
+                        elf.x86_features |= prop["pr_data"]
+    if elf.dynamic_flags & DF_BIND_NOW:
+        elf.bind_now = True
+    for segment in elffile.iter_segments():
+        elf.segments.append((_enum_value(segment["p_type"], p_types), segment["p_flags"]))
+    return elf
+
+
+def _cstring(view, offset):
+    "Reads a NUL-terminated string from a memoryview, decoded like pyelftools does"
+    chunks = []
+    while True:
+        chunk = bytes(view[offset : offset + 64])
+        end = chunk.find(b"\0")
+        if end >= 0:
+            chunks.append(chunk[:end])
+            return str(b"".join(chunks), "latin-1")
+        if not chunk:
+            raise ValueError("unterminated string")
+        chunks.append(chunk)
+        offset += len(chunk)
+
+
+def parse_elf_summary(data):
+    """
+    Returns the ELFSummary of the contents of an ELF file
+
+    Only the headers, the dynamic section and the notes are unpacked, straight
+    from the buffer. ValueError is raised for the files this reader does not
+    understand (extended section numbering for instance), see elf_summary().
+    data may be any buffer: bytes, a memoryview of a memory-mapped tarball...
+    """
+    data = memoryview(data)
+    if data[:4] != b"\x7fELF" or data[4] not in (1, 2) or data[5] not in (1, 2):
+        raise ValueError("not a supported ELF file")
+    elfclass = 32 * data[4]
+    little_endian = data[5] == 1
+    order = "<" if little_endian else ">"
+    (
+        e_type,
+        e_machine,
+        e_version,
+        e_entry,
+        e_phoff,
+        e_shoff,
+        e_flags,
+        e_ehsize,
+        e_phentsize,
+        e_phnum,
+        e_shentsize,
+        e_shnum,
+        e_shstrndx,
+    ) = struct.unpack_from(order + _EHDR_FORMATS[data[4]], data, 16)
+    if e_phnum == PN_XNUM or (e_shoff and not e_shnum) or e_shstrndx >= SHN_LORESERVE:
+        raise ValueError("extended ELF numbering")
+    elf = ELFSummary(elfclass, little_endian, e_type, e_machine, e_flags)
+
+    phdr_format, flags_index = _PHDR_FORMATS[data[4]]
+    phdr = struct.Struct(order + phdr_format)
+    for i in range(e_phnum):
+        fields = phdr.unpack_from(data, e_phoff + i * e_phentsize)
+        elf.segments.append((fields[0], fields[flags_index]))
+
+    shdr = struct.Struct(order + _SHDR_FORMATS[data[4]])
+    # (sh_name, sh_type, sh_flags, sh_addr, sh_offset, sh_size, sh_link, sh_info, sh_addralign, sh_entsize)
+    sections = [shdr.unpack_from(data, e_shoff + i * e_shentsize) for i in range(e_shnum)]
+    if not sections:
+        return elf
+    names = sections[e_shstrndx][4]
+    dyn = struct.Struct(order + _DYN_FORMATS[data[4]])
+    for sh_name, sh_type, _, _, sh_offset, sh_size, sh_link, _, _, sh_entsize in sections:
+        if sh_type == SHT_DYNAMIC:
+            strtab = sections[sh_link][4]
+            for d_tag, d_val in dyn.iter_unpack(data[sh_offset : sh_offset + sh_size - sh_size % dyn.size]):
+                if d_tag == DT_NULL:
+                    break
+                elif d_tag == DT_NEEDED:
+                    elf.needed.append(_cstring(data, strtab + d_val))
+                elif d_tag == DT_SONAME:
+                    elf.sonames.append(_cstring(data, strtab + d_val))
+                elif d_tag == DT_RPATH:
+                    elf.rpaths.extend(_cstring(data, strtab + d_val).split(":"))
+                elif d_tag == DT_RUNPATH:
+                    elf.runpaths.extend(_cstring(data, strtab + d_val).split(":"))
+                elif d_tag == DT_FLAGS:
+                    elf.dynamic_flags |= d_val
+                elif d_tag == DT_TEXTREL:
+                    elf.textrel = True
+                elif d_tag == DT_BIND_NOW:
+                    elf.bind_now = True
+                elif d_tag == DT_DEBUG:
+                    elf.debug = True
+        elif sh_type in (SHT_SYMTAB, SHT_DYNSYM, SHT_SUNW_LDYNSYM):
+            if sh_entsize != 0 and _cstring(data, names + sh_name) == ".symtab":
+                elf.symtab = True
+        elif sh_type == SHT_NOTE:
+            _read_properties(elf, data, order, sh_offset, sh_offset + sh_size)
+    if elf.dynamic_flags & DF_BIND_NOW:
+        elf.bind_now = True
+    return elf
+
+
+def _read_properties(elf, data, order, offset, end):
+    "Reads the GNU property notes between offset and end into elf.x86_features"
+    # notes are 4-byte aligned, properties 8-byte aligned on 64-bit files
+    prop_align = 8 if elf.elfclass == 64 else 4
+    while offset + 12 < end:
+        n_namesz, n_descsz, n_type = struct.unpack_from(order + "III", data, offset)
+        offset += 12
+        name = bytes(data[offset : offset + n_namesz]).split(b"\0", 1)[0]
+        offset += -(-n_namesz // 4) * 4
+        if n_type == NT_GNU_PROPERTY_TYPE_0 and name == b"GNU":
+            prop = offset
+            while prop < offset + n_descsz:
+                pr_type, pr_datasz = struct.unpack_from(order + "II", data, prop)
+                if pr_type == GNU_PROPERTY_X86_FEATURE_1_AND:
+                    elf.x86_features |= struct.unpack_from(order + "I", data, prop + 8)[0]
+                prop += -(-(pr_datasz + 8) // prop_align) * prop_align
+        offset += -(-n_descsz // 4) * 4
+
+
+def elf_summary(data):
+    """
+    Returns the ELFSummary of the contents of an ELF file
+
+    The struct-based reader is used when it can, pyelftools otherwise.
+    Raises elftools.common.exceptions.ELFError for invalid files.
+    """
+    try:
+        return parse_elf_summary(data)
+    except (ValueError, IndexError, OverflowError, struct.error):
+        pass
+    try:
+        return read_elf_summary(io.BytesIO(data))
+    except OverflowError as e:
+        # pyelftools lets offsets beyond the address space through
+        from elftools.common.exceptions import ELFParseError
+
+        raise ELFParseError(str(e))
+
+
+# the caches of what was read from the installed system, see system_cache()
+_system_caches = []
+
+
+def system_cache():
+    """
+    Returns a new dictionary caching what was read from the installed system
+
+    namcap --serve empties them all with clear_system_caches() when the
+    databases change.
+    """
+    cache = {}
+    _system_caches.append(cache)
+    return cache
+
+
+def clear_system_caches():
+    "Empties the dictionaries returned by system_cache()"
+    for cache in _system_caches:
+        cache.clear()
+
+
+def cache_dir():
+    "Returns the directory holding the namcap caches, following the XDG base directory specification"
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "namcap")
+
+
 def is_debug(pkginfo):
     "Take pkginfo, checks if it's a debug package"
     return "pkgdesc" in pkginfo and pkginfo["pkgdesc"].startswith("Detached debugging symbols for ")
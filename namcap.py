@@ -3,72 +3,101 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
 
 import argparse
+import concurrent.futures
+import contextlib
+import io
+import itertools
 import os
 import sys
 import tarfile
 
+import Namcap.daemon
 import Namcap.depends
+import Namcap.ldcache
+import Namcap.membercache
+import Namcap.ownership
+import Namcap.package
+import Namcap.parsepool
+import Namcap.pkgbuildcache
+import Namcap.resultcache
+import Namcap.ruleclass
 import Namcap.rules
+import Namcap.scheduler
+import Namcap.spool
 import Namcap.tags
+import Namcap.util
 import Namcap.version
 
 
 # Functions
 def get_modules():
-    """Return all possible modules (rules)"""
+    """Return all possible modules (rules), imported on first access"""
     return Namcap.rules.all_rules
 
 
 def get_enabled_modules():
-    """Return modules (rules) that should be used by default"""
-    return dict(filter(lambda x: x[1].enable, get_modules().items()))
+    """Return the Namcap.rules.RuleInfo of the modules (rules) that should be used by default"""
+    return dict(filter(lambda x: x[1].enable, Namcap.rules.registry.items()))
+
+
+def modules_of_kind(modules, *kinds):
+    """Return the names of the modules (rules) of the given kinds, without importing them"""
+    return [i for i in modules if modules[i].kind in kinds]
 
 
 def open_package(filename):
+    """Opens a package tarball (see Namcap.spool), None if it is not a tarball"""
     try:
-        tar = tarfile.open(filename, "r")
-        if ".PKGINFO" not in tar.getnames():
-            tar.close()
-            return None
-    except IOError:
-        if tar:
-            tar.close()
+        return Namcap.spool.open_spooled(filename)
+    except (tarfile.TarError, IOError):
         return None
-    return tar
 
 
-def show_messages(name, key, messages):
+def print_message(name, key, text):
     colored_key = {
         "E": "\033[91mE\033[00m",
         "W": "\033[93mW\033[00m",
         "I": "\033[92mI\033[00m",
     }
+    if colored_output:
+        print("%s %s: %s" % (name, colored_key[key], text))
+    else:
+        print("%s %s: %s" % (name, key, text))
+
+
+def show_messages(name, key, messages):
     for msg in messages:
-        if sys.stdout.isatty():
-            print("%s %s: %s" % (name, colored_key[key], Namcap.tags.format_message(msg)))
-        else:
-            print("%s %s: %s" % (name, key, Namcap.tags.format_message(msg)))
+        text = Namcap.tags.format_message(msg)
+        if recorded_messages is not None:
+            recorded_messages.append((name, key, text))
+        print_message(name, key, text)
 
 
-def process_realpackage(package, modules):
-    """Runs namcap checks over a package tarball"""
-    pkgtar = open_package(package)
+def process_realpackage(package, pkgtar, modules):
+    """Runs namcap checks over an open package tarball"""
+    pkginfo = Namcap.package.load_from_tarfile(pkgtar, package)
 
-    if not pkgtar:
+    if pkginfo is None:
         print("Error: %s is empty or is not a valid package" % package)
         return 1
 
-    pkginfo = Namcap.package.load_from_tarball(package)
-    # Loop through each one, load them apply if possible
-    for i in modules:
-        rule = get_modules()[i]()
+    # PKGBUILD rules have nothing to check in a package
+    modules = modules_of_kind(modules, Namcap.rules.TARBALL, Namcap.rules.PKGINFO)
+    rules = [get_modules()[i]() for i in modules]
+
+    # Read the files of the tarball once for all the rules needing them
+    tarball_rules = [rule for rule in rules if isinstance(rule, Namcap.ruleclass.TarballRule)]
+    Namcap.scheduler.run_rules(pkginfo, pkgtar, tarball_rules, rule_jobs)
 
+    # Loop through each one, load them apply if possible
+    for i, rule in zip(modules, rules):
         if isinstance(rule, Namcap.ruleclass.PkgInfoRule):
             rule.analyze(pkginfo, None)
         elif isinstance(rule, Namcap.ruleclass.PkgbuildRule):
             pass
         elif isinstance(rule, Namcap.ruleclass.TarballRule):
-            rule.analyze(pkginfo, pkgtar)
+            # already run by the scheduler
+            pass
         else:
             show_messages(pkginfo["name"], "E", [("error-running-rule %s", i)])
 
@@ -88,7 +117,7 @@ def process_realpackage(package, modules):
 
 def process_pkginfo(pkginfo, modules):
     """Runs namcap checks of a single, non-split PacmanPackage object"""
-    for i in modules:
+    for i in modules_of_kind(modules, Namcap.rules.PKGINFO):
         rule = get_modules()[i]()
         if isinstance(rule, Namcap.ruleclass.PkgInfoRule):
             rule.analyze(pkginfo, None)
@@ -115,7 +144,7 @@ def process_pkgbuild(package, modules):
         return 1
 
     # apply global PKGBUILD rules
-    for i in modules:
+    for i in modules_of_kind(modules, Namcap.rules.PKGBUILD):
         rule = get_modules()[i]()
         if isinstance(rule, Namcap.ruleclass.PkgbuildRule):
             rule.analyze(pkginfo, package)
@@ -133,8 +162,110 @@ def process_pkgbuild(package, modules):
         process_pkginfo(subpkg, modules)
 
 
-# Main
-modules = get_modules()
+def process_package(package, modules):
+    """Runs namcap checks over a package tarball or a PKGBUILD"""
+    global recorded_messages
+    if not os.access(package, os.R_OK):
+        print("Error: Problem reading %s" % package)
+        parser.print_usage()
+
+    key = None
+    # PKGBUILDs are cached as they are parsed instead (see Namcap.pkgbuildcache)
+    if use_cache and os.path.isfile(package) and Namcap.spool.is_tarball(package):
+        key = Namcap.resultcache.result_key(package, modules, [info_reporting])
+        messages = Namcap.resultcache.load_results(key) if key is not None else None
+        if messages is not None:
+            for name, kind, text in messages:
+                print_message(name, kind, text)
+            return
+
+    pkgtar = open_package(package) if os.path.isfile(package) else None
+    if pkgtar is not None:
+        recorded_messages = [] if key is not None else None
+        try:
+            with pkgtar:
+                if process_realpackage(package, pkgtar, modules) != 1 and key is not None:
+                    Namcap.resultcache.store_results(key, recorded_messages)
+        finally:
+            recorded_messages = None
+            Namcap.membercache.flush()
+    elif "PKGBUILD" in package:
+        process_pkgbuild(package, modules)
+    else:
+        print("Error: %s not package or PKGBUILD" % package)
+
+
+def init_worker(info, colored, tags, machine, cache, incremental, parse_pool):
+    """Sets up a batch worker process like the main one"""
+    global info_reporting, colored_output, use_cache
+    info_reporting = info
+    colored_output = colored
+    use_cache = cache
+    if cache:
+        Namcap.pkgbuildcache.enable()
+    if incremental:
+        Namcap.membercache.enable()
+    if parse_pool:
+        Namcap.parsepool.enable()
+    Namcap.tags.load_tags(filename=tags, machine=machine)
+
+
+def collect_package(package, modules):
+    """Runs namcap checks over a package in a batch worker, returning the output"""
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        process_package(package, modules)
+    return output.getvalue()
+
+
+def system_state():
+    """Returns what identifies the state of the pacman databases and of the dynamic linker cache"""
+    state = []
+    with contextlib.suppress(OSError):
+        state.append(Namcap.ownership.local_db_state())
+        state.extend(Namcap.package.sync_db_state())
+    with contextlib.suppress(OSError):
+        state.append((Namcap.ldcache.LDCACHE, os.stat(Namcap.ldcache.LDCACHE).st_mtime_ns))
+    return state
+
+
+def serve():
+    """Runs the command lines sent by namcap clients (see Namcap.daemon), keeping the databases in memory"""
+    state = system_state()
+    makepkg_conf = Namcap.pkgbuildcache.makepkg_conf_digest()
+
+    def refresh():
+        nonlocal state, makepkg_conf
+        current = system_state()
+        if current != state:
+            # packages were installed or removed since the last run
+            Namcap.package.reload_databases()
+            Namcap.util.clear_system_caches()
+            state = current
+        current = Namcap.pkgbuildcache.makepkg_conf_digest()
+        if current != makepkg_conf:
+            # the PKGBUILD worker read $CARCH when it started
+            Namcap.parsepool.disable()
+            Namcap.parsepool.enable()
+            makepkg_conf = current
+
+    # read the system once, for all the runs to come
+    Namcap.ldcache.get_ldcache()
+    Namcap.ownership.get_index()
+    Namcap.parsepool.enable()
+    path = Namcap.daemon.default_socket()
+    if path is None:
+        print("Error: set $XDG_RUNTIME_DIR or $NAMCAP_SOCKET for the socket of the server", file=sys.stderr)
+        parser.exit(1)
+    try:
+        server = Namcap.daemon.Server(path, main, refresh)
+    except OSError as e:
+        print("Error: cannot listen on %s: %s" % (path, e.strerror or e), file=sys.stderr)
+        parser.exit(1)
+    print("Listening on %s" % path, file=sys.stderr)
+    Namcap.daemon.serve(server)
+
+
 # Let's handle those options!
 version = Namcap.version.get_version()
 
@@ -145,6 +276,32 @@ parser.add_argument(
     "-m", "--machine-readable", action="store_true", help="Makes the output parseable (machine-readable)"
 )
 parser.add_argument("-t", "--tags", action="store", help="Use a custom tag file")
+parser.add_argument(
+    "-c",
+    "--cache",
+    action="store_true",
+    help="Reuse the results of previous runs on identical package files, and the parsing of identical PKGBUILDs",
+)
+parser.add_argument(
+    "-I",
+    "--incremental",
+    action="store_true",
+    help="Reuse what was read from identical files of previously checked packages",
+)
+parser.add_argument(
+    "--serve",
+    action="store_true",
+    help="Run the command lines of namcap clients, on the socket in $NAMCAP_SOCKET or $XDG_RUNTIME_DIR/namcap.sock",
+)
+parser.add_argument(
+    "-j",
+    "--jobs",
+    action="store",
+    type=int,
+    default=1,
+    metavar="N",
+    help="Check N packages or PKGBUILDs, or run N rules, at a time",
+)
 parser.add_argument("packages", nargs="*")
 pargroup = parser.add_mutually_exclusive_group()
 pargroup.add_argument(
@@ -162,58 +319,108 @@ pargroup.add_argument(
     help="Only apply RULELIST rules to the package (comma-separated)",
 )
 parser.add_argument("-v", "--version", action="version", version=version)
-args = parser.parse_args()
-
-if args.list:
-    print("-" * 20 + " Namcap rule list " + "-" * 20)
-    print(modules)
-    for j in sorted(modules):
-        print("%-20s: %s" % (j, modules[j].description))
-    parser.exit(0)
-
-if len(args.packages) == 0:
-    print("Missing required argument packages", file=sys.stderr)
-    parser.exit(2)
-
-info_reporting = args.info
-machine_readable = args.machine_readable
-filename = args.tags
-packages = args.packages
-
-active_modules = {}
-
-if args.rules:
-    for rule in args.rules.split(","):
-        if rule in modules:
-            active_modules[rule] = modules[rule]
-        else:
-            print(f"Error: Rule '{rule}' does not exist")
-            parser.exit(2)
 
-if args.exclude:
-    for rule in args.exclude.split(","):
-        active_modules.update(modules)
-        if rule in modules:
-            active_modules.pop(rule)
-        else:
-            print(f"Error: Rule '{rule}' does not exist")
-            parser.exit(2)
+info_reporting = False
+colored_output = False
+# jobs available to the rules of a single package
+rule_jobs = 1
+use_cache = False
+# the messages printed for the package being checked, to store in the result cache
+recorded_messages = None
 
-Namcap.tags.load_tags(filename=filename, machine=machine_readable)
 
-# No rules selected?  Then use default selection
-if len(active_modules) == 0:
-    active_modules = get_enabled_modules()
+def main(argv=None):
+    global info_reporting, colored_output, rule_jobs, use_cache
 
-# Go through each package, get the info, and apply the rules
-for package in packages:
-    if not os.access(package, os.R_OK):
-        print("Error: Problem reading %s" % package)
-        parser.print_usage()
+    modules = get_modules()
+    args = parser.parse_args(argv)
+    rule_jobs = 1
 
-    if os.path.isfile(package) and tarfile.is_tarfile(package):
-        process_realpackage(package, active_modules)
-    elif "PKGBUILD" in package:
-        process_pkgbuild(package, active_modules)
+    if args.list:
+        print("-" * 20 + " Namcap rule list " + "-" * 20)
+        print(modules)
+        for j in sorted(modules):
+            print("%-20s: %s" % (j, Namcap.rules.registry[j].description))
+        parser.exit(0)
+
+    if args.serve:
+        if args.packages:
+            print("Error: --serve does not take packages", file=sys.stderr)
+            parser.exit(2)
+        serve()
+        return
+
+    if len(args.packages) == 0:
+        print("Missing required argument packages", file=sys.stderr)
+        parser.exit(2)
+
+    if args.jobs < 1:
+        print("Error: The number of jobs must be at least 1", file=sys.stderr)
+        parser.exit(2)
+
+    info_reporting = args.info
+    use_cache = args.cache
+    colored_output = sys.stdout.isatty()
+    machine_readable = args.machine_readable
+    filename = args.tags
+    packages = args.packages
+
+    active_modules = {}
+
+    if args.rules:
+        for rule in args.rules.split(","):
+            if rule in modules:
+                active_modules[rule] = Namcap.rules.registry[rule]
+            else:
+                print(f"Error: Rule '{rule}' does not exist")
+                parser.exit(2)
+
+    if args.exclude:
+        for rule in args.exclude.split(","):
+            active_modules.update(Namcap.rules.registry)
+            if rule in modules:
+                active_modules.pop(rule)
+            else:
+                print(f"Error: Rule '{rule}' does not exist")
+                parser.exit(2)
+
+    Namcap.tags.load_tags(filename=filename, machine=machine_readable)
+    if use_cache:
+        Namcap.pkgbuildcache.enable()
     else:
-        print("Error: %s not package or PKGBUILD" % package)
+        Namcap.pkgbuildcache.disable()
+    if args.incremental:
+        Namcap.membercache.enable()
+    else:
+        # left enabled by a previous run of namcap --serve
+        Namcap.membercache.disable()
+    # several PKGBUILDs are worth a long-lived worker to source them
+    parse_pool = sum("PKGBUILD" in package for package in packages) > 1
+    if parse_pool:
+        Namcap.parsepool.enable()
+
+    # No rules selected?  Then use default selection
+    if len(active_modules) == 0:
+        active_modules = get_enabled_modules()
+
+    # Go through each package, get the info, and apply the rules
+    if args.jobs == 1 or len(packages) == 1:
+        # a single package gets the jobs for its rules instead
+        rule_jobs = args.jobs
+        for package in packages:
+            process_package(package, active_modules)
+        return
+
+    # Spread the packages over worker processes, printing the results in order
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=args.jobs,
+        initializer=init_worker,
+        initargs=(info_reporting, colored_output, filename, machine_readable, use_cache, args.incremental, parse_pool),
+    ) as executor:
+        for output in executor.map(collect_package, packages, itertools.repeat(active_modules)):
+            sys.stdout.write(output)
+            sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -17,7 +17,7 @@ setup(
     url="http://www.archlinux.org/",
     py_modules=["namcap"],
     packages=find_packages(),
-    scripts=["scripts/namcap", "scripts/parsepkgbuild"],
+    scripts=["scripts/namcap", "scripts/namcap-client", "scripts/parsepkgbuild"],
     test_suite="Namcap.tests",
     data_files=DATAFILES,
     install_requires=["pyalpm", "pyelftools", "license-expression"],